@@ -1,7 +1,6 @@
 import os
 from channels.routing import ProtocolTypeRouter, URLRouter
 from django.core.asgi import get_asgi_application
-from channels.auth import AuthMiddlewareStack
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "PingMe.settings")
 
@@ -10,10 +9,11 @@ django_asgi_app = get_asgi_application()
 
 # Now safe to import routing
 import core.routing
+from core.middleware import SessionAuthMiddleware
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
-    "websocket": AuthMiddlewareStack(
+    "websocket": SessionAuthMiddleware(
         URLRouter(
             core.routing.websocket_urlpatterns
         )
@@ -60,6 +60,88 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Chat message persistence
+# With write-behind on, messages are broadcast first and saved in batches
+PINGME_WRITE_BEHIND = os.environ.get("PINGME_WRITE_BEHIND", "0") == "1"
+PINGME_WRITE_BEHIND_BATCH_SIZE = 200
+PINGME_WRITE_BEHIND_FLUSH_INTERVAL = 0.05  # seconds
+PINGME_WRITE_BEHIND_MAX_PENDING = 10000  # hard cap; sends past it get an "overloaded" error
+# Write-behind messages take sequence numbers from blocks this size
+PINGME_SEQ_BLOCK_SIZE = 100
+
+# WebSocket handshake auth: session key -> user cache
+PINGME_SESSION_CACHE_SIZE = 10000
+PINGME_SESSION_CACHE_TTL = 60  # seconds
+
+# User -> room ids index behind every membership check (core.access)
+PINGME_MEMBERSHIP_CACHE_SIZE = 10000
+
+# Outbound frame coalescing: broadcasts arriving within the window are
+# sent to each client as one array frame. 0 disables it.
+PINGME_COALESCE_WINDOW_MS = int(os.environ.get("PINGME_COALESCE_WINDOW_MS", 0))
+PINGME_COALESCE_MAX_BATCH = 32
+
+# Per-connection outbound queue: drop oldest when full, then close the
+# socket with a resync code once too many frames were dropped
+PINGME_OUTBOX_MAX_FRAMES = 256
+PINGME_OUTBOX_DROP_LIMIT = 512
+PINGME_OUTBOX_DELAY_WARN_MS = 1000
+
+# Presence: at most one presence broadcast per room per interval
+PINGME_PRESENCE_INTERVAL_MS = 1000
+PINGME_PRESENCE_TTL = 60  # seconds without a heartbeat before "offline"
+PINGME_TYPING_TTL = 5  # seconds
+
+# Chat send limits (token buckets, per process)
+PINGME_RATE_USER_BURST = 20
+PINGME_RATE_USER_PER_SEC = 5
+PINGME_RATE_ROOM_BURST = 200
+PINGME_RATE_ROOM_PER_SEC = 50
+# History frames (each reads up to a page) and heartbeat/typing/read frames
+PINGME_RATE_HISTORY_BURST = 10
+PINGME_RATE_HISTORY_PER_SEC = 2
+PINGME_RATE_CONTROL_BURST = 30
+PINGME_RATE_CONTROL_PER_SEC = 10
+
+# Message history pages (HTTP and WebSocket)
+PINGME_PAGE_SIZE_DEFAULT = 50
+PINGME_PAGE_SIZE_MAX = 200
+
+# Recent-history ring buffer: newest N messages per active room, LRU
+PINGME_RECENT_BUFFER_SIZE = 200
+PINGME_RECENT_BUFFER_ROOMS = 1000
+
+# Reconnects replay up to this many missed messages, else resync
+PINGME_RESUME_MAX_MESSAGES = 200
+
+# "read" frames are debounced per socket before the marker is written
+PINGME_READ_DEBOUNCE_MS = 1000
+
+# Most emails / user ids accepted by one bulk membership request
+PINGME_BULK_MEMBERS_MAX = 1000
+
+# Membership audit log (RoomMembersLog): events are queued and written in
+# batches by a background thread. With a spill path set, batches that hit
+# a locked/unavailable DB are appended there for `manage.py replay_audit`.
+PINGME_AUDIT_BUFFERED = os.environ.get("PINGME_AUDIT_BUFFERED", "1") == "1"
+PINGME_AUDIT_BATCH_SIZE = 500
+PINGME_AUDIT_FLUSH_INTERVAL = 1.0  # seconds
+PINGME_AUDIT_MAX_PENDING = 50000
+PINGME_AUDIT_SPILL_PATH = os.environ.get("PINGME_AUDIT_SPILL_PATH") or None
+
+# archive_messages moves messages older than this into compressed blocks
+PINGME_ARCHIVE_AFTER_DAYS = 90
+
+# purge_data retention policies (days; None keeps forever). Rooms can
+# override the message policy with Room.message_retention_days.
+PINGME_RETENTION_MESSAGE_DAYS = None
+PINGME_RETENTION_MEMBER_LOG_DAYS = 365
+PINGME_RETENTION_BATCH_SIZE = 1000
+PINGME_RETENTION_PAUSE_MS = 50
+
+# Message search backend; None picks SQLite FTS5 / Postgres / LIKE
+PINGME_SEARCH_BACKEND = None
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -100,6 +182,35 @@ DATABASES = {
     }
 }
 
+# PINGME_DB_PROFILE=production: SQLite tuned for many concurrent
+# consumers. WAL lets readers run alongside the writer, IMMEDIATE
+# transactions take the write lock up front so busy_timeout can queue
+# writers instead of failing with "database is locked", and
+# connections are kept open between requests.
+PINGME_DB_PROFILE = os.environ.get("PINGME_DB_PROFILE", "default")
+
+if PINGME_DB_PROFILE == "production":
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode = WAL;'
+                'PRAGMA synchronous = NORMAL;'
+                'PRAGMA busy_timeout = 20000;'
+                'PRAGMA mmap_size = 268435456;'
+                'PRAGMA cache_size = -65536;'
+                'PRAGMA temp_store = MEMORY;'
+            ),
+        },
+    })
+
+# Consumer writes on one writer thread, reads on a small pool (core.db)
+PINGME_DB_LANES = PINGME_DB_PROFILE == "production"
+PINGME_DB_READERS = 4
+
 
 
 # Password validation
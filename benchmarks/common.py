@@ -0,0 +1,55 @@
+"""
+Shared setup for the benchmark scripts.
+
+Run them from the project root, e.g. ``python -m benchmarks.session_auth``.
+Every script works on a throwaway test database, never on db.sqlite3.
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def setup_django(keepdb=False, db_file=None):
+    """
+    Boots Django against a fresh test database and returns it.
+    ``db_file`` puts the SQLite test DB on disk instead of in memory.
+    """
+    sys.path.insert(0, str(ROOT))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "PingMe.settings")
+    os.environ.setdefault("SECRET_KEY", "benchmark-only")
+
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    if db_file is not None:
+        connection.settings_dict["TEST"]["NAME"] = str(db_file)
+    connection.creation.create_test_db(verbosity=0, keepdb=keepdb)
+    return connection
+
+
+def make_user(email="bench@example.com", name="bench"):
+    from core.models import User
+    return User.objects.create_user(email=email, name=name, password="bench-pass")
+
+
+class Timer:
+    """Context manager recording elapsed wall time in ``seconds``."""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+
+
+def report(label, count, seconds, unit="ops"):
+    rate = count / seconds if seconds else float("inf")
+    print(f"{label:<40} {count:>9} {unit:<6} {seconds:8.3f}s  {rate:12.1f} {unit}/s")
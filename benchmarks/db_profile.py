@@ -0,0 +1,152 @@
+"""
+Mixed read/write chat load against an on-disk SQLite database, once per
+PINGME_DB_PROFILE. Async "consumers" go through core.db's read/write
+lanes; a few plain threads play sync HTTP views writing at the same
+time. Reports throughput, latency per kind ("http" = the sync view
+writes) and "database is locked" errors.
+
+Each profile runs in its own interpreter because settings are read at
+startup: ``python -m benchmarks.db_profile [--profiles default production]``.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from benchmarks.common import ROOT, setup_django
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+def run_profile(args):
+    db_file = Path(tempfile.mkdtemp()) / "bench.sqlite3"
+    setup_django(db_file=db_file)
+
+    from django.db import OperationalError, close_old_connections, connection, transaction
+    from core.db import db_read, db_write
+    from core.history import message_rows
+    from core.models import Message, Room, RoomMember, User
+
+    users = User.objects.bulk_create(
+        [User(email=f"u{i}@example.com", name=f"user{i}", password="!") for i in range(args.users)]
+    )
+    rooms = [Room.objects.create(name=f"room{i}", owner=users[0]) for i in range(args.rooms)]
+    RoomMember.objects.bulk_create(
+        [RoomMember(room=room, user=user) for room in rooms for user in users]
+    )
+    Message.objects.bulk_create([
+        Message(room=room, user=random.choice(users), content=f"seed {i}")
+        for room in rooms for i in range(args.seed)
+    ])
+    connection.close()
+
+    stats = {"read": [], "write": [], "http": [], "locked": 0}
+    stats_lock = threading.Lock()
+    deadline = time.monotonic() + args.seconds
+
+    def read(room_id, user_id):
+        RoomMember.objects.filter(room_id=room_id, user_id=user_id).exists()
+        return list(message_rows(room_id).order_by("-created", "-id")[:50])
+
+    def write(room_id, user):
+        # Same shape as ChatConsumer.save_message
+        with transaction.atomic():
+            Message.objects.create(room_id=room_id, user=user, content="hello there")
+
+    def record(kind, seconds):
+        with stats_lock:
+            stats[kind].append(seconds * 1000)
+
+    def pick():
+        return random.choice(rooms).id, random.choice(users)
+
+    async def consumer():
+        while time.monotonic() < deadline:
+            room_id, user = pick()
+            kind = "write" if random.random() < args.write_ratio else "read"
+            start = time.perf_counter()
+            try:
+                if kind == "write":
+                    await db_write(write)(room_id, user)
+                else:
+                    await db_read(read)(room_id, user.id)
+            except OperationalError:
+                with stats_lock:
+                    stats["locked"] += 1
+                continue
+            record(kind, time.perf_counter() - start)
+
+    def http_view():
+        # Sync views: own thread, connection handled per request
+        while time.monotonic() < deadline:
+            room_id, user = pick()
+            start = time.perf_counter()
+            try:
+                write(room_id, user)
+            except OperationalError:
+                with stats_lock:
+                    stats["locked"] += 1
+            else:
+                record("http", time.perf_counter() - start)
+            finally:
+                close_old_connections()
+            time.sleep(0.01)
+
+    async def main():
+        threads = [threading.Thread(target=http_view) for _ in range(args.http_threads)]
+        for t in threads:
+            t.start()
+        await asyncio.gather(*(consumer() for _ in range(args.consumers)))
+        for t in threads:
+            t.join()
+
+    asyncio.run(main())
+
+    total = sum(len(stats[kind]) for kind in ("read", "write", "http"))
+    print(f"{os.environ['PINGME_DB_PROFILE']}: {total / args.seconds:.1f} ops/s,"
+          f" {stats['locked']} 'database is locked' errors")
+    for kind in ("read", "write", "http"):
+        timings = stats[kind]
+        print(f"  {kind:<6} {len(timings):7d} ops   p50 {statistics.median(timings or [0]):8.2f} ms"
+              f"   p99 {percentile(timings, 0.99):8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--profiles", nargs="+", default=["default", "production"])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--consumers", type=int, default=64)
+    parser.add_argument("--http-threads", type=int, default=4)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=2000, help="messages per room")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_profile(args)
+        return
+
+    for profile in args.profiles:
+        env = dict(os.environ, PINGME_DB_PROFILE=profile)
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.db_profile", "--child", *sys.argv[1:]],
+            cwd=ROOT, env=env, check=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+NDJSON export throughput over a large seeded room, plain and gzip'd,
+with peak RSS to show memory stays flat as the room grows.
+"""
+import argparse
+import resource
+
+from benchmarks.common import Timer, make_user, report, setup_django
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.utils import timezone
+    from core.export import batched, gzip_stream, iter_room_ndjson
+    from core.models import Message, Room
+
+    user = make_user()
+    room = Room.objects.create(name="export-bench", owner=user)
+    now = timezone.now()
+    with Timer() as t:
+        batch = []
+        for i in range(args.messages):
+            batch.append(Message(room=room, user=user, content=f"message {i}", created=now))
+            if len(batch) == 10000:
+                Message.objects.bulk_create(batch)
+                batch = []
+        Message.objects.bulk_create(batch)
+    report("seed", args.messages, t.seconds, "msgs")
+    print(f"peak RSS after seeding: {peak_rss_mb():.0f} MB")
+
+    for label, gz in (("ndjson", False), ("ndjson.gz", True)):
+        chunks = batched(iter_room_ndjson(room.id, chunk_size=args.chunk_size))
+        if gz:
+            chunks = gzip_stream(chunks)
+        total = 0
+        with Timer() as t:
+            for chunk in chunks:
+                total += len(chunk)
+        report(f"export {label}", args.messages, t.seconds, "msgs")
+        print(f"  {total / 1e6:.1f} MB written, peak RSS {peak_rss_mb():.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
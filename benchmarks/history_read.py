@@ -0,0 +1,64 @@
+"""
+Room history read path: the old ORM loop (one user query per message)
+vs. the values()-based path in core.history, for several page sizes.
+Reports query count and latency, and the JSON encoder in use.
+"""
+import argparse
+import random
+
+from benchmarks.common import Timer, make_user, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.db import connection, reset_queries
+    from django.test.utils import CaptureQueriesContext
+    from core.history import history_page, serialize_message
+    from core.models import Message, Room
+    from core.renderers import dumps, stdlib_dumps
+
+    users = [make_user(f"u{i}@example.com", f"user{i}") for i in range(args.users)]
+    room = Room.objects.create(name="bench", owner=users[0])
+    Message.objects.bulk_create(
+        [Message(room=room, user=random.choice(users), content=f"message {i}")
+         for i in range(args.messages)],
+        batch_size=1000,
+    )
+
+    def old_path(limit):
+        messages = Message.objects.filter(room=room).order_by("-created")[:limit]
+        data = [{
+            "id": str(m.id),
+            "user": m.user.name,
+            "content": m.content,
+            "created": m.created.isoformat(),
+        } for m in reversed(messages)]
+        return stdlib_dumps(data)
+
+    def new_path(limit):
+        page = history_page(room.id, limit=limit)
+        return dumps(page.as_dict(serialize_message))
+
+    print(f"encoder: {dumps.__name__}")
+    print(f"{'page':>6} {'path':<5} {'queries':>8} {'ms/page':>10}")
+    for limit in (50, 500, 5000):
+        for label, fn in (("old", old_path), ("new", new_path)):
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                fn(limit)
+            with Timer() as t:
+                for _ in range(args.repeat):
+                    fn(limit)
+            ms = 1000 * t.seconds / args.repeat
+            print(f"{limit:>6} {label:<5} {len(queries.captured_queries):>8} {ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Search latency: FTS5 (bm25-ranked) vs. the LIKE scan the admin used,
+over a seeded message table (a few million rows by default).
+"""
+import argparse
+import random
+import statistics
+
+from benchmarks.common import Timer, make_user, report, setup_django
+
+WORDS = (
+    "alpha bravo charlie delta echo foxtrot golf hotel india juliet kilo lima "
+    "mike november oscar papa quebec romeo sierra tango uniform victor whiskey "
+    "xray yankee zulu deploy review lunch meeting standup release hotfix build"
+).split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=3_000_000)
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from core.models import Message, Room
+    from core.search import LikeBackend, SQLiteFTS5Backend
+
+    rng = random.Random(42)
+    user = make_user()
+    rooms = [Room.objects.create(name=f"room{i}", owner=user) for i in range(args.rooms)]
+    # A rare word so some queries have few hits and some have many
+    vocab = WORDS + [f"rare{i}" for i in range(1000)]
+
+    with Timer() as t:
+        batch = []
+        for i in range(args.messages):
+            text = " ".join(rng.choice(vocab) for _ in range(8))
+            batch.append(Message(room=rng.choice(rooms), user=user, content=text))
+            if len(batch) == 10000:
+                Message.objects.bulk_create(batch)
+                batch = []
+        Message.objects.bulk_create(batch)
+    report("seed (with FTS triggers)", args.messages, t.seconds, "msgs")
+
+    room_ids = [r.id for r in rooms]
+    queries = [rng.choice(vocab) for _ in range(args.queries)]
+    for label, backend in (("fts5", SQLiteFTS5Backend()), ("like", LikeBackend())):
+        for scope, ids in (("all rooms", room_ids), ("one room", room_ids[:1])):
+            timings = []
+            for q in queries:
+                with Timer() as t:
+                    backend.search(q, ids, limit=20)
+                timings.append(t.seconds * 1000)
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            print(f"{label:<5} {scope:<10} median {statistics.median(timings):8.2f} ms"
+                  f"   p95 {p95:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+WebSocket handshakes per second: stock AuthMiddlewareStack (before)
+vs. SessionAuthMiddleware with a cold and a warm cache (after).
+"""
+import argparse
+import asyncio
+
+from benchmarks.common import Timer, report, setup_django
+
+
+async def accept_app(scope, receive, send):
+    await receive()
+    await send({"type": "websocket.accept"})
+    await receive()
+
+
+async def handshake_storm(app, cookie, total, concurrency):
+    from channels.testing import WebsocketCommunicator
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            comm = WebsocketCommunicator(app, "/ws/", headers=[(b"cookie", cookie)])
+            connected, _ = await comm.connect()
+            assert connected
+            await comm.disconnect()
+
+    await asyncio.gather(*(one() for _ in range(total)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--handshakes", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--sessions", type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+
+    from django.conf import settings
+    from django.contrib.auth import HASH_SESSION_KEY, SESSION_KEY, BACKEND_SESSION_KEY
+    from django.contrib.sessions.backends.db import SessionStore
+    from channels.auth import AuthMiddlewareStack
+    from core.middleware import SessionAuthMiddleware, SessionUserCache
+    from benchmarks.common import make_user
+
+    user = make_user()
+    keys = []
+    for _ in range(args.sessions):
+        store = SessionStore()
+        store[SESSION_KEY] = str(user.pk)
+        store[BACKEND_SESSION_KEY] = "django.contrib.auth.backends.ModelBackend"
+        store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        store.create()
+        keys.append(store.session_key)
+
+    def cookie_for(i):
+        return f"{settings.SESSION_COOKIE_NAME}={keys[i % len(keys)]}".encode()
+
+    async def run(label, app):
+        per_session = args.handshakes // len(keys)
+        with Timer() as t:
+            await asyncio.gather(*(
+                handshake_storm(app, cookie_for(i), per_session, max(1, args.concurrency // len(keys)))
+                for i in range(len(keys))
+            ))
+        report(label, per_session * len(keys), t.seconds, "hs")
+
+    async def all_runs():
+        await run("before: AuthMiddlewareStack", AuthMiddlewareStack(accept_app))
+        cache = SessionUserCache(ttl=0)
+        await run("after: SessionAuthMiddleware (ttl=0)", SessionAuthMiddleware(accept_app, cache=cache))
+        cache = SessionUserCache()
+        await run("after: SessionAuthMiddleware (cached)", SessionAuthMiddleware(accept_app, cache=cache))
+        print(f"cache hits={cache.hits} misses={cache.misses}")
+
+    asyncio.run(all_runs())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+JSON vs. msgpack for the chat wire frames: payload size and
+encode/decode throughput for single messages and history pages.
+"""
+import argparse
+import json
+import uuid
+from datetime import datetime, timezone
+
+import msgpack
+
+from benchmarks.common import Timer, report
+from core.wire import encode_json, encode_msgpack
+
+
+def sample_frame(i):
+    return {
+        "type": "message",
+        "id": str(uuid.uuid4()),
+        "user": f"user{i % 50}",
+        "user_id": str(uuid.uuid4()),
+        "content": "hello there, this is chat message number %d" % i,
+        "created": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=50000)
+    args = parser.parse_args()
+
+    cases = {
+        "message": sample_frame(1),
+        "history(50)": {"type": "history", "messages": [sample_frame(i) for i in range(50)]},
+    }
+
+    for name, payload in cases.items():
+        as_json = encode_json(payload).encode()
+        as_msgpack = encode_msgpack(payload)
+        print(f"\n{name}: json={len(as_json)} B  msgpack={len(as_msgpack)} B  "
+              f"({100 * len(as_msgpack) / len(as_json):.0f}%)")
+
+        n = args.iterations if name == "message" else args.iterations // 50
+        with Timer() as t:
+            for _ in range(n):
+                encode_json(payload)
+        report("  json encode", n, t.seconds)
+        with Timer() as t:
+            for _ in range(n):
+                json.loads(as_json)
+        report("  json decode", n, t.seconds)
+        with Timer() as t:
+            for _ in range(n):
+                encode_msgpack(payload)
+        report("  msgpack encode", n, t.seconds)
+        with Timer() as t:
+            for _ in range(n):
+                msgpack.unpackb(as_msgpack, raw=False)
+        report("  msgpack decode", n, t.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+
+from core import metrics
+from core.models import Room, RoomMember
+from core.renderers import json_response
+from core.versions import VersionCounters
+
+
+# ---------------------------------------------------------------------
+# MEMBERSHIP INDEX (per process)
+# ---------------------------------------------------------------------
+
+class MembershipIndex:
+    """
+    Bounded LRU of user id → frozenset of room ids, shared by the HTTP
+    views and the WebSocket consumer. Entries are dropped by
+    ``invalidate`` (RoomMember signals, bulk membership changes). A
+    load records the user's version first and is only stored if no
+    invalidation landed while it ran, so a kick never gets overwritten
+    by an older read. Keys are strings.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._versions = VersionCounters()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Cached room ids for a user, or None (never touches the DB)."""
+        rooms = self._entries.get(user_id)
+        if rooms is not None:
+            try:
+                self._entries.move_to_end(user_id)
+            except KeyError:
+                pass  # evicted or invalidated meanwhile
+        return rooms
+
+    def cached(self, user_id, room_id):
+        """True/False from the cache, None if the user is not loaded."""
+        rooms = self.get(user_id)
+        if rooms is None:
+            return None
+        return room_id in rooms
+
+    def rooms_for(self, user_id):
+        user_id = str(user_id)
+        rooms = self.get(user_id)
+        if rooms is not None:
+            metrics.incr("membership_index.hit")
+            return rooms
+
+        metrics.incr("membership_index.miss")
+        version = self._versions.get(user_id)
+        rooms = frozenset(
+            str(room_id)
+            for room_id in RoomMember.objects.filter(user_id=user_id).values_list("room_id", flat=True)
+        )
+        self._store(user_id, rooms, version)
+        return rooms
+
+    def is_member(self, user_id, room_id):
+        return str(room_id) in self.rooms_for(user_id)
+
+    def invalidate(self, user_id):
+        user_id = str(user_id)
+        with self._lock:
+            self._versions.bump(user_id)
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _store(self, user_id, rooms, version):
+        with self._lock:
+            if self._versions.get(user_id) != version:
+                return
+            self._entries[user_id] = rooms
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+membership_index = MembershipIndex(
+    max_size=getattr(settings, "PINGME_MEMBERSHIP_CACHE_SIZE", 10000),
+)
+
+
+# ---------------------------------------------------------------------
+# VIEW DECORATOR
+# ---------------------------------------------------------------------
+
+def room_member_required(view):
+    """
+    403 unless ``request.user`` is in ``room_id`` (404 if there is no
+    such room). Goes above ``condition`` so ETags are not served to
+    non-members either.
+    """
+    @wraps(view)
+    def wrapper(request, room_id, *args, **kwargs):
+        if not membership_index.is_member(request.user.id, room_id):
+            if not Room.objects.filter(id=room_id).exists():
+                return json_response({"error": "Room not found"}, status=404)
+            return json_response({"error": "Not in room"}, status=403)
+        return view(request, room_id, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,51 @@
+from django.db.models import OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Substr
+
+from core.models import Message, Room
+
+PREVIEW_CHARS = Room._meta.get_field("last_message_preview").max_length
+
+
+# ---------------------------------------------------------------------
+# ROOM ACTIVITY SNAPSHOT (Room.last_message_*)
+# ---------------------------------------------------------------------
+
+def record_room_activity(room_id, messages):
+    """
+    Points the room's snapshot at the newest of freshly inserted
+    ``messages``. Guarded on the timestamp, so a late write-behind batch
+    never replaces a newer snapshot.
+    """
+    if not messages:
+        return
+    newest = max(messages, key=lambda m: (m.created, m.id))
+    Room.objects.filter(id=room_id).filter(
+        Q(last_message_at__isnull=True) | Q(last_message_at__lte=newest.created)
+    ).update(
+        last_message_at=newest.created,
+        last_message_id=newest.id,
+        last_message_user=newest.user.name if newest.user_id else "",
+        last_message_preview=newest.content[:PREVIEW_CHARS],
+    )
+
+
+def refresh_room_activity(rooms=None):
+    """
+    Rebuilds snapshots from core_message (after deletes, or as a
+    backfill). ``rooms`` is a Room queryset; defaults to every room.
+    """
+    latest = Message.objects.filter(room_id=OuterRef("pk")).order_by("-created", "-id")
+    if rooms is None:
+        rooms = Room.objects.all()
+    return rooms.update(
+        last_message_at=Subquery(latest.values("created")[:1]),
+        last_message_id=Subquery(latest.values("id")[:1]),
+        # Empty rooms and deleted senders come back NULL
+        last_message_user=Coalesce(Subquery(latest.values("user__name")[:1]), Value("")),
+        last_message_preview=Coalesce(
+            Subquery(latest.annotate(
+                preview=Substr("content", 1, PREVIEW_CHARS)
+            ).values("preview")[:1]),
+            Value(""),
+        ),
+    )
@@ -3,7 +3,7 @@ from django.contrib import admin
 # Register your models here.
 
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Room, Message, RoomMember, RoomMembersLog
+from .models import User, Room, Message, RoomMember, RoomMembersLog, MessageArchiveBlock
 
 
 # ---------------------------------------------------------------------
@@ -84,3 +84,17 @@ class RoomMembersLogAdmin(admin.ModelAdmin):
     readonly_fields = ("created",)
     ordering = ("-created",)
 
+
+
+# ---------------------------------------------------------------------
+# 6️⃣ MESSAGE ARCHIVE ADMIN
+# ---------------------------------------------------------------------
+
+@admin.register(MessageArchiveBlock)
+class MessageArchiveBlockAdmin(admin.ModelAdmin):
+    list_display = ("room", "day", "message_count", "first_created", "last_created", "updated")
+    list_filter = ("room",)
+    ordering = ("-day",)
+    # Blocks are written by archive_messages only
+    readonly_fields = ("room", "day", "first_created", "last_created", "message_count", "updated")
+    exclude = ("payload",)
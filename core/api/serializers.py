@@ -1,3 +1,5 @@
+# Kept for admin/tooling use; the hot API read paths skip DRF and
+# go through core.history + core.renderers instead.
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 from core.models import Room, Message, RoomMember
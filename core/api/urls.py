@@ -8,9 +8,15 @@ from .views import (
     get_room_members,
     add_user,
     kick_user,
+    bulk_add_users,
+    bulk_remove_users,
     leave_room,
     make_admin,
     create_room,
+    metrics_view,
+    export_room,
+    search_messages,
+    search_room,
 )
 
 urlpatterns = [
@@ -24,10 +30,20 @@ urlpatterns = [
     path("rooms/create/", create_room, name="create_room"),
     path("rooms/<uuid:room_id>/messages/", room_messages, name="room_messages"),
     path("rooms/<uuid:room_id>/members/", get_room_members, name="get_room_members"),
+    path("rooms/<uuid:room_id>/export/", export_room, name="export_room"),
+    path("rooms/<uuid:room_id>/search/", search_room, name="search_room"),
+
+    # Search
+    path("search/", search_messages, name="search_messages"),
 
     # Room Actions
     path("rooms/<uuid:room_id>/add/", add_user, name="add_user"),
     path("rooms/<uuid:room_id>/kick/", kick_user, name="kick_user"),
+    path("rooms/<uuid:room_id>/members/bulk-add/", bulk_add_users, name="bulk_add_users"),
+    path("rooms/<uuid:room_id>/members/bulk-remove/", bulk_remove_users, name="bulk_remove_users"),
     path("rooms/<uuid:room_id>/leave/", leave_room, name="leave_room"),
     path("rooms/<uuid:room_id>/make-admin/", make_admin, name="make_admin"),
+
+    # Ops
+    path("metrics/", metrics_view, name="metrics"),
 ]
@@ -1,10 +1,26 @@
-from django.http import JsonResponse
 from django.contrib.auth import authenticate, login, logout
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_protect
-from django.views.decorators.http import require_POST, require_GET
+from django.views.decorators.http import condition, require_POST, require_GET
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from core.models import Room, RoomMember, Message, User
+from django.db.models import F
+from core import metrics
+from core.access import membership_index, room_member_required
+from core.audit import audit_log
+from core.events import notify_members_changed
+from core.export import aiter_sync, batched, gzip_stream, iter_room_ndjson
+from core.history import history_page, member_rows, seq_page, serialize_message
+from core.membership import bulk_add_members, bulk_remove_members
+from core.presence import presence
+from core.renderers import json_response
+from core.search import get_search_backend
+from core.models import Room, RoomMember, User
+from core.pagination import InvalidCursor, page_size
+from core.versions import room_messages_etag, user_rooms_etag
 import json
+import uuid
 
 
 # -------------------------------------------------------------------
@@ -13,7 +29,7 @@ import json
 @ensure_csrf_cookie
 def get_csrf(request):
     """Sets CSRF cookie for frontend apps."""
-    return JsonResponse({"detail": "CSRF cookie set"})
+    return json_response({"detail": "CSRF cookie set"})
 
 
 # -------------------------------------------------------------------
@@ -29,17 +45,17 @@ def login_view(request):
 
     user = authenticate(request, email=email, password=password)
     if user is None:
-        return JsonResponse({"detail": "Invalid credentials"}, status=400)
+        return json_response({"detail": "Invalid credentials"}, status=400)
 
     login(request, user)
-    return JsonResponse({"detail": "Login successful"})
+    return json_response({"detail": "Login successful"})
 
 
 @require_POST
 def logout_view(request):
     """Logs out user."""
     logout(request)
-    return JsonResponse({"detail": "Logged out"})
+    return json_response({"detail": "Logged out"})
 
 
 # -------------------------------------------------------------------
@@ -47,11 +63,37 @@ def logout_view(request):
 # -------------------------------------------------------------------
 @login_required
 @require_GET
+@condition(etag_func=user_rooms_etag)
 def list_rooms(request):
-    """Returns all rooms the user is a member of."""
-    rooms = RoomMember.objects.filter(user=request.user).select_related("room")
-    data = [{"id": str(r.room.id), "name": r.room.name} for r in rooms]
-    return JsonResponse({"rooms": data})
+    """
+    Returns all rooms the user is a member of, most recently active
+    first, with unread counts and a preview of the last message.
+    """
+    rooms = (
+        RoomMember.objects.filter(user=request.user)
+        .order_by(F("room__last_message_at").desc(nulls_last=True), "-room__created")
+        .values(
+            "room_id", "room__name", "unread_count", "last_read_id",
+            "room__last_message_at", "room__last_message_id",
+            "room__last_message_user", "room__last_message_preview",
+        )
+    )
+    data = [
+        {
+            "id": str(r["room_id"]),
+            "name": r["room__name"],
+            "unread": r["unread_count"],
+            "last_read": str(r["last_read_id"]) if r["last_read_id"] else None,
+            "last_message": {
+                "id": str(r["room__last_message_id"]),
+                "user": r["room__last_message_user"],
+                "preview": r["room__last_message_preview"],
+                "created": r["room__last_message_at"].isoformat(),
+            } if r["room__last_message_at"] else None,
+        }
+        for r in rooms
+    ]
+    return json_response({"rooms": data})
 
 
 @login_required
@@ -62,66 +104,138 @@ def create_room(request):
     name = data.get("name")
 
     if not name:
-        return JsonResponse({"error": "Room name required"}, status=400)
+        return json_response({"error": "Room name required"}, status=400)
 
     room = Room.objects.create(name=name, owner=request.user)
     RoomMember.objects.create(room=room, user=request.user, is_admin=True)
-    return JsonResponse({"id": str(room.id), "name": room.name})
+    audit_log.record(room.id, request.user.id, "join", actor_id=request.user.id)
+    return json_response({"id": str(room.id), "name": room.name})
 
 
 @login_required
 @require_GET
+@room_member_required
+@condition(etag_func=room_messages_etag)
 def room_messages(request, room_id):
-    """Fetches messages for a room."""
+    """
+    Fetches a page of messages for a room, oldest first.
+    ?before=<cursor> / ?after=<cursor> page through older / newer history;
+    ?after_seq=<n> fetches by sequence number (filling a gap).
+    """
+    limit = page_size(request.GET.get("limit"))
     try:
-        room = Room.objects.get(id=room_id)
-    except Room.DoesNotExist:
-        return JsonResponse({"error": "Room not found"}, status=404)
+        if request.GET.get("after_seq") is not None:
+            page = seq_page(room_id, int(request.GET["after_seq"]), limit=limit)
+        else:
+            page = history_page(
+                room_id,
+                before=request.GET.get("before"),
+                after=request.GET.get("after"),
+                limit=limit,
+            )
+    except InvalidCursor:
+        return json_response({"error": "Invalid cursor"}, status=400)
+    except ValueError:
+        return json_response({"error": "Invalid after_seq"}, status=400)
+
+    return json_response(page.as_dict(serialize_message))
 
-    limit = int(request.GET.get("limit", 50))
-    messages = Message.objects.filter(room=room).order_by("-created")[:limit]
 
-    data = [{
-        "id": str(m.id),
-        "user": m.user.name,
-        "content": m.content,
-        "created": m.created.isoformat(),
-    } for m in reversed(messages)]
+@login_required
+@require_GET
+@room_member_required
+def export_room(request, room_id):
+    """Streams a room's full history as NDJSON (?gzip=1 to compress)."""
+    chunks = batched(iter_room_ndjson(room_id))
+    filename = f"room-{room_id}.ndjson"
+    content_type = "application/x-ndjson"
+    if request.GET.get("gzip") == "1":
+        chunks = gzip_stream(chunks)
+        filename += ".gz"
+        content_type = "application/gzip"
+
+    if isinstance(request, ASGIRequest):
+        chunks = aiter_sync(chunks)
 
-    return JsonResponse(data, safe=False)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
 
 
 @login_required
 @require_GET
+@room_member_required
 def get_room_members(request, room_id):
     """Returns members of a given room."""
-    try:
-        room = Room.objects.get(id=room_id)
-    except Room.DoesNotExist:
-        return JsonResponse({"error": "Room not found"}, status=404)
-
-    # Fetch members
-    members = RoomMember.objects.filter(room=room).select_related("user")
+    members = member_rows(room_id)
+    online = presence.online_user_ids(room_id)
+    me = str(request.user.id)
 
     data = [{
-        "id": str(m.user.id),
-        "username": m.user.name,
-        "email": m.user.email,
-        "is_admin": m.is_admin,
+        "id": str(m["user_id"]),
+        "username": m["user__name"],
+        "email": m["user__email"],
+        "is_admin": m["is_admin"],
+        "online": str(m["user_id"]) in online,
     } for m in members]
 
     # OWNER is admin in your logic
-    current_user_is_admin = RoomMember.objects.filter(
-        room=room, user=request.user, is_admin=True
-    ).exists()
+    current_user_is_admin = any(
+        m["is_admin"] for m in members if str(m["user_id"]) == me
+    )
 
-    return JsonResponse({
+    return json_response({
         "members": data,
-        "current_user_id": request.user.id,
+        "current_user_id": me,
         "current_user_is_admin": current_user_is_admin,
     })
 
 
+# -------------------------------------------------------------------
+# SEARCH
+# -------------------------------------------------------------------
+def _search(request, room_ids):
+    query = request.GET.get("q", "")
+    if not query.strip():
+        return json_response({"error": "q required"}, status=400)
+
+    try:
+        offset = max(0, int(request.GET.get("offset", 0)))
+    except ValueError:
+        offset = 0
+
+    user_id = request.GET.get("user") or None
+    if user_id is not None:
+        try:
+            user_id = uuid.UUID(user_id)
+        except ValueError:
+            return json_response({"error": "Invalid user"}, status=400)
+
+    results = get_search_backend().search(
+        query,
+        room_ids,
+        user_id=user_id,
+        limit=page_size(request.GET.get("limit")),
+        offset=offset,
+    )
+    return json_response(results.as_dict())
+
+
+@login_required
+@require_GET
+def search_messages(request):
+    """Ranked search across every room the user is in (?user= for one author)."""
+    return _search(request, list(membership_index.rooms_for(request.user.id)))
+
+
+@login_required
+@require_GET
+@room_member_required
+def search_room(request, room_id):
+    """Ranked search inside one room."""
+    return _search(request, [room_id])
+
+
 # -------------------------------------------------------------------
 # ROOM ACTIONS — ADD / KICK / LEAVE / MAKE ADMIN
 # -------------------------------------------------------------------
@@ -131,23 +245,26 @@ def add_user(request, room_id):
     """Owner adds user to room by email."""
     email = request.POST.get("email")
     if not email:
-        return JsonResponse({"error": "Email required"}, status=400)
+        return json_response({"error": "Email required"}, status=400)
 
     try:
         room = Room.objects.get(id=room_id)
     except Room.DoesNotExist:
-        return JsonResponse({"error": "Room not found"}, status=404)
+        return json_response({"error": "Room not found"}, status=404)
 
     if room.owner != request.user:
-        return JsonResponse({"error": "Only owner can invite"}, status=403)
+        return json_response({"error": "Only owner can invite"}, status=403)
 
     try:
         target = User.objects.get(email=email)
     except User.DoesNotExist:
-        return JsonResponse({"error": "User not found"}, status=404)
+        return json_response({"error": "User not found"}, status=404)
 
-    RoomMember.objects.get_or_create(room=room, user=target)
-    return JsonResponse({"detail": f"{target.name} added"})
+    _, created = RoomMember.objects.get_or_create(room=room, user=target)
+    if created:
+        audit_log.record(room.id, target.id, "invite", actor_id=request.user.id)
+        notify_members_changed(room.id, added=[target.id])
+    return json_response({"detail": f"{target.name} added"})
 
 
 @login_required
@@ -156,18 +273,20 @@ def kick_user(request, room_id):
     """Removes a user from a room (owner only)."""
     user_id = request.POST.get("user_id")
     if not user_id:
-        return JsonResponse({"error": "user_id required"}, status=400)
+        return json_response({"error": "user_id required"}, status=400)
 
     try:
         room = Room.objects.get(id=room_id)
     except Room.DoesNotExist:
-        return JsonResponse({"error": "Room not found"}, status=404)
+        return json_response({"error": "Room not found"}, status=404)
 
     if room.owner != request.user:
-        return JsonResponse({"error": "Only owner can kick"}, status=403)
+        return json_response({"error": "Only owner can kick"}, status=403)
 
-    RoomMember.objects.filter(room=room, user_id=user_id).delete()
-    return JsonResponse({"detail": "User removed"})
+    deleted, _ = RoomMember.objects.filter(room=room, user_id=user_id).delete()
+    if deleted:
+        audit_log.record(room.id, user_id, "kick", actor_id=request.user.id)
+    return json_response({"detail": "User removed"})
 
 
 @login_required
@@ -177,13 +296,85 @@ def leave_room(request, room_id):
     try:
         membership = RoomMember.objects.get(room_id=room_id, user=request.user)
     except RoomMember.DoesNotExist:
-        return JsonResponse({"error": "Not in room"}, status=404)
+        return json_response({"error": "Not in room"}, status=404)
 
     if membership.room.owner == request.user:
-        return JsonResponse({"error": "Owner cannot leave their own room"}, status=400)
+        return json_response({"error": "Owner cannot leave their own room"}, status=400)
 
     membership.delete()
-    return JsonResponse({"detail": "Left room"})
+    audit_log.record(room_id, request.user.id, "leave", actor_id=request.user.id)
+    return json_response({"detail": "Left room"})
+
+
+def _bulk_entries(request):
+    """
+    ``(emails, user_ids)`` from a bulk membership body
+    ({"emails": [...], "user_ids": [...]}); ValueError if malformed.
+    """
+    try:
+        data = json.loads(request.body.decode() or "{}")
+    except ValueError:
+        raise ValueError("Invalid JSON")
+    if not isinstance(data, dict):
+        raise ValueError("Body must be a JSON object")
+
+    emails = data.get("emails") or []
+    user_ids = data.get("user_ids") or []
+    if not isinstance(emails, list) or not isinstance(user_ids, list):
+        raise ValueError("emails and user_ids must be lists")
+    if not emails and not user_ids:
+        raise ValueError("emails or user_ids required")
+
+    limit = getattr(settings, "PINGME_BULK_MEMBERS_MAX", 1000)
+    if len(emails) + len(user_ids) > limit:
+        raise ValueError(f"At most {limit} entries per request")
+    return emails, user_ids
+
+
+@login_required
+@require_POST
+def bulk_add_users(request, room_id):
+    """Owner adds many users at once; reports one outcome per entry."""
+    try:
+        emails, user_ids = _bulk_entries(request)
+    except ValueError as exc:
+        return json_response({"error": str(exc)}, status=400)
+
+    try:
+        room = Room.objects.get(id=room_id)
+    except Room.DoesNotExist:
+        return json_response({"error": "Room not found"}, status=404)
+
+    if room.owner_id != request.user.id:
+        return json_response({"error": "Only owner can invite"}, status=403)
+
+    results, added = bulk_add_members(room, request.user, emails=emails, user_ids=user_ids)
+    if added:
+        notify_members_changed(room.id, added=added)
+    return json_response({"results": results, "added": len(added)})
+
+
+@login_required
+@require_POST
+def bulk_remove_users(request, room_id):
+    """Owner removes many users at once (never themselves)."""
+    try:
+        emails, user_ids = _bulk_entries(request)
+    except ValueError as exc:
+        return json_response({"error": str(exc)}, status=400)
+
+    try:
+        room = Room.objects.get(id=room_id)
+    except Room.DoesNotExist:
+        return json_response({"error": "Room not found"}, status=404)
+
+    if room.owner_id != request.user.id:
+        return json_response({"error": "Only owner can kick"}, status=403)
+
+    results, removed = bulk_remove_members(room, request.user, emails=emails, user_ids=user_ids)
+    if removed:
+        notify_members_changed(room.id, removed=removed)
+    return json_response({"results": results, "removed": len(removed)})
 
 
 @login_required
@@ -192,17 +383,30 @@ def make_admin(request, room_id):
     """Transfers room ownership."""
     target_id = request.POST.get("user_id")
     if not target_id:
-        return JsonResponse({"error": "user_id required"}, status=400)
+        return json_response({"error": "user_id required"}, status=400)
 
     try:
         room = Room.objects.get(id=room_id)
     except Room.DoesNotExist:
-        return JsonResponse({"error": "Room not found"}, status=404)
+        return json_response({"error": "Room not found"}, status=404)
 
     if room.owner != request.user:
-        return JsonResponse({"error": "Only owner can promote"}, status=403)
+        return json_response({"error": "Only owner can promote"}, status=403)
 
     new_owner = User.objects.get(id=target_id)
     room.owner = new_owner
     room.save()
-    return JsonResponse({"detail": f"{new_owner.name} is now admin"})
+    return json_response({"detail": f"{new_owner.name} is now admin"})
+
+
+# -------------------------------------------------------------------
+# METRICS (staff only)
+# -------------------------------------------------------------------
+@login_required
+@require_GET
+def metrics_view(request):
+    """Per-process counters for this worker."""
+    if not request.user.is_staff:
+        return json_response({"error": "Staff only"}, status=403)
+
+    return json_response({"counters": metrics.snapshot()})
@@ -0,0 +1,165 @@
+import datetime
+import uuid
+import zlib
+
+import msgpack
+from django.db import transaction
+
+from core.models import Message, MessageArchiveBlock, User
+from core.versions import data_rewritten
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_US = datetime.timedelta(microseconds=1)
+
+
+# ---------------------------------------------------------------------
+# BLOCK FORMAT
+# zlib(msgpack([[id bytes, created µs since epoch, user id bytes|None,
+# content, seq|None], ...])), oldest first. Sender names are looked up
+# on read so renames show up in old history too. Blocks written before
+# sequence numbers existed have four-element rows.
+# ---------------------------------------------------------------------
+
+def encode_block(rows):
+    """Packs ``(id, created, user_id, content, seq)`` tuples, oldest first."""
+    packed = [
+        [msg_id.bytes, (created - _EPOCH) // _US, user_id.bytes if user_id else None, content, seq]
+        for msg_id, created, user_id, content, seq in rows
+    ]
+    return zlib.compress(msgpack.packb(packed, use_bin_type=True), 9)
+
+
+def decode_block(payload):
+    """Inverse of ``encode_block``: ``(id, created, user_id, content, seq)`` tuples."""
+    return [
+        (
+            uuid.UUID(bytes=row[0]),
+            _EPOCH + datetime.timedelta(microseconds=row[1]),
+            uuid.UUID(bytes=row[2]) if row[2] else None,
+            row[3],
+            row[4] if len(row) > 4 else None,
+        )
+        for row in msgpack.unpackb(zlib.decompress(bytes(payload)), raw=False)
+    ]
+
+
+def _with_names(rows):
+    """``message_rows``-shaped dicts, with sender names in one query."""
+    user_ids = {row[2] for row in rows if row[2]}
+    names = dict(User.objects.filter(id__in=user_ids).values_list("id", "name")) if user_ids else {}
+    return [
+        {
+            "id": msg_id,
+            "seq": seq,
+            "content": content,
+            "created": created,
+            "user_id": user_id if user_id in names else None,
+            "user__name": names.get(user_id),
+        }
+        for msg_id, created, user_id, content, seq in rows
+    ]
+
+
+# ---------------------------------------------------------------------
+# READS (used once hot history runs out)
+# ---------------------------------------------------------------------
+
+def has_archive(room_id):
+    return MessageArchiveBlock.objects.filter(room_id=room_id).exists()
+
+
+def archived_before(room_id, key, limit):
+    """
+    Up to ``limit`` archived rows older than ``key`` ((created, id), or
+    None for the newest), newest first.
+    """
+    blocks = MessageArchiveBlock.objects.filter(room_id=room_id)
+    if key is not None:
+        blocks = blocks.filter(first_created__lte=key[0])
+
+    found = []
+    for payload in blocks.order_by("-day").values_list("payload", flat=True).iterator(chunk_size=4):
+        rows = decode_block(payload)
+        if key is not None:
+            rows = [r for r in rows if (r[1], r[0]) < key]
+        found.extend(reversed(rows))
+        if len(found) >= limit:
+            break
+    return _with_names(found[:limit])
+
+
+def archived_after(room_id, key, limit):
+    """Up to ``limit`` archived rows newer than ``key``, oldest first."""
+    blocks = MessageArchiveBlock.objects.filter(room_id=room_id, last_created__gte=key[0])
+
+    found = []
+    for payload in blocks.order_by("day").values_list("payload", flat=True).iterator(chunk_size=4):
+        found.extend(r for r in decode_block(payload) if (r[1], r[0]) > key)
+        if len(found) >= limit:
+            break
+    return _with_names(found[:limit])
+
+
+def iter_archived(room_id):
+    """Every archived row of a room, oldest first, one block at a time."""
+    blocks = MessageArchiveBlock.objects.filter(room_id=room_id).order_by("day")
+    for payload in blocks.values_list("payload", flat=True).iterator(chunk_size=4):
+        yield from _with_names(decode_block(payload))
+
+
+# ---------------------------------------------------------------------
+# ARCHIVING (manage.py archive_messages)
+# ---------------------------------------------------------------------
+
+def _merge_into_block(room_id, day, rows):
+    block = MessageArchiveBlock.objects.filter(room_id=room_id, day=day).first()
+    if block is not None:
+        # A later run (or a late write-behind batch) adds to the day
+        merged = {r[0]: r for r in decode_block(block.payload)}
+        merged.update((r[0], r) for r in rows)
+        rows = list(merged.values())
+    else:
+        block = MessageArchiveBlock(room_id=room_id, day=day)
+
+    rows.sort(key=lambda r: (r[1], r[0]))
+    block.first_created = rows[0][1]
+    block.last_created = rows[-1][1]
+    block.message_count = len(rows)
+    block.payload = encode_block(rows)
+    block.save()
+
+
+def archive_room(room_id, cutoff, batch_size=5000):
+    """
+    Moves a room's messages older than ``cutoff`` into per-day blocks,
+    one UTC day per transaction: the day's rows are read ``batch_size``
+    at a time, its block is encoded once, and the rows are deleted in
+    ``batch_size`` chunks. Returns how many moved. Each day bumps the
+    room's stored ``data_version``, so running servers drop their
+    buffered copies and ETags.
+    """
+    old = Message.objects.filter(room_id=room_id, created__lt=cutoff)
+    moved = 0
+    while True:
+        with transaction.atomic():
+            first = old.order_by("created", "id").values_list("created", flat=True).first()
+            if first is None:
+                return moved
+
+            day = first.astimezone(datetime.timezone.utc).date()
+            start = datetime.datetime.combine(day, datetime.time.min, tzinfo=datetime.timezone.utc)
+            rows = list(
+                old.filter(created__gte=start, created__lt=start + datetime.timedelta(days=1))
+                .order_by("created", "id")
+                .values_list("id", "created", "user_id", "content", "seq")
+                .iterator(chunk_size=batch_size)
+            )
+            _merge_into_block(room_id, day, rows)
+
+            # Raw delete: no per-row signals or collector for rows that
+            # live on in the archive (the search triggers still fire)
+            for at in range(0, len(rows), batch_size):
+                ids = [r[0] for r in rows[at:at + batch_size]]
+                Message.objects.filter(id__in=ids)._raw_delete(Message.objects.db)
+            data_rewritten([room_id])
+        moved += len(rows)
@@ -0,0 +1,285 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core import metrics
+from core.models import Room, RoomMembersLog, User
+from core.retention import Checkpoint
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------
+# WRITING LOG ROWS
+# ---------------------------------------------------------------------
+
+def _uuid(value):
+    return uuid.UUID(str(value)) if value else None
+
+
+def _insertable(entries):
+    """
+    Drops entries whose room is gone and clears users who are gone. The
+    FKs are checked at commit, so one stale row would fail the batch.
+    """
+    room_ids = {_uuid(e.room_id) for e in entries}
+    user_ids = {_uuid(uid) for e in entries for uid in (e.user_id, e.actor_id) if uid}
+    rooms = set(Room.objects.filter(id__in=room_ids).values_list("id", flat=True))
+    users = set(User.objects.filter(id__in=user_ids).values_list("id", flat=True)) if user_ids else set()
+
+    rows = []
+    for entry in entries:
+        if _uuid(entry.room_id) not in rooms:
+            continue
+        if entry.user_id and _uuid(entry.user_id) not in users:
+            entry.user_id = None
+        if entry.actor_id and _uuid(entry.actor_id) not in users:
+            entry.actor_id = None
+        rows.append(entry)
+    return rows
+
+
+def write_entries(entries):
+    """Inserts unsaved RoomMembersLog rows in one transaction; returns how many."""
+    # Checked before the transaction, so it opens with the INSERT: on
+    # SQLite a read-then-write transaction cannot wait for the lock
+    rows = _insertable(entries)
+    try:
+        with transaction.atomic():
+            RoomMembersLog.objects.bulk_create(rows)
+    except IntegrityError:
+        # A room or user went away since the check
+        rows = _insertable(rows)
+        with transaction.atomic():
+            RoomMembersLog.objects.bulk_create(rows)
+    return len(rows)
+
+
+# ---------------------------------------------------------------------
+# SPILL FILE (one JSON event per line, append-only)
+# ---------------------------------------------------------------------
+
+def entry_to_json(entry):
+    return {
+        "room": str(entry.room_id),
+        "user": str(entry.user_id) if entry.user_id else None,
+        "actor": str(entry.actor_id) if entry.actor_id else None,
+        "event": entry.event_type,
+        "created": entry.created.isoformat(),
+    }
+
+
+def entry_from_json(data):
+    return RoomMembersLog(
+        room_id=data["room"],
+        user_id=data["user"],
+        actor_id=data["actor"],
+        event_type=data["event"],
+        created=parse_datetime(data["created"]),
+    )
+
+
+def _replay_file(replaying, checkpoint, batch_size, log):
+    done = checkpoint.get("lines") or 0
+    read = 0
+    batch = []
+    with replaying.open(encoding="utf-8") as lines:
+        for number, line in enumerate(lines, 1):
+            if number <= done or not line.strip():
+                continue
+            batch.append(entry_from_json(json.loads(line)))
+            read += 1
+            if len(batch) >= batch_size:
+                write_entries(batch)
+                checkpoint.set("lines", number)
+                log(f"{read} events replayed")
+                batch = []
+    if batch:
+        write_entries(batch)
+    return read
+
+
+def replay_spill(path, batch_size=1000, dry_run=False, log=None):
+    """
+    Writes the events spilled to ``path``; returns how many were read.
+
+    The file is first renamed to ``<path>.replaying``, so flushes that
+    spill meanwhile start a new file (replayed next). Progress is
+    checkpointed per batch: an interrupted run picks up where it
+    stopped, writing at most its last batch twice.
+    """
+    log = log or (lambda message: None)
+    path = Path(path)
+    replaying = path.with_name(path.name + ".replaying")
+    state = path.with_name(path.name + ".state")
+
+    if dry_run:
+        files = [p for p in (replaying, path) if p.exists()]
+        return sum(1 for p in files for line in p.open(encoding="utf-8") if line.strip())
+
+    read = 0
+    while True:
+        # A previous run that did not finish goes first
+        if not replaying.exists():
+            if not path.exists():
+                return read
+            path.rename(replaying)
+        read += _replay_file(replaying, Checkpoint(state), batch_size, log)
+        replaying.unlink()
+        state.unlink(missing_ok=True)
+
+
+# ---------------------------------------------------------------------
+# BUFFERED AUDIT LOG
+# ---------------------------------------------------------------------
+
+class AuditBuffer:
+    """
+    Per-process buffer for membership audit rows (RoomMembersLog).
+
+    Views queue events and return; a background thread writes them with
+    ``bulk_create`` once ``batch_size`` are waiting or every
+    ``flush_interval`` seconds. If the database is locked or unavailable
+    and a ``spill_path`` is set, the batch is appended to that file for
+    ``manage.py replay_audit``; otherwise it is kept and retried.
+    """
+
+    def __init__(self, batch_size=500, flush_interval=1.0, max_pending=50000,
+                 spill_path=None, buffered=True):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.spill_path = spill_path
+        self.buffered = buffered
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    # -----------------------------------------------------------------
+    # Producer side
+    # -----------------------------------------------------------------
+    def record(self, room_id, user_id, event_type, actor_id=None):
+        self.record_many(room_id, [user_id], event_type, actor_id)
+
+    def record_many(self, room_id, user_ids, event_type, actor_id=None):
+        """One event per user, all stamped now."""
+        now = timezone.now()
+        rows = [
+            RoomMembersLog(room_id=room_id, user_id=uid, actor_id=actor_id, event_type=event_type, created=now)
+            for uid in user_ids
+        ]
+        if not rows:
+            return
+        if not self.buffered:
+            write_entries(rows)
+            return
+
+        self._ensure_flusher()
+        with self._lock:
+            self._pending.extend(rows)
+            waiting = len(self._pending)
+
+        # Writer fell behind: make this request wait for one flush
+        if waiting >= self.max_pending:
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Audit flush failed")
+        elif waiting >= self.batch_size:
+            self._wake.set()
+
+    def __len__(self):
+        return len(self._pending)
+
+    # -----------------------------------------------------------------
+    # Flushing
+    # -----------------------------------------------------------------
+    def _ensure_flusher(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="pingme-audit", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            # This thread's connection outlives any request
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Audit flush failed")
+
+    def flush(self):
+        """Writes (or spills) everything queued so far. Flushes never overlap."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            try:
+                written = write_entries(batch)
+            except OperationalError:
+                if not self.spill_path:
+                    self._requeue(batch)
+                    raise
+                try:
+                    self._spill(batch)
+                except OSError:
+                    self._requeue(batch)
+                    raise
+                return
+            except Exception:
+                self._requeue(batch)
+                raise
+            metrics.incr("audit.written", written)
+
+    def flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.error("Dropped %d unsaved audit events on shutdown", len(self._pending))
+
+    def _requeue(self, batch):
+        with self._lock:
+            # Keep the original order ahead of anything newer
+            self._pending[:0] = batch
+            over = len(self._pending) - self.max_pending
+            if over > 0:
+                del self._pending[:over]
+        if over > 0:
+            metrics.incr("audit.dropped", over)
+            logger.error("Dropped %d audit events (queue full)", over)
+
+    def _spill(self, batch):
+        data = "".join(json.dumps(entry_to_json(e)) + "\n" for e in batch)
+        with open(self.spill_path, "a", encoding="utf-8") as spill:
+            spill.write(data)
+            spill.flush()
+            os.fsync(spill.fileno())
+        metrics.incr("audit.spilled", len(batch))
+        logger.warning("Database unavailable; spilled %d audit events to %s", len(batch), self.spill_path)
+
+
+audit_log = AuditBuffer(
+    batch_size=getattr(settings, "PINGME_AUDIT_BATCH_SIZE", 500),
+    flush_interval=getattr(settings, "PINGME_AUDIT_FLUSH_INTERVAL", 1.0),
+    max_pending=getattr(settings, "PINGME_AUDIT_MAX_PENDING", 50000),
+    spill_path=getattr(settings, "PINGME_AUDIT_SPILL_PATH", None),
+    buffered=getattr(settings, "PINGME_AUDIT_BUFFERED", True),
+)
+atexit.register(audit_log.flush_at_exit)
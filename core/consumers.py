@@ -1,7 +1,38 @@
-import json
+import asyncio
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from core.access import membership_index
+from core.db import db_read, db_write
+from core.events import room_group_name
 from core.models import Room, Message
+from core.outbox import ConnectionOutbox
+from core import metrics
+from core.history import history_page, resume_cursor, row_from_message, serialize_message
+from core.pagination import InvalidCursor, decode_cursor, page_size
+from core.persistence import QueueFull, get_message_queue
+from core.presence import presence
+from core.ratelimit import control_limiter, history_limiter, message_limiter
+from core.recent import recent_history
+from core.unread import mark_read
+from core.versions import room_versions
+from core.wire import (
+    SUBPROTOCOL_MSGPACK,
+    chat_frame,
+    decode_frame,
+    encode_json,
+    encode_msgpack,
+)
+
+# Close codes sent when a socket is refused or loses access
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+CLOSE_NOT_FOUND = 4404
+# Client fell too far behind and must refetch history
+CLOSE_RESYNC = 4409
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
@@ -9,58 +40,336 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         room_id = self.scope["url_route"]["kwargs"]["room_id"]
         self.room_id = room_id
-        self.room_group_name = f"chat_{room_id}"
+        self.room_group_name = room_group_name(room_id)
+        self.room = None
+        self.membership = None
+        self.read_marker = None
+        self.read_task = None
+        self.binary = SUBPROTOCOL_MSGPACK in self.scope.get("subprotocols", [])
+
+        # Everything we send goes through a bounded, coalescing outbox
+        self.outbox = ConnectionOutbox(
+            self.send,
+            binary=self.binary,
+            max_frames=getattr(settings, "PINGME_OUTBOX_MAX_FRAMES", 256),
+            drop_limit=getattr(settings, "PINGME_OUTBOX_DROP_LIMIT", 512),
+            coalesce_window=getattr(settings, "PINGME_COALESCE_WINDOW_MS", 0) / 1000,
+            max_batch=getattr(settings, "PINGME_COALESCE_MAX_BATCH", 32),
+            delay_warn=getattr(settings, "PINGME_OUTBOX_DELAY_WARN_MS", 1000) / 1000,
+            on_overflow=self.resync,
+        )
+
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            await self.refuse(CLOSE_UNAUTHORIZED)
+            return
+
+        # Resolve the room once; membership comes from the shared index,
+        # which every later frame re-checks
+        self.room, is_member = await self.load_membership(user)
+        if self.room is None:
+            await self.refuse(CLOSE_NOT_FOUND)
+            return
+        if not is_member:
+            await self.refuse(CLOSE_FORBIDDEN)
+            return
+        self.membership = True
+        self.user_key = str(user.id)
+        self.room_key = str(self.room.id)
 
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
 
-        await self.accept()
+        await self.accept(subprotocol=SUBPROTOCOL_MSGPACK if self.binary else None)
+        presence.join(room_id, user.id, user.name, self.channel_name)
         print("✅ WS Connected:", room_id)
 
+        # Reconnecting client: replay what it missed before live traffic
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        last_seen = query.get("last_seen", [None])[0]
+        if last_seen:
+            await self.resume(last_seen)
+
+    async def refuse(self, code):
+        """
+        Accepts, then closes with ``code``. A close during the handshake
+        becomes an HTTP 403, and browsers only ever see 1006 for that.
+        """
+        await self.accept()
+        await self.close(code=code)
+
     async def disconnect(self, close_code):
+        self.outbox.close()
+        if self.membership is not None:
+            presence.leave(self.room_id, self.scope["user"].id, self.channel_name)
+            # Do not lose a read marker still waiting on the debounce
+            if self.read_task is not None:
+                self.read_task.cancel()
+                await self.flush_read()
+
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    async def receive(self, text_data=None, bytes_data=None):
+        if self.membership is None:
+            return
+
+        # Kicks that never reached this socket as an event (another
+        # code path, admin) still stop it here
+        allowed = membership_index.cached(self.user_key, self.room_key)
+        if allowed is None:
+            allowed = await self.check_membership()
+        if not allowed:
+            await self.membership_revoked({"user_id": self.user_key})
+            return
+
+        try:
+            data = decode_frame(text_data, bytes_data)
+        except ValueError:
+            return
+
+        # Frames without a type are plain sends from older clients
+        kind = data.get("type", "send")
+        user_id = self.scope["user"].id
+        if kind in ("heartbeat", "typing", "read") and control_limiter.take(str(user_id)):
+            metrics.incr("ratelimit.throttled.control")
+            return
+        if kind == "heartbeat":
+            presence.heartbeat(self.room_id, user_id, self.channel_name)
+            return
+        if kind == "typing":
+            presence.typing(self.room_id, user_id, bool(data.get("active", True)))
+            return
+        if kind == "history":
+            retry_after = history_limiter.take(str(user_id))
+            if retry_after:
+                metrics.incr("ratelimit.throttled.history")
+                await self.send_frame({
+                    "type": "error",
+                    "code": "rate_limited",
+                    "scope": "history",
+                    "retry_after": round(retry_after, 3),
+                })
+                return
+            await self.send_history(data)
+            return
+        if kind == "read":
+            self.queue_read(data.get("id"))
+            return
+        if kind != "send":
+            return
+
         msg_text = data.get("message")
 
         if not msg_text:
             return
 
-        msg_obj = await self.save_message(msg_text)
+        scope, retry_after = message_limiter.check(user_id, self.room_id)
+        if scope is not None:
+            await self.send_frame({
+                "type": "error",
+                "code": "rate_limited",
+                "scope": scope,
+                "retry_after": round(retry_after, 3),
+                "client_id": data.get("client_id"),
+            })
+            return
+
+        presence.heartbeat(self.room_id, user_id, self.channel_name)
+        presence.typing(self.room_id, user_id, active=False)
 
+        if getattr(settings, "PINGME_WRITE_BEHIND", False):
+            try:
+                msg_obj = await self.queue_message(msg_text)
+            except QueueFull:
+                await self.send_frame({
+                    "type": "error",
+                    "code": "overloaded",
+                    "client_id": data.get("client_id"),
+                })
+                return
+        else:
+            msg_obj = await self.save_message(msg_text)
+
+        # Encode once here; every subscriber forwards the same frame
+        frame = chat_frame(msg_obj)
         await self.channel_layer.group_send(
             self.room_group_name,
             {
                 "type": "chat_message",
-                "user": msg_obj["user"],
-                "content": msg_obj["content"],
+                "text": encode_json(frame),
+                "bytes": encode_msgpack(frame),
             }
         )
 
+        if data.get("client_id"):
+            await self.send_frame({
+                "type": "ack",
+                "client_id": data["client_id"],
+                "id": msg_obj["id"],
+                "seq": msg_obj["seq"],
+                "created": msg_obj["created"],
+            })
+
     async def chat_message(self, event):
-        await self.send(text_data=json.dumps({
-            "user": event["user"],
-            "content": event["content"],
-        }))
+        self.outbox.put(event["bytes"] if self.binary else event["text"])
+
+    async def presence_update(self, event):
+        self.outbox.put(event["bytes"] if self.binary else event["text"])
+
+    async def send_frame(self, payload):
+        """Queues one payload in the format this client negotiated."""
+        if self.binary:
+            self.outbox.put(encode_msgpack(payload))
+        else:
+            self.outbox.put(encode_json(payload))
 
-    @database_sync_to_async
+    async def resync(self):
+        """Slow client: skip the backlog and make it refetch history."""
+        payload = {"type": "resync", "dropped": self.outbox.dropped}
+        if self.binary:
+            await self.send(bytes_data=encode_msgpack(payload))
+        else:
+            await self.send(text_data=encode_json(payload))
+        await self.close(code=CLOSE_RESYNC)
+
+    async def resume(self, last_seen):
+        """
+        Sends the messages after ``last_seen`` (a cursor or message id),
+        or a resync frame if the gap is unknown or too large.
+        """
+        limit = getattr(settings, "PINGME_RESUME_MAX_MESSAGES", 200)
+        page = await self.load_missed(last_seen, limit)
+
+        if page is None or page["has_more"]:
+            metrics.incr("resume.resync")
+            await self.send_frame({"type": "resync", "reason": "gap"})
+            return
+
+        metrics.incr("resume.replayed")
+        if page["messages"]:
+            await self.send_frame({"type": "replay", **page})
+
+    async def send_history(self, data):
+        try:
+            page = await self.load_history(data.get("before"), page_size(data.get("limit")))
+        except InvalidCursor:
+            await self.send_frame({"type": "error", "code": "invalid_cursor"})
+            return
+
+        await self.send_frame({"type": "history", **page})
+
+    def queue_read(self, last_read):
+        """Keeps the newest read marker; one write per debounce window."""
+        if not last_read:
+            return
+        self.read_marker = str(last_read)
+        if self.read_task is None:
+            self.read_task = asyncio.ensure_future(self.flush_read_later())
+
+    async def flush_read_later(self):
+        await asyncio.sleep(getattr(settings, "PINGME_READ_DEBOUNCE_MS", 1000) / 1000)
+        await self.flush_read()
+
+    async def flush_read(self):
+        self.read_task = None
+        marker, self.read_marker = self.read_marker, None
+        if marker is not None:
+            await self.save_read(marker)
+
+    async def membership_revoked(self, event):
+        """Control event from a removal: drop the cached membership."""
+        if self.membership is None or event["user_id"] != str(self.scope["user"].id):
+            return
+
+        presence.leave(self.room_id, event["user_id"], self.channel_name)
+        self.membership = None
+        await self.close(code=CLOSE_FORBIDDEN)
+
+    async def members_changed(self, event):
+        """Bulk add/remove: close removed users, tell everyone else."""
+        if str(self.scope["user"].id) in event["removed"]:
+            await self.membership_revoked({"user_id": str(self.scope["user"].id)})
+            return
+        await self.send_frame({
+            "type": "members",
+            "added": event["added"],
+            "removed": event["removed"],
+        })
+
+    @db_read
+    def load_membership(self, user):
+        try:
+            room = Room.objects.get(id=self.room_id)
+        except (Room.DoesNotExist, ValidationError):
+            return None, None
+
+        return room, membership_index.is_member(user.id, room.id)
+
+    @db_read
+    def check_membership(self):
+        return membership_index.is_member(self.user_key, self.room_key)
+
+    @db_read
+    def load_history(self, before, limit):
+        page = history_page(self.room.id, before=before, limit=limit)
+        return page.as_dict(serialize_message)
+
+    @db_read
+    def load_missed(self, last_seen, limit):
+        cursor = resume_cursor(self.room.id, last_seen)
+        if cursor is None:
+            return None
+        page = history_page(self.room.id, after=cursor, limit=limit)
+        return page.as_dict(serialize_message)
+
+    @db_write
+    def save_read(self, marker):
+        # Accepts a message id or a cursor, like ?last_seen
+        cursor = resume_cursor(self.room.id, marker)
+        if cursor is None:
+            return
+        created, msg_id = decode_cursor(cursor)
+        mark_read(self.room.id, self.scope["user"].id, created, msg_id)
+
+    @db_write
     def save_message(self, content):
         user = self.scope["user"]
-        room = Room.objects.get(id=self.room_id)
 
-        msg = Message.objects.create(
-            room=room,
-            user=user,
-            content=content
-        )
+        # One transaction for the row and its counters: a single commit
+        # and write-lock hold per message
+        with transaction.atomic():
+            msg = Message.objects.create(
+                room=self.room,
+                user=user,
+                content=content
+            )
+
+        return {
+            "id": str(msg.id),
+            "seq": msg.seq,
+            "user": user.name,
+            "user_id": str(user.id),
+            "content": msg.content,
+            "created": msg.created.isoformat(),
+        }
+
+    async def queue_message(self, content):
+        """Write-behind variant of save_message: no DB round-trip here."""
+        user = self.scope["user"]
+        msg = await get_message_queue().put(self.room_id, user, content)
+        recent_history.append(self.room_id, row_from_message(msg))
+        room_versions.bump(self.room_id)
 
         return {
+            "id": str(msg.id),
+            "seq": msg.seq,
             "user": user.name,
+            "user_id": str(user.id),
             "content": msg.content,
+            "created": msg.created.isoformat(),
         }
@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+
+# ---------------------------------------------------------------------
+# DATABASE LANES FOR ASYNC CODE
+# ---------------------------------------------------------------------
+#
+# SQLite allows one writer at a time. With PINGME_DB_LANES on (the
+# production profile, which also turns on WAL), consumer writes are
+# funnelled through one dedicated thread, in submission order, while
+# reads run alongside them on a small pool of PINGME_DB_READERS threads.
+# Off, both behave like plain database_sync_to_async: everything on the
+# one shared sync thread.
+
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pingme-db-writer")
+_read_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "PINGME_DB_READERS", 4),
+    thread_name_prefix="pingme-db-reader",
+)
+
+
+def _lanes_enabled():
+    return getattr(settings, "PINGME_DB_LANES", False)
+
+
+def db_read(func):
+    """database_sync_to_async for read-only ORM work."""
+    if _lanes_enabled():
+        return database_sync_to_async(func, thread_sensitive=False, executor=_read_executor)
+    return database_sync_to_async(func)
+
+
+def db_write(func):
+    """database_sync_to_async for ORM work that writes."""
+    if _lanes_enabled():
+        return database_sync_to_async(func, thread_sensitive=False, executor=_write_executor)
+    return database_sync_to_async(func)
@@ -0,0 +1,32 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+
+def room_group_name(room_id):
+    """Channel layer group every consumer in a room joins."""
+    return f"chat_{room_id}"
+
+
+def notify_room(room_id, event):
+    """Sends a control event to every consumer in a room (sync callers)."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(room_group_name(room_id), event)
+
+
+def notify_membership_revoked(room_id, user_id):
+    """Tells the room's consumers that ``user_id`` is no longer a member."""
+    notify_room(room_id, {
+        "type": "membership_revoked",
+        "user_id": str(user_id),
+    })
+
+
+def notify_members_changed(room_id, added=(), removed=()):
+    """One event for a bulk change; removed users' sockets close."""
+    notify_room(room_id, {
+        "type": "members_changed",
+        "added": [str(uid) for uid in added],
+        "removed": [str(uid) for uid in removed],
+    })
@@ -0,0 +1,55 @@
+import itertools
+import zlib
+
+from asgiref.sync import sync_to_async
+
+from core.archive import iter_archived
+from core.history import message_rows, serialize_message
+from core.renderers import dumps
+
+
+# ---------------------------------------------------------------------
+# NDJSON ROOM EXPORT
+# Rows are read with a chunked iterator, so memory stays flat.
+# ---------------------------------------------------------------------
+
+def iter_room_ndjson(room_id, chunk_size=2000):
+    """Yields one NDJSON line (bytes) per message, oldest first."""
+    hot = message_rows(room_id).order_by("created", "id").iterator(chunk_size=chunk_size)
+    # Archived history is older than anything still in the hot table
+    for row in itertools.chain(iter_archived(room_id), hot):
+        yield dumps(serialize_message(row)) + b"\n"
+
+
+def gzip_stream(chunks, level=6):
+    """Gzip-compresses an iterable of bytes incrementally."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def batched(chunks, lines=256):
+    """Joins small chunks so each write/yield carries a useful amount."""
+    it = iter(chunks)
+    while True:
+        batch = list(itertools.islice(it, lines))
+        if not batch:
+            return
+        yield b"".join(batch)
+
+
+async def aiter_sync(chunks):
+    """
+    Async wrapper for a sync (DB-backed) iterator. Under ASGI this keeps
+    StreamingHttpResponse from reading the whole export into memory.
+    """
+    it = iter(chunks)
+    pull = sync_to_async(lambda: next(it, None), thread_sensitive=True)
+    while True:
+        chunk = await pull()
+        if chunk is None:
+            return
+        yield chunk
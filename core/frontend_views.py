@@ -1,8 +1,10 @@
 from django.shortcuts import render, get_object_or_404,redirect
-from core.models import Room,RoomMembersLog,Message
+from core.models import Room
 from django.contrib.auth import authenticate, login
 from django.views.decorators.csrf import csrf_protect
 from django.contrib.auth.decorators import login_required
+from core.audit import audit_log
+from core.history import history_page
 
 @csrf_protect
 def login_page(request):
@@ -35,19 +37,15 @@ def chat_page(request, room_id):
 
     if created:
         event_type = "invite" if request.GET.get("invite") == "1" else "join"
-        RoomMembersLog.objects.create(
-            room=room,
-            user=user,
-            actor=user,
-            event_type=event_type
-        )
+        audit_log.record(room.id, user.id, event_type, actor_id=user.id)
 
-    messages = Message.objects.filter(room=room).order_by("-created")[:50]
+    # Newest page, usually straight from the recent-history buffer
+    messages = history_page(room.id, limit=50).messages
 
     return render(
         request, 
         "chat.html",
-        {"room": room, "messages": reversed(messages), "user": user}
+        {"room": room, "messages": messages, "user": user}
     )
 
 from django.shortcuts import render, get_object_or_404
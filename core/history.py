@@ -0,0 +1,161 @@
+import uuid
+
+from core.archive import archived_after, archived_before, has_archive
+from core.models import Message, RoomMember
+from core.pagination import (
+    InvalidCursor,
+    MessagePage,
+    decode_cursor,
+    encode_cursor,
+    paginate_messages,
+)
+from core.persistence import pending_messages
+from core.recent import recent_history
+from core.versions import data_version
+
+
+# ---------------------------------------------------------------------
+# LEAN READ PATHS
+# Only the columns the API needs, user joined in the same query.
+# ---------------------------------------------------------------------
+
+MESSAGE_COLUMNS = ("id", "seq", "content", "created", "user_id", "user__name")
+MEMBER_COLUMNS = ("user_id", "user__name", "user__email", "is_admin")
+
+
+def message_rows(room_id):
+    return Message.objects.filter(room_id=room_id).values(*MESSAGE_COLUMNS)
+
+
+def serialize_message(row):
+    """API/wire dict for a ``message_rows`` row (user may be NULL)."""
+    return {
+        "id": str(row["id"]),
+        "seq": row["seq"],
+        "user": row["user__name"],
+        "user_id": str(row["user_id"]) if row["user_id"] else None,
+        "content": row["content"],
+        "created": row["created"].isoformat(),
+    }
+
+
+def row_from_message(msg):
+    """``message_rows``-shaped row for a Message instance."""
+    return {
+        "id": msg.id,
+        "seq": msg.seq,
+        "content": msg.content,
+        "created": msg.created,
+        "user_id": msg.user_id,
+        "user__name": msg.user.name if msg.user_id else None,
+    }
+
+
+def warm_recent(room_id, version=0):
+    """Loads a room's newest messages into the recent-history buffer."""
+    size = recent_history.size
+    rows = list(message_rows(room_id).order_by("-created", "-id")[:size + 1])
+    complete = len(rows) <= size and not has_archive(room_id)
+    # Write-behind messages that are broadcast but not stored yet
+    rows = rows[:size] + [row_from_message(m) for m in pending_messages(room_id)]
+    recent_history.warm(room_id, rows, complete, version)
+
+
+def resume_cursor(room_id, last_seen):
+    """
+    Cursor for a reconnecting client's ``last_seen`` value, which may be
+    a cursor or a message id. None if it names nothing in this room.
+    """
+    try:
+        decode_cursor(last_seen)
+        return last_seen
+    except InvalidCursor:
+        pass
+
+    try:
+        msg_id = uuid.UUID(str(last_seen))
+    except ValueError:
+        return None
+
+    cursor = recent_history.cursor_for(room_id, msg_id)
+    if cursor is not None:
+        return cursor
+
+    row = message_rows(room_id).filter(id=msg_id).values("created", "id").first()
+    if row is None:
+        return None
+    return encode_cursor(row["created"], row["id"])
+
+
+def history_page(room_id, before=None, after=None, limit=50):
+    """
+    One keyset page of a room's history as ``message_rows`` rows,
+    served from the recent-history buffer when it covers the page.
+    """
+    # Read first: rows loaded after it can only be newer than it says
+    version = data_version(room_id)
+    page = recent_history.page(room_id, before=before, after=after, limit=limit, version=version)
+    if page is not None:
+        return page
+
+    # Cold room asking for its newest page: warm the buffer and retry
+    if not before and not after and room_id not in recent_history:
+        warm_recent(room_id, version)
+        page = recent_history.page(room_id, limit=limit, version=version)
+        if page is not None:
+            return page
+
+    page = paginate_messages(message_rows(room_id), before=before, after=after, limit=limit)
+    return with_archive(room_id, page, before=before, after=after, limit=limit)
+
+
+def with_archive(room_id, page, before=None, after=None, limit=50):
+    """
+    Extends a hot-table page with archived rows where it crosses the
+    hot boundary: older pages that ran out of hot rows, and newer pages
+    starting from a cursor inside the archive.
+    """
+    if after:
+        cold = archived_after(room_id, decode_cursor(after), limit + 1)
+        if not cold:
+            return page
+        rows = sorted(cold + page.messages, key=lambda r: (r["created"], r["id"]))
+        has_more = page.has_more or len(rows) > limit
+        return MessagePage(rows[:limit], has_more, "after", after=after)
+
+    if page.has_more:
+        return page
+
+    # Hot history is exhausted: continue below its oldest row
+    if page.messages:
+        key = (page.messages[0]["created"], page.messages[0]["id"])
+    else:
+        key = decode_cursor(before) if before else None
+    need = limit - len(page.messages)
+    cold = archived_before(room_id, key, need + 1)
+    if not cold:
+        return page
+    rows = list(reversed(cold[:need])) + page.messages
+    return MessagePage(rows, len(cold) > need, "before")
+
+
+def seq_page(room_id, after_seq, limit=50):
+    """
+    Messages numbered after ``after_seq``, oldest first: the cheap
+    gap fill for a client that saw seq N and then N+k. Write-behind
+    messages not stored yet are included. Archived rows are not;
+    gaps that old are a resync.
+    """
+    rows = list(
+        message_rows(room_id).filter(seq__gt=after_seq).order_by("seq")[:limit + 1]
+    )
+    pending = [row_from_message(m) for m in pending_messages(room_id) if m.seq > after_seq]
+    if pending:
+        stored = {row["id"] for row in rows}
+        rows += [row for row in pending if row["id"] not in stored]
+        rows.sort(key=lambda r: r["seq"])
+    return MessagePage(rows[:limit], len(rows) > limit, "after")
+
+
+def member_rows(room_id):
+    return list(RoomMember.objects.filter(room_id=room_id).values(*MEMBER_COLUMNS))
@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from core.archive import archive_room
+from core.models import Room
+
+
+class Command(BaseCommand):
+    help = "Moves old messages into compressed per-room, per-day archive blocks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days", type=int,
+            default=getattr(settings, "PINGME_ARCHIVE_AFTER_DAYS", 90),
+        )
+        parser.add_argument("--room", help="Only this room id")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--vacuum", action="store_true",
+            help="VACUUM afterwards so SQLite gives the space back",
+        )
+
+    def handle(self, *args, **options):
+        if options["older_than_days"] < 1:
+            raise CommandError("--older-than-days must be at least 1")
+        cutoff = timezone.now() - timedelta(days=options["older_than_days"])
+
+        rooms = Room.objects.order_by("id").values_list("id", flat=True)
+        if options["room"]:
+            try:
+                rooms = rooms.filter(id=options["room"])
+                if not rooms.exists():
+                    raise CommandError(f"Room {options['room']} not found")
+            except (ValueError, ValidationError):
+                raise CommandError(f"Invalid room id {options['room']}")
+
+        total = 0
+        for room_id in rooms:
+            moved = archive_room(room_id, cutoff, batch_size=options["batch_size"])
+            if moved:
+                self.stdout.write(f"{room_id}: archived {moved} messages")
+            total += moved
+
+        if options["vacuum"] and connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute("VACUUM")
+
+        self.stdout.write(f"Archived {total} messages older than {cutoff:%Y-%m-%d %H:%M} UTC")
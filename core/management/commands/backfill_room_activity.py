@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.activity import refresh_room_activity
+from core.models import Room
+from core.versions import data_rewritten
+
+
+class Command(BaseCommand):
+    help = "Fills Room.last_message_* from existing messages (safe to re-run)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--missing-only", action="store_true",
+            help="Only rooms that have no snapshot yet",
+        )
+
+    def handle(self, *args, **options):
+        rooms = Room.objects.order_by("id")
+        if options["missing_only"]:
+            rooms = rooms.filter(last_message_at__isnull=True)
+
+        ids = list(rooms.values_list("id", flat=True))
+        size = options["batch_size"]
+        # Short transactions so chat writes are not blocked for long
+        for start in range(0, len(ids), size):
+            batch = ids[start:start + size]
+            with transaction.atomic():
+                refresh_room_activity(Room.objects.filter(id__in=batch))
+                # Room lists cached by running servers are stale now
+                data_rewritten(batch)
+
+        self.stdout.write(f"Backfilled {len(ids)} rooms")
@@ -0,0 +1,37 @@
+import sys
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from core.export import batched, gzip_stream, iter_room_ndjson
+from core.models import Room
+
+
+class Command(BaseCommand):
+    help = "Streams a room's message history as NDJSON (optionally gzip'd)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("room_id")
+        parser.add_argument("-o", "--output", help="File to write (default: stdout)")
+        parser.add_argument("--gzip", action="store_true", help="Gzip the output")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        room_id = options["room_id"]
+        try:
+            if not Room.objects.filter(id=room_id).exists():
+                raise CommandError(f"Room {room_id} not found")
+        except (ValueError, ValidationError):
+            raise CommandError(f"Invalid room id {room_id}")
+
+        chunks = batched(iter_room_ndjson(room_id, chunk_size=options["chunk_size"]))
+        if options["gzip"]:
+            chunks = gzip_stream(chunks)
+
+        out = open(options["output"], "wb") if options["output"] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if options["output"]:
+                out.close()
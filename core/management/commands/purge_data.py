@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from core.retention import Checkpoint, RetentionEngine
+
+
+class Command(BaseCommand):
+    help = "Applies retention policies: old messages, member logs, expired sessions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--only", nargs="+", choices=RetentionEngine.TASKS,
+            help="Run just these tasks (default: all)",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only count what is due")
+        parser.add_argument("--batch-size", type=int, help="Rows per delete (default: settings)")
+        parser.add_argument("--pause-ms", type=int, help="Sleep between batches (default: settings)")
+        parser.add_argument("--state-file", help="Resume file for long runs")
+
+    def handle(self, *args, **options):
+        verbosity = options["verbosity"]
+        engine = RetentionEngine(
+            batch_size=options["batch_size"],
+            pause=options["pause_ms"] / 1000 if options["pause_ms"] is not None else None,
+            dry_run=options["dry_run"],
+            checkpoint=Checkpoint(options["state_file"]),
+            log=self.stdout.write if verbosity >= 2 else None,
+        )
+        counts = engine.run(options["only"] or RetentionEngine.TASKS)
+
+        verb = "due" if options["dry_run"] else "deleted"
+        for task, count in counts.items():
+            self.stdout.write(f"{task}: {count} {verb} in {engine.batches[task]} batches")
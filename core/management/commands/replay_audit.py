@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.audit import replay_spill
+
+
+class Command(BaseCommand):
+    help = "Writes membership audit events spilled to disk while the database was unavailable."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", help="Spill file (default: PINGME_AUDIT_SPILL_PATH)")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Events per transaction")
+        parser.add_argument("--dry-run", action="store_true", help="Only count what is waiting")
+
+    def handle(self, *args, **options):
+        path = options["file"] or getattr(settings, "PINGME_AUDIT_SPILL_PATH", None)
+        if not path:
+            raise CommandError("No spill file: pass --file or set PINGME_AUDIT_SPILL_PATH")
+
+        count = replay_spill(
+            path,
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+            log=self.stdout.write if options["verbosity"] >= 2 else None,
+        )
+        verb = "waiting" if options["dry_run"] else "replayed"
+        self.stdout.write(f"{count} audit events {verb}")
@@ -0,0 +1,139 @@
+import uuid
+
+from django.contrib.auth.base_user import BaseUserManager
+from django.db import transaction
+from django.db.models import Q
+
+from core.access import membership_index
+from core.audit import audit_log
+from core.models import RoomMember, User
+from core.versions import user_versions
+
+
+# ---------------------------------------------------------------------
+# BULK MEMBERSHIP CHANGES
+# ---------------------------------------------------------------------
+
+def _resolve(emails, user_ids):
+    """
+    Maps each requested entry to a user id with one IN query. Returns
+    ``(key, value, user_id)`` in request order; user_id is None for
+    unknown or malformed entries.
+    """
+    entries = []
+    wanted_emails, wanted_ids = set(), set()
+    for email in emails:
+        email = BaseUserManager.normalize_email(str(email).strip())
+        entries.append(("email", email))
+        wanted_emails.add(email)
+    for raw in user_ids:
+        try:
+            uid = uuid.UUID(str(raw))
+        except ValueError:
+            entries.append(("user_id", str(raw)))
+            continue
+        entries.append(("user_id", uid))
+        wanted_ids.add(uid)
+
+    by_email, known_ids = {}, set()
+    users = User.objects.filter(Q(email__in=wanted_emails) | Q(id__in=wanted_ids))
+    for uid, email in users.values_list("id", "email"):
+        by_email[email] = uid
+        known_ids.add(uid)
+
+    resolved = []
+    for key, value in entries:
+        if key == "email":
+            uid = by_email.get(value)
+        else:
+            uid = value if value in known_ids else None
+        resolved.append((key, str(value), uid))
+    return resolved
+
+
+def _unique_ids(entries):
+    return list(dict.fromkeys(uid for _, _, uid in entries if uid is not None))
+
+
+def _outcome(key, value, status):
+    return {key: value, "status": status}
+
+
+def bulk_add_members(room, actor, emails=(), user_ids=()):
+    """
+    Adds users (by email or id) to ``room`` with one RoomMember
+    ``bulk_create`` and queues an "invite" audit event for each. Returns
+    ``(results, added_ids)``; results hold one outcome per entry, in
+    request order.
+    """
+    entries = _resolve(emails, user_ids)
+    found = _unique_ids(entries)
+
+    with transaction.atomic():
+        existing = set(
+            RoomMember.objects.filter(room=room, user_id__in=found).values_list("user_id", flat=True)
+        )
+        new_ids = [uid for uid in found if uid not in existing]
+        RoomMember.objects.bulk_create(
+            [RoomMember(room=room, user_id=uid) for uid in new_ids],
+            ignore_conflicts=True,
+        )
+    audit_log.record_many(room.id, new_ids, "invite", actor_id=actor.id)
+
+    # bulk_create sends no post_save, so bump room list versions and
+    # drop cached memberships here
+    for uid in new_ids:
+        user_versions.bump(uid)
+        membership_index.invalidate(uid)
+
+    results, seen = [], set()
+    for key, value, uid in entries:
+        if uid is None:
+            status = "not_found"
+        elif uid in existing or uid in seen:
+            status = "already_member"
+        else:
+            status = "added"
+            seen.add(uid)
+        results.append(_outcome(key, value, status))
+    return results, new_ids
+
+
+def bulk_remove_members(room, actor, emails=(), user_ids=()):
+    """
+    Removes users (by email or id) from ``room`` with one delete and
+    queues a "kick" audit event for each. The owner is never removed.
+    Returns ``(results, removed_ids)`` like ``bulk_add_members``; the
+    caller sends the one ``members_changed`` event.
+    """
+    entries = _resolve(emails, user_ids)
+    found = [uid for uid in _unique_ids(entries) if uid != room.owner_id]
+
+    with transaction.atomic():
+        members = set(
+            RoomMember.objects.filter(room=room, user_id__in=found).values_list("user_id", flat=True)
+        )
+        removed_ids = [uid for uid in found if uid in members]
+        # Raw delete: post_delete would send one membership_revoked per row
+        RoomMember.objects.filter(room=room, user_id__in=removed_ids)._raw_delete(RoomMember.objects.db)
+    audit_log.record_many(room.id, removed_ids, "kick", actor_id=actor.id)
+
+    # No signals either, so bump room list versions and drop cached
+    # memberships here
+    for uid in removed_ids:
+        user_versions.bump(uid)
+        membership_index.invalidate(uid)
+
+    results, seen = [], set()
+    for key, value, uid in entries:
+        if uid is None:
+            status = "not_found"
+        elif uid == room.owner_id:
+            status = "is_owner"
+        elif uid not in members or uid in seen:
+            status = "not_member"
+        else:
+            status = "removed"
+            seen.add(uid)
+        results.append(_outcome(key, value, status))
+    return results, removed_ids
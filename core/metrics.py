@@ -0,0 +1,22 @@
+import threading
+from collections import Counter
+
+# Per-process counters; cheap enough to bump on the hot path
+_counters = Counter()
+_lock = threading.Lock()
+
+
+def incr(name, amount=1):
+    with _lock:
+        _counters[name] += amount
+
+
+def snapshot():
+    """Copy of all counters, e.g. for the staff metrics endpoint."""
+    with _lock:
+        return dict(_counters)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
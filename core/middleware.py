@@ -1,40 +1,161 @@
-from urllib.parse import parse_qs
-from django.contrib.auth import get_user_model
+import asyncio
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import HASH_SESSION_KEY, SESSION_KEY, get_user_model
 from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth.signals import user_logged_out
 from django.contrib.sessions.models import Session
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 from channels.middleware import BaseMiddleware
 
 User = get_user_model()
 
 
+# ---------------------------------------------------------------------
+# SESSION → USER CACHE
+# ---------------------------------------------------------------------
+
+class SessionUserCache:
+    """
+    Bounded LRU of session key → user with a TTL per entry.
+    Misses for the same key share a single lookup.
+    """
+
+    def __init__(self, max_size=10000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session_key):
+        entry = self._entries.get(session_key)
+        if entry is None:
+            return None
+
+        user, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[session_key]
+            return None
+
+        self._entries.move_to_end(session_key)
+        return user
+
+    def set(self, session_key, user):
+        self._entries[session_key] = (user, time.monotonic() + self.ttl)
+        self._entries.move_to_end(session_key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def evict(self, session_key):
+        self._entries.pop(session_key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    async def resolve(self, session_key, loader):
+        """Returns the cached user or awaits ``loader(session_key)`` once."""
+        user = self.get(session_key)
+        if user is not None:
+            self.hits += 1
+            return user
+
+        self.misses += 1
+        pending = self._inflight.get(session_key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        pending = asyncio.ensure_future(loader(session_key))
+        self._inflight[session_key] = pending
+        try:
+            user = await pending
+        finally:
+            self._inflight.pop(session_key, None)
+
+        self.set(session_key, user)
+        return user
+
+
+session_cache = SessionUserCache(
+    max_size=getattr(settings, "PINGME_SESSION_CACHE_SIZE", 10000),
+    ttl=getattr(settings, "PINGME_SESSION_CACHE_TTL", 60),
+)
+
+
+@receiver(user_logged_out)
+def evict_logged_out_session(sender, request, **kwargs):
+    session = getattr(request, "session", None)
+    if session is not None and session.session_key:
+        session_cache.evict(session.session_key)
+
+
+async def load_session_user(session_key):
+    """Async ORM lookup of the user behind a session key."""
+    session = await Session.objects.filter(
+        session_key=session_key,
+        expire_date__gt=timezone.now(),
+    ).afirst()
+    if session is None:
+        return AnonymousUser()
+
+    data = session.get_decoded()
+    uid = data.get(SESSION_KEY)
+    if uid is None:
+        return AnonymousUser()
+
+    try:
+        user = await User.objects.aget(id=uid, is_active=True)
+    except (User.DoesNotExist, ValueError):
+        return AnonymousUser()
+
+    # Same check Django does: a password change invalidates old sessions
+    session_hash = data.get(HASH_SESSION_KEY)
+    if not session_hash or not constant_time_compare(
+        session_hash, user.get_session_auth_hash()
+    ):
+        return AnonymousUser()
+
+    return user
+
+
+# ---------------------------------------------------------------------
+# WEBSOCKET AUTH MIDDLEWARE
+# ---------------------------------------------------------------------
+
 class SessionAuthMiddleware(BaseMiddleware):
     """
     Custom middleware that extracts sessionid from cookies,
     loads the Django user, and attaches it to scope["user"].
+    Lookups go through the async ORM and are cached per session key.
     """
 
+    def __init__(self, inner, cache=None):
+        super().__init__(inner)
+        self.cache = cache or session_cache
+
     async def __call__(self, scope, receive, send):
+        scope = dict(scope)
         headers = dict(scope.get("headers", []))
         cookies = {}
 
         # Extract Cookie header
         if b"cookie" in headers:
-            cookie_header = headers[b"cookie"].decode()
+            cookie_header = headers[b"cookie"].decode("latin1")
             for part in cookie_header.split(";"):
                 if "=" in part:
                     k, v = part.strip().split("=", 1)
                     cookies[k] = v
 
-        session_key = cookies.get("sessionid")
+        session_key = cookies.get(settings.SESSION_COOKIE_NAME)
 
         # Load user from session
         if session_key:
-            try:
-                session = Session.objects.get(session_key=session_key)
-                uid = session.get_decoded().get("_auth_user_id")
-                scope["user"] = User.objects.get(id=uid)
-            except Exception:
-                scope["user"] = AnonymousUser()
+            scope["user"] = await self.cache.resolve(session_key, load_session_user)
         else:
             scope["user"] = AnonymousUser()
 
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:04
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_remove_roommember_role_roommember_is_admin'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
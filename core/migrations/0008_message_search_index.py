@@ -0,0 +1,96 @@
+from django.db import OperationalError, migrations
+
+# The schema is frozen here rather than imported from core.search, so
+# later edits to that module cannot change what this migration does.
+
+INSTALL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS core_message_fts USING fts5(
+        content,
+        message_id UNINDEXED,
+        room_id UNINDEXED,
+        user_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TABLE IF NOT EXISTS core_message_fts_map (
+        message_id char(32) PRIMARY KEY,
+        fts_rowid integer NOT NULL
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS core_message_fts_ai AFTER INSERT ON core_message BEGIN
+        INSERT INTO core_message_fts(content, message_id, room_id, user_id)
+            VALUES (NEW.content, NEW.id, NEW.room_id, NEW.user_id);
+        INSERT INTO core_message_fts_map(message_id, fts_rowid)
+            VALUES (NEW.id, last_insert_rowid());
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_message_fts_ad AFTER DELETE ON core_message BEGIN
+        DELETE FROM core_message_fts WHERE rowid =
+            (SELECT fts_rowid FROM core_message_fts_map WHERE message_id = OLD.id);
+        DELETE FROM core_message_fts_map WHERE message_id = OLD.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_message_fts_au AFTER UPDATE OF content, user_id ON core_message BEGIN
+        UPDATE core_message_fts SET content = NEW.content, user_id = NEW.user_id WHERE rowid =
+            (SELECT fts_rowid FROM core_message_fts_map WHERE message_id = NEW.id);
+    END""",
+]
+
+UNINSTALL = [
+    "DROP TRIGGER IF EXISTS core_message_fts_ai",
+    "DROP TRIGGER IF EXISTS core_message_fts_ad",
+    "DROP TRIGGER IF EXISTS core_message_fts_au",
+    "DROP TABLE IF EXISTS core_message_fts_map",
+    "DROP TABLE IF EXISTS core_message_fts",
+]
+
+
+def backfill(cursor, batch_size=10000):
+    while True:
+        cursor.execute(
+            """SELECT m.id, m.content, m.room_id, m.user_id FROM core_message m
+                LEFT JOIN core_message_fts_map f ON f.message_id = m.id
+                WHERE f.message_id IS NULL LIMIT %s""",
+            [batch_size],
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        for msg_id, content, room_id, user_id in rows:
+            cursor.execute(
+                "INSERT INTO core_message_fts(content, message_id, room_id, user_id) "
+                "VALUES (%s, %s, %s, %s)",
+                [content, msg_id, room_id, user_id],
+            )
+            cursor.execute(
+                "INSERT INTO core_message_fts_map(message_id, fts_rowid) VALUES (%s, %s)",
+                [msg_id, cursor.lastrowid],
+            )
+
+
+def install_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            for sql in INSTALL:
+                cursor.execute(sql)
+        except OperationalError:
+            # SQLite built without FTS5: search falls back to LIKE
+            return
+        backfill(cursor)
+
+
+def uninstall_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in UNINSTALL:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_message_created_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_fts, uninstall_fts),
+    ]
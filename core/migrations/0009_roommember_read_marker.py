@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_message_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roommember',
+            name='last_read_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='roommember',
+            name='last_read_id',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='roommember',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_room_last_message'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageArchiveBlock',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('day', models.DateField()),
+                ('first_created', models.DateTimeField()),
+                ('last_created', models.DateTimeField()),
+                ('message_count', models.PositiveIntegerField()),
+                ('payload', models.BinaryField()),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archive_blocks', to='core.room')),
+            ],
+            options={
+                'unique_together': {('room', 'day')},
+            },
+        ),
+    ]
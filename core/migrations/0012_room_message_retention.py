@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_message_archive_block'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='message_retention_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
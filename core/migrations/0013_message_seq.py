@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:42
+
+from django.db import migrations, models
+
+
+def number_messages(apps, schema_editor):
+    """Numbers existing messages 1..n per room, oldest first."""
+    Room = apps.get_model("core", "Room")
+    Message = apps.get_model("core", "Message")
+    # Lists, not iterator(): SQLite cursors do not tolerate writes to
+    # the table being read
+    for room_id in list(Room.objects.values_list("id", flat=True)):
+        seq = 0
+        batch = []
+        ids = Message.objects.filter(room_id=room_id).order_by("created", "id").values_list("id", flat=True)
+        for msg_id in list(ids):
+            seq += 1
+            batch.append(Message(id=msg_id, seq=seq))
+            if len(batch) == 5000:
+                Message.objects.bulk_update(batch, ["seq"])
+                batch = []
+        Message.objects.bulk_update(batch, ["seq"])
+        Room.objects.filter(id=room_id).update(last_seq=seq)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_room_message_retention'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='last_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(number_messages, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('room', 'seq'), name='uniq_message_room_seq'),
+        ),
+    ]
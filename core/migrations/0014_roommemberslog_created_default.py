@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:49
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_message_seq'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='roommemberslog',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
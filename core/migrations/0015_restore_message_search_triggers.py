@@ -0,0 +1,78 @@
+from django.db import migrations
+
+# 0013 adds a unique constraint to core_message, which SQLite applies by
+# rebuilding the table, and that drops the FTS5 triggers from 0008.
+# Reinstall them (frozen copy), index messages written since, and drop
+# index rows for messages deleted since.
+
+TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS core_message_fts_ai AFTER INSERT ON core_message BEGIN
+        INSERT INTO core_message_fts(content, message_id, room_id, user_id)
+            VALUES (NEW.content, NEW.id, NEW.room_id, NEW.user_id);
+        INSERT INTO core_message_fts_map(message_id, fts_rowid)
+            VALUES (NEW.id, last_insert_rowid());
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_message_fts_ad AFTER DELETE ON core_message BEGIN
+        DELETE FROM core_message_fts WHERE rowid =
+            (SELECT fts_rowid FROM core_message_fts_map WHERE message_id = OLD.id);
+        DELETE FROM core_message_fts_map WHERE message_id = OLD.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS core_message_fts_au AFTER UPDATE OF content, user_id ON core_message BEGIN
+        UPDATE core_message_fts SET content = NEW.content, user_id = NEW.user_id WHERE rowid =
+            (SELECT fts_rowid FROM core_message_fts_map WHERE message_id = NEW.id);
+    END""",
+]
+
+PRUNE = [
+    """DELETE FROM core_message_fts WHERE rowid IN (
+        SELECT f.fts_rowid FROM core_message_fts_map f
+        LEFT JOIN core_message m ON m.id = f.message_id
+        WHERE m.id IS NULL)""",
+    """DELETE FROM core_message_fts_map WHERE message_id NOT IN (SELECT id FROM core_message)""",
+]
+
+
+def backfill(cursor, batch_size=10000):
+    while True:
+        cursor.execute(
+            """SELECT m.id, m.content, m.room_id, m.user_id FROM core_message m
+                LEFT JOIN core_message_fts_map f ON f.message_id = m.id
+                WHERE f.message_id IS NULL LIMIT %s""",
+            [batch_size],
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        for msg_id, content, room_id, user_id in rows:
+            cursor.execute(
+                "INSERT INTO core_message_fts(content, message_id, room_id, user_id) "
+                "VALUES (%s, %s, %s, %s)",
+                [content, msg_id, room_id, user_id],
+            )
+            cursor.execute(
+                "INSERT INTO core_message_fts_map(message_id, fts_rowid) VALUES (%s, %s)",
+                [msg_id, cursor.lastrowid],
+            )
+
+
+def restore_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'core_message_fts'")
+        if cursor.fetchone() is None:
+            return  # built without FTS5; search uses LIKE
+        for sql in PRUNE + TRIGGERS:
+            cursor.execute(sql)
+        backfill(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_roommemberslog_created_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_triggers, migrations.RunPython.noop),
+    ]
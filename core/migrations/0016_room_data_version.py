@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_restore_message_search_triggers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='data_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -1,5 +1,6 @@
 import uuid
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 
 
@@ -57,6 +58,23 @@ class Room(models.Model):
     )
     created = models.DateTimeField(auto_now_add=True)
 
+    # Snapshot of the newest message, kept by core.activity so room
+    # lists can sort and preview without touching core_message
+    last_message_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    last_message_id = models.UUIDField(null=True, blank=True)
+    last_message_user = models.CharField(max_length=200, blank=True, default="")
+    last_message_preview = models.CharField(max_length=140, blank=True, default="")
+
+    # Overrides PINGME_RETENTION_MESSAGE_DAYS for this room (core.retention)
+    message_retention_days = models.PositiveIntegerField(null=True, blank=True)
+
+    # Highest Message.seq handed out in this room (core.sequence)
+    last_seq = models.PositiveBigIntegerField(default=0)
+
+    # Bumped by bulk rewrites that skip the message signals (retention,
+    # archiving, backfills), so every server process sees them
+    data_version = models.PositiveBigIntegerField(default=0)
+
     def __str__(self):
         return self.name
 
@@ -75,13 +93,21 @@ class Message(models.Model):
         related_name="messages"
     )
     content = models.TextField()
-    created = models.DateTimeField(auto_now_add=True)
+    # default instead of auto_now_add so write-behind batches keep the
+    # timestamp assigned when the message was broadcast
+    created = models.DateTimeField(default=timezone.now, editable=False)
+    # Per-room and increasing; assigned on insert, or at broadcast for
+    # write-behind messages (core.sequence)
+    seq = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
 
     class Meta:
         indexes = [
             models.Index(fields=["room", "-created"]),
             models.Index(fields=["user", "-created"]),
         ]
+        constraints = [
+            models.UniqueConstraint(fields=["room", "seq"], name="uniq_message_room_seq"),
+        ]
         ordering = ["-created"]
 
     def __str__(self):
@@ -103,6 +129,11 @@ class RoomMember(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="rooms_joined")
     joined_at = models.DateTimeField(auto_now_add=True)
     is_admin = models.BooleanField(default=False)
+    # Read marker and the number of messages from others after it, kept
+    # current by core.unread so room lists never count messages
+    last_read_at = models.DateTimeField(default=timezone.now)
+    last_read_id = models.UUIDField(null=True, blank=True)
+    unread_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         unique_together = ("room", "user")
@@ -144,7 +175,9 @@ class RoomMembersLog(models.Model):
         related_name="membership_actions"
     )
 
-    created = models.DateTimeField(auto_now_add=True)
+    # default instead of auto_now_add so buffered rows (core.audit) keep
+    # the time of the event, not of the flush
+    created = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         ordering = ["-created"]
@@ -152,3 +185,26 @@ class RoomMembersLog(models.Model):
     def __str__(self):
         username = self.user.name if self.user else "Unknown"
         return f"{username} {self.event_type} {self.room.name}"
+
+
+# ---------------------------------------------------------------------
+# 6️⃣ MESSAGE ARCHIVE (cold history, one compressed block per room-day)
+# ---------------------------------------------------------------------
+
+class MessageArchiveBlock(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name="archive_blocks")
+    day = models.DateField()
+    # Range covered, so readers can skip blocks without decoding them
+    first_created = models.DateTimeField()
+    last_created = models.DateTimeField()
+    message_count = models.PositiveIntegerField()
+    # zlib-compressed msgpack rows, see core.archive
+    payload = models.BinaryField()
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("room", "day")
+
+    def __str__(self):
+        return f"{self.room_id} {self.day} ({self.message_count} messages)"
@@ -0,0 +1,114 @@
+import asyncio
+import time
+from collections import deque
+
+from core import metrics
+from core.wire import join_json_frames, join_msgpack_frames
+
+
+# ---------------------------------------------------------------------
+# PER-CONNECTION OUTBOUND QUEUE
+# ---------------------------------------------------------------------
+
+class ConnectionOutbox:
+    """
+    Bounded queue of encoded frames for one WebSocket, drained by its
+    own writer task so a slow client never blocks the consumer.
+
+    When full, the oldest frame is dropped. Once a connection has
+    dropped more than ``drop_limit`` frames, ``on_overflow`` is called
+    so the consumer can tell the client to resync.
+
+    With a coalescing window, frames that arrive within the window (up
+    to ``max_batch``) go out together as one array frame.
+    """
+
+    def __init__(self, send, binary=False, max_frames=256, drop_limit=512,
+                 coalesce_window=0, max_batch=32, delay_warn=1.0,
+                 on_overflow=None):
+        self._send = send
+        self.binary = binary
+        self.max_frames = max_frames
+        self.drop_limit = drop_limit
+        self.coalesce_window = coalesce_window
+        self.max_batch = max_batch if coalesce_window else 1
+        self.delay_warn = delay_warn
+        self.on_overflow = on_overflow
+
+        self._frames = deque()
+        self._ready = asyncio.Event()
+        self._task = None
+        self.dropped = 0
+        self.delayed = 0
+        self.overflowed = False
+
+    def put(self, frame):
+        """Queues an encoded frame without waiting on the client."""
+        if self.overflowed:
+            return
+
+        if len(self._frames) >= self.max_frames:
+            self._frames.popleft()
+            self.dropped += 1
+            metrics.incr("outbox.dropped")
+            if self.dropped > self.drop_limit:
+                self.overflowed = True
+                self._frames.clear()
+                metrics.incr("outbox.overflowed")
+                if self.on_overflow is not None:
+                    asyncio.ensure_future(self.on_overflow())
+                return
+
+        self._frames.append((time.monotonic(), frame))
+        self._ready.set()
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._drain())
+
+    def __len__(self):
+        return len(self._frames)
+
+    async def _drain(self):
+        while True:
+            if not self._frames:
+                self._ready.clear()
+                await self._ready.wait()
+
+            if self.coalesce_window and len(self._frames) < self.max_batch:
+                await asyncio.sleep(self.coalesce_window)
+
+            batch = []
+            while self._frames and len(batch) < self.max_batch:
+                batch.append(self._frames.popleft())
+            if not batch:
+                continue
+
+            # Time spent queued beyond the coalescing window
+            now = time.monotonic()
+            late = sum(1 for queued_at, _ in batch
+                       if now - queued_at - self.coalesce_window > self.delay_warn)
+            if late:
+                self.delayed += late
+                metrics.incr("outbox.delayed", late)
+
+            await self._send_batch([frame for _, frame in batch])
+            metrics.incr("outbox.sent_frames")
+
+    async def _send_batch(self, frames):
+        if len(frames) == 1:
+            frame = frames[0]
+        elif self.binary:
+            frame = join_msgpack_frames(frames)
+        else:
+            frame = join_json_frames(frames)
+
+        if self.binary:
+            await self._send(bytes_data=frame)
+        else:
+            await self._send(text_data=frame)
+
+    def close(self):
+        """Stops the writer; anything still queued is discarded."""
+        self._frames.clear()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,121 @@
+import base64
+import uuid
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+# ---------------------------------------------------------------------
+# OPAQUE CURSORS  (created, id)
+# ---------------------------------------------------------------------
+
+def encode_cursor(created, msg_id):
+    raw = f"{created.isoformat()}|{msg_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Returns ``(created, id)`` or raises InvalidCursor."""
+    # WebSocket frames can carry any JSON type here
+    if not isinstance(token, str):
+        raise InvalidCursor(token)
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        created_str, id_str = raw.split("|", 1)
+        created = parse_datetime(created_str)
+        msg_id = uuid.UUID(id_str)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(token)
+    # Stored timestamps are aware; a naive one cannot be compared
+    if created is None or created.tzinfo is None:
+        raise InvalidCursor(token)
+    return created, msg_id
+
+
+def page_size(value):
+    """Clamps a requested page size to PINGME_PAGE_SIZE_MAX."""
+    default = getattr(settings, "PINGME_PAGE_SIZE_DEFAULT", 50)
+    maximum = getattr(settings, "PINGME_PAGE_SIZE_MAX", 200)
+    try:
+        size = int(value) if value not in (None, "") else default
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, maximum))
+
+
+# ---------------------------------------------------------------------
+# KEYSET PAGINATION OVER (room, -created)
+# ---------------------------------------------------------------------
+
+def row_cursor(row):
+    """Cursor for a Message instance or a ``values()`` row."""
+    if isinstance(row, dict):
+        return encode_cursor(row["created"], row["id"])
+    return encode_cursor(row.created, row.id)
+
+
+class MessagePage:
+    """One page of messages, oldest first."""
+
+    def __init__(self, messages, has_more, direction, after=None):
+        self.messages = messages
+        self.has_more = has_more
+        self.direction = direction
+        self._after = after
+
+    @property
+    def before_cursor(self):
+        """Cursor for the next older page, or None if there is none."""
+        if not self.messages:
+            return None
+        if self.direction == "before" and not self.has_more:
+            return None
+        return row_cursor(self.messages[0])
+
+    @property
+    def after_cursor(self):
+        """Cursor for anything newer than this page (for polling)."""
+        if not self.messages:
+            return self._after
+        return row_cursor(self.messages[-1])
+
+    def as_dict(self, serialize):
+        return {
+            "messages": [serialize(m) for m in self.messages],
+            "before": self.before_cursor,
+            "after": self.after_cursor,
+            "has_more": self.has_more,
+        }
+
+
+def paginate_messages(queryset, before=None, after=None, limit=50):
+    """
+    Keyset page of ``queryset`` (already filtered to one room).
+
+    ``before`` walks back from a cursor, ``after`` forward from one;
+    with neither, the newest ``limit`` messages are returned. Ties on
+    ``created`` are broken by ``id``.
+    """
+    if after:
+        created, msg_id = decode_cursor(after)
+        rows = list(
+            queryset.filter(Q(created__gt=created) | Q(created=created, id__gt=msg_id))
+            .order_by("created", "id")[:limit + 1]
+        )
+        has_more = len(rows) > limit
+        return MessagePage(rows[:limit], has_more, "after", after=after)
+
+    if before:
+        created, msg_id = decode_cursor(before)
+        queryset = queryset.filter(Q(created__lt=created) | Q(created=created, id__lt=msg_id))
+
+    rows = list(queryset.order_by("-created", "-id")[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    rows.reverse()
+    return MessagePage(rows, has_more, "before")
@@ -0,0 +1,203 @@
+import asyncio
+import atexit
+import logging
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from core import metrics
+from core.activity import record_room_activity
+from core.db import db_write
+from core.models import Message
+from core.sequence import sequence_blocks
+from core.unread import record_new_messages
+from core.versions import room_versions
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------
+# WRITE-BEHIND MESSAGE QUEUE
+# ---------------------------------------------------------------------
+
+class QueueFull(Exception):
+    """The queue is still at ``max_pending`` after a flush; nothing was queued."""
+
+
+class MessageWriteQueue:
+    """
+    Per-process write-behind buffer for chat messages.
+
+    Messages get their id and timestamp here, go back to the consumer
+    for broadcast straight away, and are written later with
+    ``bulk_create`` once the batch is full or the flush interval ends.
+    At most ``max_pending`` messages are held: ``put`` raises
+    ``QueueFull`` beyond that, and retried batches drop their oldest
+    rows rather than grow past it.
+    """
+
+    def __init__(self, batch_size=200, flush_interval=0.05, max_pending=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = []
+        self._loop = None
+        self._task = None
+
+    # -----------------------------------------------------------------
+    # Producer side
+    # -----------------------------------------------------------------
+    async def put(self, room_id, user, content):
+        """Queues a message and returns the unsaved ``Message``."""
+        self._ensure_flusher()
+
+        # Writer fell behind: make the sender wait for one flush
+        if len(self._pending) >= self.max_pending:
+            await self.flush()
+            if len(self._pending) >= self.max_pending:
+                metrics.incr("write_behind.rejected")
+                raise QueueFull()
+
+        seq = await sequence_blocks.next(room_id)
+        msg = Message(
+            id=uuid.uuid4(),
+            room_id=room_id,
+            user=user,
+            content=content,
+            created=timezone.now(),
+            seq=seq,
+        )
+        self._pending.append(msg)
+        self._has_items.set()
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+        return msg
+
+    def __len__(self):
+        return len(self._pending)
+
+    def pending_for(self, room_id):
+        """Queued, not yet written messages for one room."""
+        room_id = str(room_id)
+        return [m for m in self._pending if str(m.room_id) == room_id]
+
+    # -----------------------------------------------------------------
+    # Flushing
+    # -----------------------------------------------------------------
+    def _ensure_flusher(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._task and not self._task.done():
+            return
+        self._loop = loop
+        self._has_items = asyncio.Event()
+        self._full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        if self._pending:
+            self._has_items.set()
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self._has_items.wait()
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed")
+                await asyncio.sleep(self.flush_interval)
+
+    async def flush(self):
+        """Writes everything queued so far. Flushes never overlap."""
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            self._has_items.clear()
+            self._full.clear()
+            if batch:
+                failed = await db_write(self._write)(batch)
+                if failed:
+                    self._requeue(failed)
+
+    def _requeue(self, failed):
+        # Keep the original order ahead of anything newer
+        self._pending[:0] = failed
+        self._has_items.set()
+        over = len(self._pending) - self.max_pending
+        if over > 0:
+            del self._pending[:over]
+            metrics.incr("write_behind.dropped", over)
+            logger.error("Dropped %d unsaved messages (queue full)", over)
+
+    def flush_sync(self):
+        """Blocking flush used at interpreter shutdown."""
+        batch, self._pending = self._pending, []
+        if batch:
+            failed = self._write(batch)
+            if failed:
+                logger.error("Dropped %d unsaved messages on shutdown", len(failed))
+
+    @staticmethod
+    def _write(batch):
+        """
+        Inserts ``batch`` one room at a time, oldest first.
+        Returns the messages that should be retried.
+        """
+        by_room = {}
+        for msg in batch:
+            by_room.setdefault(msg.room_id, []).append(msg)
+
+        failed = []
+        for room_id, msgs in by_room.items():
+            try:
+                MessageWriteQueue._insert(room_id, msgs)
+            except IntegrityError:
+                # Some row's room or user is gone: write the rest one by one
+                dropped = 0
+                for msg in msgs:
+                    try:
+                        MessageWriteQueue._insert(room_id, [msg])
+                    except IntegrityError:
+                        dropped += 1
+                metrics.incr("write_behind.dropped", dropped)
+                logger.warning("Dropped %d messages for room %s", dropped, room_id)
+            except Exception:
+                logger.exception("Could not write messages for room %s", room_id)
+                failed.extend(msgs)
+        return failed
+
+    @staticmethod
+    def _insert(room_id, msgs):
+        with transaction.atomic():
+            Message.objects.bulk_create(msgs)
+            record_room_activity(room_id, msgs)
+            record_new_messages(room_id, msgs)
+            # The bump at queue time came before these rows were
+            # readable; without this, ETags from that window 304
+            transaction.on_commit(lambda: room_versions.bump(room_id))
+
+
+_queue = None
+
+
+def pending_messages(room_id):
+    """Unwritten messages for a room (empty unless write-behind is in use)."""
+    if _queue is None:
+        return []
+    return _queue.pending_for(room_id)
+
+
+def get_message_queue():
+    """Returns the process-wide queue, built from settings on first use."""
+    global _queue
+    if _queue is None:
+        _queue = MessageWriteQueue(
+            batch_size=getattr(settings, "PINGME_WRITE_BEHIND_BATCH_SIZE", 200),
+            flush_interval=getattr(settings, "PINGME_WRITE_BEHIND_FLUSH_INTERVAL", 0.05),
+            max_pending=getattr(settings, "PINGME_WRITE_BEHIND_MAX_PENDING", 10000),
+        )
+        atexit.register(_queue.flush_sync)
+    return _queue
@@ -0,0 +1,151 @@
+import asyncio
+import threading
+import time
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from core import metrics
+from core.events import room_group_name
+from core.wire import encode_json, encode_msgpack
+
+
+# ---------------------------------------------------------------------
+# PRESENCE INDEX (per process)
+# ---------------------------------------------------------------------
+
+class _Presence:
+    __slots__ = ("name", "channels", "typing_until")
+
+    def __init__(self, name):
+        self.name = name
+        self.channels = {}  # channel_name -> last heartbeat (monotonic)
+        self.typing_until = 0.0
+
+
+class PresenceIndex:
+    """
+    Who is online (and typing) in each room, fed by ChatConsumer.
+
+    A user is online while at least one of their sockets has been seen
+    within ``ttl`` seconds. Changes mark the room dirty; dirty rooms get
+    at most one presence broadcast per ``interval``.
+    """
+
+    def __init__(self, interval=1.0, ttl=60, typing_ttl=5):
+        self.interval = interval
+        self.ttl = ttl
+        self.typing_ttl = typing_ttl
+        self._rooms = {}
+        self._lock = threading.Lock()
+        self._scheduled = {}
+
+    # -----------------------------------------------------------------
+    # Updates (called from consumers)
+    # -----------------------------------------------------------------
+    def join(self, room_id, user_id, name, channel_name):
+        room_id, user_id = str(room_id), str(user_id)
+        with self._lock:
+            entry = self._rooms.setdefault(room_id, {}).get(user_id)
+            if entry is None:
+                entry = self._rooms[room_id][user_id] = _Presence(name)
+            entry.channels[channel_name] = time.monotonic()
+        self._mark_dirty(room_id)
+
+    def leave(self, room_id, user_id, channel_name):
+        room_id, user_id = str(room_id), str(user_id)
+        with self._lock:
+            users = self._rooms.get(room_id, {})
+            entry = users.get(user_id)
+            if entry is None:
+                return
+            entry.channels.pop(channel_name, None)
+            if entry.channels:
+                return
+            del users[user_id]
+            if not users:
+                self._rooms.pop(room_id, None)
+        self._mark_dirty(room_id)
+
+    def heartbeat(self, room_id, user_id, channel_name):
+        with self._lock:
+            entry = self._rooms.get(str(room_id), {}).get(str(user_id))
+            if entry is not None:
+                entry.channels[channel_name] = time.monotonic()
+
+    def typing(self, room_id, user_id, active=True):
+        room_id, user_id = str(room_id), str(user_id)
+        with self._lock:
+            entry = self._rooms.get(room_id, {}).get(user_id)
+            if entry is None:
+                return
+            was_typing = entry.typing_until > time.monotonic()
+            entry.typing_until = time.monotonic() + self.typing_ttl if active else 0.0
+
+        # Repeated keystrokes while already typing change nothing
+        if active != was_typing:
+            self._mark_dirty(room_id)
+
+    # -----------------------------------------------------------------
+    # Reads (safe from sync views)
+    # -----------------------------------------------------------------
+    def online_user_ids(self, room_id):
+        cutoff = time.monotonic() - self.ttl
+        with self._lock:
+            users = self._rooms.get(str(room_id), {})
+            return {
+                uid for uid, entry in users.items()
+                if any(seen > cutoff for seen in entry.channels.values())
+            }
+
+    def is_online(self, room_id, user_id):
+        return str(user_id) in self.online_user_ids(room_id)
+
+    def snapshot(self, room_id):
+        now = time.monotonic()
+        cutoff = now - self.ttl
+        online, typing = [], []
+        with self._lock:
+            for uid, entry in self._rooms.get(str(room_id), {}).items():
+                if not any(seen > cutoff for seen in entry.channels.values()):
+                    continue
+                online.append({"id": uid, "name": entry.name})
+                if entry.typing_until > now:
+                    typing.append({"id": uid, "name": entry.name})
+        return {"type": "presence", "online": online, "typing": typing}
+
+    # -----------------------------------------------------------------
+    # Coalesced broadcasts
+    # -----------------------------------------------------------------
+    def _mark_dirty(self, room_id):
+        if room_id in self._scheduled:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._scheduled[room_id] = loop.create_task(self._broadcast_later(room_id))
+
+    async def _broadcast_later(self, room_id):
+        try:
+            await asyncio.sleep(self.interval)
+        finally:
+            self._scheduled.pop(room_id, None)
+
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        payload = self.snapshot(room_id)
+        metrics.incr("presence.broadcasts")
+        await channel_layer.group_send(room_group_name(room_id), {
+            "type": "presence_update",
+            "text": encode_json(payload),
+            "bytes": encode_msgpack(payload),
+        })
+
+
+presence = PresenceIndex(
+    interval=getattr(settings, "PINGME_PRESENCE_INTERVAL_MS", 1000) / 1000,
+    ttl=getattr(settings, "PINGME_PRESENCE_TTL", 60),
+    typing_ttl=getattr(settings, "PINGME_TYPING_TTL", 5),
+)
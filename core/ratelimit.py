@@ -0,0 +1,102 @@
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from core import metrics
+
+
+# ---------------------------------------------------------------------
+# TOKEN BUCKETS (per process)
+# ---------------------------------------------------------------------
+
+class TokenBucketLimiter:
+    """
+    One token bucket per key, refilled lazily on access.
+    Idle buckets are evicted LRU-first once ``max_keys`` is reached.
+    """
+
+    def __init__(self, burst, rate, max_keys=100000):
+        self.burst = float(burst)
+        self.rate = float(rate)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, last refill]
+
+    def _bucket(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        return bucket
+
+    def peek(self, key, now=None):
+        """Seconds until ``key`` has a token (0 if it has one now)."""
+        now = time.monotonic() if now is None else now
+        tokens = self._bucket(key, now)[0]
+        if tokens >= 1:
+            return 0.0
+        return (1 - tokens) / self.rate if self.rate else float("inf")
+
+    def consume(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        self._bucket(key, now)[0] -= 1
+
+    def take(self, key, now=None):
+        """Consumes a token if there is one: 0, else seconds to wait."""
+        now = time.monotonic() if now is None else now
+        wait = self.peek(key, now)
+        if not wait:
+            self.consume(key, now)
+        return wait
+
+
+class MessageRateLimiter:
+    """Per-user and per-room limits for chat sends."""
+
+    def __init__(self, user_burst=20, user_rate=5, room_burst=200, room_rate=50):
+        self.users = TokenBucketLimiter(user_burst, user_rate)
+        self.rooms = TokenBucketLimiter(room_burst, room_rate)
+
+    def check(self, user_id, room_id):
+        """
+        Takes one token from both buckets if both have one.
+        Returns ``(None, 0)`` when allowed, else ``(scope, retry_after)``.
+        """
+        now = time.monotonic()
+        for scope, limiter, key in (
+            ("user", self.users, str(user_id)),
+            ("room", self.rooms, str(room_id)),
+        ):
+            wait = limiter.peek(key, now)
+            if wait:
+                metrics.incr(f"ratelimit.throttled.{scope}")
+                return scope, wait
+
+        self.users.consume(str(user_id), now)
+        self.rooms.consume(str(room_id), now)
+        return None, 0
+
+
+message_limiter = MessageRateLimiter(
+    user_burst=getattr(settings, "PINGME_RATE_USER_BURST", 20),
+    user_rate=getattr(settings, "PINGME_RATE_USER_PER_SEC", 5),
+    room_burst=getattr(settings, "PINGME_RATE_ROOM_BURST", 200),
+    room_rate=getattr(settings, "PINGME_RATE_ROOM_PER_SEC", 50),
+)
+
+# Per user: history frames each read up to a page of rows
+history_limiter = TokenBucketLimiter(
+    getattr(settings, "PINGME_RATE_HISTORY_BURST", 10),
+    getattr(settings, "PINGME_RATE_HISTORY_PER_SEC", 2),
+)
+
+# Per user: heartbeat, typing and read frames (dropped when over)
+control_limiter = TokenBucketLimiter(
+    getattr(settings, "PINGME_RATE_CONTROL_BURST", 30),
+    getattr(settings, "PINGME_RATE_CONTROL_PER_SEC", 10),
+)
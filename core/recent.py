@@ -0,0 +1,137 @@
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from django.conf import settings
+
+from core import metrics
+from core.pagination import MessagePage, decode_cursor, encode_cursor
+
+
+# ---------------------------------------------------------------------
+# PER-ROOM RECENT HISTORY (per process)
+# ---------------------------------------------------------------------
+
+class _RoomBuffer:
+    __slots__ = ("rows", "keys", "ids", "complete", "version")
+
+    def __init__(self, rows, complete, version):
+        self.rows = rows  # core.history message rows, oldest first
+        self.keys = [(r["created"], r["id"]) for r in rows]
+        self.ids = {r["id"] for r in rows}
+        # True when the buffer holds the room's entire history
+        self.complete = complete
+        # Room.data_version the rows were loaded at
+        self.version = version
+
+
+class RecentHistory:
+    """
+    Ring buffer of the newest ``size`` messages for each active room,
+    in the same row shape as ``core.history.message_rows``.
+
+    Rooms are warmed lazily from the DB, kept current by message writes
+    and evicted least-recently-used past ``max_rooms``. ``page`` answers
+    from memory when the requested page lies inside the buffer and
+    returns None otherwise. A buffer loaded at an older ``data_version``
+    than the caller's (a purge or archive run elsewhere) is dropped.
+    """
+
+    def __init__(self, size=200, max_rooms=1000):
+        self.size = size
+        self.max_rooms = max_rooms
+        self._rooms = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, room_id):
+        return str(room_id) in self._rooms
+
+    def warm(self, room_id, rows, complete, version=0):
+        """Seeds a room with its newest rows (oldest first)."""
+        rows = sorted(rows, key=lambda r: (r["created"], r["id"]))[-self.size:]
+        with self._lock:
+            self._rooms[str(room_id)] = _RoomBuffer(rows, complete, version)
+            self._rooms.move_to_end(str(room_id))
+            while len(self._rooms) > self.max_rooms:
+                self._rooms.popitem(last=False)
+                metrics.incr("recent.evicted")
+
+    def append(self, room_id, row):
+        """Adds a new message to a warm room; cold rooms are skipped."""
+        with self._lock:
+            buf = self._rooms.get(str(room_id))
+            if buf is None or row["id"] in buf.ids:
+                return
+
+            key = (row["created"], row["id"])
+            pos = bisect_right(buf.keys, key)
+            buf.keys.insert(pos, key)
+            buf.rows.insert(pos, row)
+            buf.ids.add(row["id"])
+
+            if len(buf.rows) > self.size:
+                buf.keys.pop(0)
+                buf.ids.discard(buf.rows.pop(0)["id"])
+                buf.complete = False
+
+    def invalidate(self, room_id):
+        with self._lock:
+            self._rooms.pop(str(room_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+
+    def cursor_for(self, room_id, msg_id):
+        """Cursor of a buffered message, or None if it is not buffered."""
+        with self._lock:
+            buf = self._rooms.get(str(room_id))
+            if buf is None or msg_id not in buf.ids:
+                return None
+            for created, key_id in reversed(buf.keys):
+                if key_id == msg_id:
+                    return encode_cursor(created, key_id)
+        return None
+
+    def page(self, room_id, before=None, after=None, limit=50, version=0):
+        """A MessagePage from memory, or None on a miss."""
+        page = self._page(room_id, before, after, limit, version)
+        metrics.incr("recent.hit" if page is not None else "recent.miss")
+        return page
+
+    def _page(self, room_id, before, after, limit, version):
+        # Decode outside the lock; InvalidCursor propagates to the caller
+        after_key = decode_cursor(after) if after else None
+        before_key = decode_cursor(before) if before else None
+
+        with self._lock:
+            buf = self._rooms.get(str(room_id))
+            if buf is None:
+                return None
+            if buf.version != version:
+                del self._rooms[str(room_id)]
+                metrics.incr("recent.stale")
+                return None
+            self._rooms.move_to_end(str(room_id))
+
+            if after_key is not None:
+                # Only safe if the cursor is not older than our window
+                if not buf.complete and (not buf.keys or after_key < buf.keys[0]):
+                    return None
+                newer = buf.rows[bisect_right(buf.keys, after_key):]
+                return MessagePage(newer[:limit], len(newer) > limit, "after", after=after)
+
+            older = buf.rows
+            if before_key is not None:
+                older = buf.rows[:bisect_left(buf.keys, before_key)]
+            if len(older) < limit and not buf.complete:
+                return None
+
+            has_more = len(older) > limit or not buf.complete
+            return MessagePage(older[-limit:], has_more, "before")
+
+
+recent_history = RecentHistory(
+    size=getattr(settings, "PINGME_RECENT_BUFFER_SIZE", 200),
+    max_rooms=getattr(settings, "PINGME_RECENT_BUFFER_ROOMS", 1000),
+)
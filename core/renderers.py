@@ -0,0 +1,42 @@
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, not in requirements.txt
+    orjson = None
+
+
+# ---------------------------------------------------------------------
+# PLUGGABLE JSON ENCODERS
+# ---------------------------------------------------------------------
+
+def stdlib_dumps(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+
+
+def orjson_dumps(data):
+    return orjson.dumps(data, default=DjangoJSONEncoder().default)
+
+
+def _default_dumps():
+    path = getattr(settings, "PINGME_JSON_ENCODER", None)
+    if path:
+        return import_string(path)
+    return orjson_dumps if orjson is not None else stdlib_dumps
+
+
+dumps = _default_dumps()
+
+
+def json_response(data, status=200, **kwargs):
+    """
+    Drop-in for JsonResponse that encodes through ``dumps``
+    (orjson when installed, stdlib json otherwise).
+    """
+    kwargs.setdefault("content_type", "application/json")
+    return HttpResponse(dumps(data), status=status, **kwargs)
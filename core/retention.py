@@ -0,0 +1,183 @@
+import json
+import logging
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from core.activity import refresh_room_activity
+from core.models import Message, MessageArchiveBlock, Room, RoomMembersLog
+from core.unread import recount_room
+from core.versions import data_rewritten
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------
+# RESUMABLE PROGRESS
+# ---------------------------------------------------------------------
+
+class Checkpoint:
+    """Task -> last finished key, kept in memory (and a JSON file if given)."""
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self._state = {}
+        if self.path and self.path.exists():
+            self._state = json.loads(self.path.read_text())
+
+    def get(self, task):
+        return self._state.get(task)
+
+    def set(self, task, key):
+        self._state[task] = key
+        self._save()
+
+    def clear(self, task):
+        self._state.pop(task, None)
+        self._save()
+
+    def _save(self):
+        if self.path:
+            self.path.write_text(json.dumps(self._state))
+
+
+# ---------------------------------------------------------------------
+# RETENTION ENGINE
+# ---------------------------------------------------------------------
+
+def _raw_delete(model, pks):
+    # Straight DELETE ... WHERE pk IN: no collector, no per-row signals
+    model.objects.filter(pk__in=pks)._raw_delete(model.objects.db)
+
+
+class RetentionEngine:
+    """
+    Deletes expired chat data in small keyset-ordered batches, one short
+    transaction each with a pause in between, so chat writes are not
+    held off the SQLite lock for long. Every batch is chosen by the
+    policy itself, so an interrupted run can simply be started again;
+    the checkpoint only saves re-scanning rooms that are already done.
+
+    Each message batch bumps the room's stored ``data_version`` in the
+    same transaction, so running servers (this process or another) stop
+    serving purged rows from their buffers and ETags. Totals go to the
+    log, since a command's in-process metrics die with it.
+    """
+
+    TASKS = ("messages", "member_logs", "sessions")
+
+    def __init__(self, batch_size=None, pause=None, dry_run=False, checkpoint=None, log=None):
+        self.batch_size = batch_size or getattr(settings, "PINGME_RETENTION_BATCH_SIZE", 1000)
+        if pause is None:
+            pause = getattr(settings, "PINGME_RETENTION_PAUSE_MS", 50) / 1000
+        self.pause = pause
+        self.dry_run = dry_run
+        self.checkpoint = checkpoint or Checkpoint()
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+        self.counts = {}
+        self.batches = {}
+
+    def run(self, tasks=TASKS):
+        """Runs ``tasks`` in order; returns {task: rows deleted (or due)}."""
+        for task in tasks:
+            self.counts[task] = 0
+            self.batches[task] = 0
+            getattr(self, f"purge_{task}")()
+            self.checkpoint.clear(task)
+            logger.info(
+                "Retention %s: %d %s in %d batches", task, self.counts[task],
+                "due" if self.dry_run else "deleted", self.batches[task],
+            )
+        return self.counts
+
+    # -----------------------------------------------------------------
+    # Batching
+    # -----------------------------------------------------------------
+    def _drain(self, task, model, queryset, on_batch=None):
+        """
+        Deletes every row of ``queryset`` (already ordered by the keyset
+        column) ``batch_size`` primary keys at a time. ``on_batch`` runs
+        inside each batch's transaction.
+        """
+        if self.dry_run:
+            due = queryset.count()
+            self.counts[task] += due
+            return due
+
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                pks = list(queryset.values_list("pk", flat=True)[:self.batch_size])
+                if not pks:
+                    return deleted
+                _raw_delete(model, pks)
+                if on_batch is not None:
+                    on_batch()
+            deleted += len(pks)
+            self.counts[task] += len(pks)
+            self.batches[task] += 1
+            self.log(f"{task}: {self.counts[task]} deleted")
+            time.sleep(self.pause)
+
+    # -----------------------------------------------------------------
+    # Policies
+    # -----------------------------------------------------------------
+    def message_policies(self, after=None):
+        """(room id, days) for every room with a message policy, by id."""
+        default = getattr(settings, "PINGME_RETENTION_MESSAGE_DAYS", None)
+        rooms = Room.objects.order_by("id")
+        if default is None:
+            rooms = rooms.filter(message_retention_days__isnull=False)
+        if after is not None:
+            rooms = rooms.filter(id__gt=after)
+        for room_id, days in rooms.values_list("id", "message_retention_days"):
+            yield room_id, days if days is not None else default
+
+    def purge_messages(self):
+        for room_id, days in self.message_policies(after=self.checkpoint.get("messages")):
+            cutoff = self.now - timedelta(days=days)
+
+            hot = Message.objects.filter(room_id=room_id, created__lt=cutoff).order_by("created", "id")
+            deleted = self._drain("messages", Message, hot, on_batch=lambda: data_rewritten([room_id]))
+
+            # Archived days go whole, once all of the day is past the cutoff
+            blocks = MessageArchiveBlock.objects.filter(room_id=room_id, last_created__lt=cutoff)
+            if self.dry_run:
+                self.counts["messages"] += blocks.aggregate(n=Sum("message_count"))["n"] or 0
+            else:
+                for block in blocks.order_by("day").only("id", "message_count").iterator():
+                    with transaction.atomic():
+                        _raw_delete(MessageArchiveBlock, [block.id])
+                        data_rewritten([room_id])
+                    self.counts["messages"] += block.message_count
+                    self.batches["messages"] += 1
+                    time.sleep(self.pause)
+
+            # Raw deletes skip the signals that keep these in step; bump
+            # again so room lists cached meanwhile are not kept
+            if deleted:
+                with transaction.atomic():
+                    refresh_room_activity(Room.objects.filter(id=room_id))
+                    recount_room(room_id)
+                    data_rewritten([room_id])
+            self.checkpoint.set("messages", str(room_id))
+
+    def purge_member_logs(self):
+        days = getattr(settings, "PINGME_RETENTION_MEMBER_LOG_DAYS", None)
+        if days is None:
+            return
+        cutoff = self.now - timedelta(days=days)
+        logs = RoomMembersLog.objects.filter(created__lt=cutoff).order_by("id")
+        self._drain("member_logs", RoomMembersLog, logs)
+
+    def purge_sessions(self):
+        # Same rows as clearsessions, without one giant DELETE
+        expired = Session.objects.filter(expire_date__lt=self.now).order_by("expire_date")
+        self._drain("sessions", Session, expired)
@@ -0,0 +1,245 @@
+import re
+import uuid
+
+from django.conf import settings
+from django.db import OperationalError, connection
+from django.utils.module_loading import import_string
+
+from core.history import MESSAGE_COLUMNS, serialize_message
+from core.models import Message
+
+FTS_TABLE = "core_message_fts"
+FTS_MAP_TABLE = "core_message_fts_map"
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+# ---------------------------------------------------------------------
+# SCHEMA (installed by migration 0008 on SQLite)
+# Migrations keep their own frozen copy of this SQL. Any migration that
+# makes SQLite rebuild core_message (constraints, field alterations)
+# drops these triggers and has to reinstall them.
+# ---------------------------------------------------------------------
+
+# Standalone FTS5 table plus a message id -> FTS rowid map (so deletes
+# are a key lookup), kept in sync by triggers so bulk_create, raw
+# deletes and cascades all count. core_message has no INTEGER PRIMARY
+# KEY, so its own rowid is not stable across VACUUM and cannot be used.
+SQLITE_INSTALL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        content,
+        message_id UNINDEXED,
+        room_id UNINDEXED,
+        user_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TABLE IF NOT EXISTS {FTS_MAP_TABLE} (
+        message_id char(32) PRIMARY KEY,
+        fts_rowid integer NOT NULL
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS core_message_fts_ai AFTER INSERT ON core_message BEGIN
+        INSERT INTO {FTS_TABLE}(content, message_id, room_id, user_id)
+            VALUES (NEW.content, NEW.id, NEW.room_id, NEW.user_id);
+        INSERT INTO {FTS_MAP_TABLE}(message_id, fts_rowid)
+            VALUES (NEW.id, last_insert_rowid());
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS core_message_fts_ad AFTER DELETE ON core_message BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid =
+            (SELECT fts_rowid FROM {FTS_MAP_TABLE} WHERE message_id = OLD.id);
+        DELETE FROM {FTS_MAP_TABLE} WHERE message_id = OLD.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS core_message_fts_au AFTER UPDATE OF content, user_id ON core_message BEGIN
+        UPDATE {FTS_TABLE} SET content = NEW.content, user_id = NEW.user_id WHERE rowid =
+            (SELECT fts_rowid FROM {FTS_MAP_TABLE} WHERE message_id = NEW.id);
+    END""",
+]
+
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS core_message_fts_ai",
+    "DROP TRIGGER IF EXISTS core_message_fts_ad",
+    "DROP TRIGGER IF EXISTS core_message_fts_au",
+    f"DROP TABLE IF EXISTS {FTS_MAP_TABLE}",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def sqlite_backfill(cursor, batch_size=10000):
+    """Indexes every message not yet in the FTS table."""
+    while True:
+        cursor.execute(
+            f"""SELECT m.id, m.content, m.room_id, m.user_id FROM core_message m
+                LEFT JOIN {FTS_MAP_TABLE} f ON f.message_id = m.id
+                WHERE f.message_id IS NULL LIMIT %s""",
+            [batch_size],
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        for msg_id, content, room_id, user_id in rows:
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}(content, message_id, room_id, user_id) "
+                f"VALUES (%s, %s, %s, %s)",
+                [content, msg_id, room_id, user_id],
+            )
+            cursor.execute(
+                f"INSERT INTO {FTS_MAP_TABLE}(message_id, fts_rowid) VALUES (%s, %s)",
+                [msg_id, cursor.lastrowid],
+            )
+
+
+# ---------------------------------------------------------------------
+# BACKENDS
+# ---------------------------------------------------------------------
+
+class SearchResults:
+    def __init__(self, rows, offset, limit, has_more):
+        self.rows = rows
+        self.offset = offset
+        self.limit = limit
+        self.has_more = has_more
+
+    def as_dict(self):
+        return {
+            "results": self.rows,
+            "next_offset": self.offset + self.limit if self.has_more else None,
+        }
+
+
+class SearchBackend:
+    """
+    Ranked message search restricted to ``room_ids``.
+    Subclasses implement ``_ranked_ids``: [(message id, snippet)].
+    """
+
+    def search(self, query, room_ids, user_id=None, limit=20, offset=0):
+        if not query.strip() or not room_ids:
+            return SearchResults([], offset, limit, False)
+
+        hits = self._ranked_ids(query, room_ids, user_id, limit + 1, offset)
+        has_more = len(hits) > limit
+        hits = hits[:limit]
+
+        # One joined query for the message rows, then restore rank order
+        ids = [msg_id for msg_id, _ in hits]
+        rows = {
+            row["id"]: row
+            for row in Message.objects.filter(id__in=ids).values(*MESSAGE_COLUMNS, "room_id")
+        }
+        results = []
+        for msg_id, snippet in hits:
+            row = rows.get(msg_id)
+            if row is None:
+                continue
+            item = serialize_message(row)
+            item["room_id"] = str(row["room_id"])
+            item["snippet"] = snippet
+            results.append(item)
+        return SearchResults(results, offset, limit, has_more)
+
+    def _ranked_ids(self, query, room_ids, user_id, limit, offset):
+        raise NotImplementedError
+
+
+class LikeBackend(SearchBackend):
+    """Fallback for databases without a full-text index (unranked)."""
+
+    def _ranked_ids(self, query, room_ids, user_id, limit, offset):
+        qs = Message.objects.filter(room_id__in=room_ids)
+        for word in _WORD.findall(query):
+            qs = qs.filter(content__icontains=word)
+        if user_id:
+            qs = qs.filter(user_id=user_id)
+        ids = qs.order_by("-created").values_list("id", flat=True)[offset:offset + limit]
+        return [(msg_id, None) for msg_id in ids]
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """bm25-ranked search over the FTS5 shadow table."""
+
+    @staticmethod
+    def fts_query(query):
+        """
+        User input -> safe FTS5 query: every word quoted (implicit AND),
+        the last one as a prefix so partial words still match.
+        """
+        words = _WORD.findall(query)
+        if not words:
+            return None
+        terms = ['"%s"' % w.replace('"', '""') for w in words]
+        terms[-1] += "*"
+        return " ".join(terms)
+
+    def _ranked_ids(self, query, room_ids, user_id, limit, offset):
+        match = self.fts_query(query)
+        if match is None:
+            return []
+
+        room_keys = [uuid.UUID(str(r)).hex for r in room_ids]
+        sql = (
+            f"SELECT message_id, snippet({FTS_TABLE}, 0, '[', ']', '…', 12) "
+            f"FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s "
+            f"AND {FTS_TABLE}.room_id IN ({', '.join(['%s'] * len(room_keys))}) "
+        )
+        params = [match, *room_keys]
+        if user_id:
+            sql += f"AND {FTS_TABLE}.user_id = %s "
+            params.append(uuid.UUID(str(user_id)).hex)
+        sql += f"ORDER BY bm25({FTS_TABLE}) LIMIT %s OFFSET %s"
+        params += [limit, offset]
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [(uuid.UUID(msg_id), snippet) for msg_id, snippet in cursor.fetchall()]
+
+
+class PostgresBackend(SearchBackend):
+    """
+    Postgres full-text search via django.contrib.postgres. Computes the
+    vector per query; add a GIN index on to_tsvector(content) to scale.
+    """
+
+    def _ranked_ids(self, query, room_ids, user_id, limit, offset):
+        from django.contrib.postgres.search import (
+            SearchHeadline, SearchQuery, SearchRank, SearchVector,
+        )
+
+        search_query = SearchQuery(query, search_type="websearch")
+        qs = Message.objects.filter(room_id__in=room_ids).annotate(
+            rank=SearchRank(SearchVector("content"), search_query),
+            snippet=SearchHeadline("content", search_query, start_sel="[", stop_sel="]"),
+        ).filter(rank__gt=0)
+        if user_id:
+            qs = qs.filter(user_id=user_id)
+        rows = qs.order_by("-rank").values_list("id", "snippet")[offset:offset + limit]
+        return list(rows)
+
+
+def _fts5_installed():
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE]
+            )
+            return cursor.fetchone() is not None
+    except OperationalError:
+        return False
+
+
+_backend = None
+
+
+def get_search_backend():
+    """PINGME_SEARCH_BACKEND if set, else picked from the DB vendor."""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, "PINGME_SEARCH_BACKEND", None)
+        if path:
+            _backend = import_string(path)()
+        elif connection.vendor == "sqlite" and _fts5_installed():
+            _backend = SQLiteFTS5Backend()
+        elif connection.vendor == "postgresql":
+            _backend = PostgresBackend()
+        else:
+            _backend = LikeBackend()
+    return _backend
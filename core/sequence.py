@@ -0,0 +1,80 @@
+import asyncio
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from core.db import db_write
+from core.models import Room
+
+
+# ---------------------------------------------------------------------
+# PER-ROOM MESSAGE SEQUENCE NUMBERS
+# Room.last_seq is the source of truth; every number is handed out once.
+# ---------------------------------------------------------------------
+
+def allocate_seq(room_id, count=1):
+    """
+    Reserves ``count`` consecutive numbers for a room and returns the
+    first. The UPDATE takes the row (or, on SQLite, the database) write
+    lock before the read, so concurrent callers never overlap. Inside
+    an outer transaction the reservation commits or rolls back with it.
+    """
+    with transaction.atomic():
+        Room.objects.filter(id=room_id).update(last_seq=F("last_seq") + count)
+        last = Room.objects.filter(id=room_id).values_list("last_seq", flat=True).first()
+    if last is None:
+        raise Room.DoesNotExist(room_id)
+    return last - count + 1
+
+
+class SequenceBlocks:
+    """
+    Per-process blocks of reserved numbers for write-behind messages,
+    which are broadcast before they are stored. One DB round-trip per
+    ``block_size`` messages; numbers left over when the process exits
+    are skipped (a gap with no messages in it).
+    """
+
+    def __init__(self, block_size=100):
+        self.block_size = block_size
+        self._blocks = {}  # room_id -> [next, end)
+        self._lock = threading.Lock()
+        self._refills = {}
+
+    def _take(self, room_id):
+        with self._lock:
+            block = self._blocks.get(room_id)
+            if block is None or block[0] >= block[1]:
+                return None
+            seq = block[0]
+            block[0] += 1
+            return seq
+
+    async def next(self, room_id):
+        room_id = str(room_id)
+        while True:
+            seq = self._take(room_id)
+            if seq is not None:
+                return seq
+
+            # One refill per room at a time; other senders wait for it
+            refill = self._refills.get(room_id)
+            if refill is None:
+                refill = self._refills[room_id] = asyncio.ensure_future(self._refill(room_id))
+            try:
+                await asyncio.shield(refill)
+            finally:
+                if refill.done() and self._refills.get(room_id) is refill:
+                    del self._refills[room_id]
+
+    async def _refill(self, room_id):
+        first = await db_write(allocate_seq)(room_id, self.block_size)
+        with self._lock:
+            self._blocks[room_id] = [first, first + self.block_size]
+
+
+sequence_blocks = SequenceBlocks(
+    block_size=getattr(settings, "PINGME_SEQ_BLOCK_SIZE", 100),
+)
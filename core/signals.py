@@ -0,0 +1,136 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.access import membership_index
+from core.activity import record_room_activity, refresh_room_activity
+from core.events import notify_membership_revoked
+from core.history import row_from_message
+from core.models import Message, Room, RoomMember
+from core.recent import recent_history
+from core.sequence import allocate_seq
+from core.unread import record_new_messages, recount_room
+from core.versions import room_versions, user_versions
+
+
+# ---------------------------------------------------------------------
+# SEQUENCE NUMBERS
+# ---------------------------------------------------------------------
+
+# Write-behind batches (bulk_create) arrive with seq already set
+@receiver(pre_save, sender=Message)
+def message_numbered(sender, instance, **kwargs):
+    if instance.seq is None and instance._state.adding:
+        instance.seq = allocate_seq(instance.room_id)
+
+
+# ---------------------------------------------------------------------
+# RECENT-HISTORY BUFFER UPKEEP
+# ---------------------------------------------------------------------
+
+# All after commit: a reader on another connection must not get the new
+# ETag while it still sees the old rows, and a rollback must not leave
+# a phantom row in the buffer
+
+@receiver(post_save, sender=Message)
+def message_saved(sender, instance, created, **kwargs):
+    room_id = instance.room_id
+    row = row_from_message(instance) if created else None
+
+    def saved():
+        if row is not None:
+            recent_history.append(room_id, row)
+        else:
+            recent_history.invalidate(room_id)
+        room_versions.bump(room_id)
+
+    transaction.on_commit(saved)
+
+
+def _forget_room(room_id):
+    recent_history.invalidate(room_id)
+    room_versions.bump(room_id)
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, **kwargs):
+    room_id = instance.room_id
+    transaction.on_commit(lambda: _forget_room(room_id))
+
+
+@receiver(post_delete, sender=Room)
+def room_deleted(sender, instance, **kwargs):
+    room_id = instance.pk
+    transaction.on_commit(lambda: _forget_room(room_id))
+
+
+# ---------------------------------------------------------------------
+# UNREAD COUNTERS + ROOM ACTIVITY
+# ---------------------------------------------------------------------
+
+# Write-behind batches skip signals; persistence records those itself
+@receiver(post_save, sender=Message)
+def message_counted(sender, instance, created, **kwargs):
+    if created:
+        record_room_activity(instance.room_id, [instance])
+        record_new_messages(instance.room_id, [instance])
+
+
+_recounts = set()
+
+
+@receiver(post_delete, sender=Message)
+def message_uncounted(sender, instance, **kwargs):
+    # A cascade deletes many messages at once: recount each room once
+    room_id = instance.room_id
+    if room_id in _recounts:
+        return
+    _recounts.add(room_id)
+
+    def recount():
+        _recounts.discard(room_id)
+        refresh_room_activity(Room.objects.filter(id=room_id))
+        recount_room(room_id)
+
+    transaction.on_commit(recount)
+
+
+# ---------------------------------------------------------------------
+# ETAG VERSIONS FOR ROOM LISTS
+# ---------------------------------------------------------------------
+
+@receiver(post_save, sender=RoomMember)
+@receiver(post_delete, sender=RoomMember)
+def membership_changed(sender, instance, **kwargs):
+    user_versions.bump(instance.user_id)
+
+
+@receiver(post_save, sender=Room)
+def room_saved(sender, instance, created, **kwargs):
+    # A rename shows up in every member's room list
+    if created:
+        return
+    for user_id in RoomMember.objects.filter(room=instance).values_list("user_id", flat=True):
+        user_versions.bump(user_id)
+
+
+# ---------------------------------------------------------------------
+# MEMBERSHIP INDEX
+# ---------------------------------------------------------------------
+
+@receiver(post_save, sender=RoomMember)
+@receiver(post_delete, sender=RoomMember)
+def membership_index_changed(sender, instance, **kwargs):
+    # Again after commit: another thread may have re-read the old rows
+    # between this signal and the commit
+    user_id = instance.user_id
+    membership_index.invalidate(user_id)
+    transaction.on_commit(lambda: membership_index.invalidate(user_id))
+
+
+@receiver(post_delete, sender=RoomMember)
+def membership_deleted(sender, instance, **kwargs):
+    # Every removal path (views, bulk, admin, ORM, cascades) closes the
+    # user's sockets in the room, even ones that never send a frame
+    room_id, user_id = instance.room_id, instance.user_id
+    transaction.on_commit(lambda: notify_membership_revoked(room_id, user_id))
@@ -0,0 +1,160 @@
+// Minimal MessagePack codec for the pingme.msgpack wire format.
+// Served from our own static files so the chat page loads no third-party
+// script. Covers what the server sends and accepts (core/wire.py): nil,
+// booleans, integers, floats, str, bin, arrays and maps; ext types are
+// rejected. Exposes window.MessagePack.encode / .decode.
+(function () {
+  "use strict";
+
+  const textEncoder = new TextEncoder();
+  const textDecoder = new TextDecoder();
+
+  // -------------------------------------------------------------------
+  // Encoding
+  // -------------------------------------------------------------------
+  function Writer() {
+    this.buf = new Uint8Array(256);
+    this.view = new DataView(this.buf.buffer);
+    this.pos = 0;
+  }
+
+  Writer.prototype.reserve = function (n) {
+    if (this.pos + n <= this.buf.length) return;
+    let size = this.buf.length * 2;
+    while (size < this.pos + n) size *= 2;
+    const grown = new Uint8Array(size);
+    grown.set(this.buf.subarray(0, this.pos));
+    this.buf = grown;
+    this.view = new DataView(grown.buffer);
+  };
+
+  Writer.prototype.u8 = function (v) { this.reserve(1); this.view.setUint8(this.pos, v); this.pos += 1; };
+  Writer.prototype.u16 = function (v) { this.reserve(2); this.view.setUint16(this.pos, v); this.pos += 2; };
+  Writer.prototype.u32 = function (v) { this.reserve(4); this.view.setUint32(this.pos, v); this.pos += 4; };
+  Writer.prototype.bytes = function (b) { this.reserve(b.length); this.buf.set(b, this.pos); this.pos += b.length; };
+
+  Writer.prototype.int = function (v) {
+    if (v >= 0) {
+      if (v < 0x80) return this.u8(v);
+      if (v < 0x100) { this.u8(0xcc); return this.u8(v); }
+      if (v < 0x10000) { this.u8(0xcd); return this.u16(v); }
+      if (v < 0x100000000) { this.u8(0xce); return this.u32(v); }
+      this.u8(0xcf); this.reserve(8);
+      this.view.setBigUint64(this.pos, BigInt(v)); this.pos += 8;
+      return;
+    }
+    if (v >= -0x20) return this.u8(v & 0xff);
+    if (v >= -0x80) { this.u8(0xd0); this.reserve(1); this.view.setInt8(this.pos, v); this.pos += 1; return; }
+    if (v >= -0x8000) { this.u8(0xd1); this.reserve(2); this.view.setInt16(this.pos, v); this.pos += 2; return; }
+    if (v >= -0x80000000) { this.u8(0xd2); this.reserve(4); this.view.setInt32(this.pos, v); this.pos += 4; return; }
+    this.u8(0xd3); this.reserve(8);
+    this.view.setBigInt64(this.pos, BigInt(v)); this.pos += 8;
+  };
+
+  Writer.prototype.header = function (len, fix, fixMax, codes) {
+    if (fix !== null && len <= fixMax) return this.u8(fix | len);
+    if (codes[0] && len < 0x100) { this.u8(codes[0]); return this.u8(len); }
+    if (len < 0x10000) { this.u8(codes[1]); return this.u16(len); }
+    this.u8(codes[2]); this.u32(len);
+  };
+
+  Writer.prototype.value = function (v) {
+    if (v === null || v === undefined) return this.u8(0xc0);
+    if (v === false) return this.u8(0xc2);
+    if (v === true) return this.u8(0xc3);
+    if (typeof v === "number") {
+      if (Number.isSafeInteger(v)) return this.int(v);
+      this.u8(0xcb); this.reserve(8);
+      this.view.setFloat64(this.pos, v); this.pos += 8;
+      return;
+    }
+    if (typeof v === "string") {
+      const b = textEncoder.encode(v);
+      this.header(b.length, 0xa0, 31, [0xd9, 0xda, 0xdb]);
+      return this.bytes(b);
+    }
+    if (v instanceof Uint8Array) {
+      this.header(v.length, null, 0, [0xc4, 0xc5, 0xc6]);
+      return this.bytes(v);
+    }
+    if (Array.isArray(v)) {
+      this.header(v.length, 0x90, 15, [null, 0xdc, 0xdd]);
+      for (const item of v) this.value(item);
+      return;
+    }
+    if (typeof v === "object") {
+      const keys = Object.keys(v).filter((k) => v[k] !== undefined);
+      this.header(keys.length, 0x80, 15, [null, 0xde, 0xdf]);
+      for (const k of keys) { this.value(k); this.value(v[k]); }
+      return;
+    }
+    throw new TypeError("Cannot encode " + typeof v + " as MessagePack");
+  };
+
+  function encode(value) {
+    const w = new Writer();
+    w.value(value);
+    return w.buf.slice(0, w.pos);
+  }
+
+  // -------------------------------------------------------------------
+  // Decoding
+  // -------------------------------------------------------------------
+  function decode(bytes) {
+    const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+    let pos = 0;
+
+    function take(n) {
+      if (pos + n > bytes.length) throw new RangeError("Truncated MessagePack data");
+      const start = pos;
+      pos += n;
+      return start;
+    }
+    function str(n) { const at = take(n); return textDecoder.decode(bytes.subarray(at, at + n)); }
+    function bin(n) { const at = take(n); return bytes.slice(at, at + n); }
+    function array(n) { const out = new Array(n); for (let i = 0; i < n; i++) out[i] = value(); return out; }
+    function map(n) { const out = {}; for (let i = 0; i < n; i++) { const k = value(); out[k] = value(); } return out; }
+    function big(n) { return Number.isSafeInteger(Number(n)) ? Number(n) : n; }
+
+    function value() {
+      const b = view.getUint8(take(1));
+      if (b < 0x80) return b;
+      if (b < 0x90) return map(b & 0x0f);
+      if (b < 0xa0) return array(b & 0x0f);
+      if (b < 0xc0) return str(b & 0x1f);
+      if (b >= 0xe0) return b - 0x100;
+      switch (b) {
+        case 0xc0: return null;
+        case 0xc2: return false;
+        case 0xc3: return true;
+        case 0xc4: return bin(view.getUint8(take(1)));
+        case 0xc5: return bin(view.getUint16(take(2)));
+        case 0xc6: return bin(view.getUint32(take(4)));
+        case 0xca: return view.getFloat32(take(4));
+        case 0xcb: return view.getFloat64(take(8));
+        case 0xcc: return view.getUint8(take(1));
+        case 0xcd: return view.getUint16(take(2));
+        case 0xce: return view.getUint32(take(4));
+        case 0xcf: return big(view.getBigUint64(take(8)));
+        case 0xd0: return view.getInt8(take(1));
+        case 0xd1: return view.getInt16(take(2));
+        case 0xd2: return view.getInt32(take(4));
+        case 0xd3: return big(view.getBigInt64(take(8)));
+        case 0xd9: return str(view.getUint8(take(1)));
+        case 0xda: return str(view.getUint16(take(2)));
+        case 0xdb: return str(view.getUint32(take(4)));
+        case 0xdc: return array(view.getUint16(take(2)));
+        case 0xdd: return array(view.getUint32(take(4)));
+        case 0xde: return map(view.getUint16(take(2)));
+        case 0xdf: return map(view.getUint32(take(4)));
+      }
+      throw new TypeError("Unsupported MessagePack type 0x" + b.toString(16));
+    }
+
+    const result = value();
+    if (pos !== bytes.length) throw new RangeError("Trailing bytes after MessagePack value");
+    return result;
+  }
+
+  window.MessagePack = { encode: encode, decode: decode };
+})();
@@ -1,3 +1,1353 @@
-from django.test import TestCase
+import asyncio
+import base64
+import gzip
+import io
+import json
+import tempfile
+import uuid
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from core import metrics
+from core.access import MembershipIndex, membership_index
+from core.archive import archive_room, decode_block, encode_block
+from core.audit import AuditBuffer, audit_log
+from core.consumers import CLOSE_FORBIDDEN, CLOSE_NOT_FOUND, CLOSE_RESYNC, CLOSE_UNAUTHORIZED
+from core.events import room_group_name
+from core.history import history_page
+from core.membership import bulk_add_members, bulk_remove_members
+from core.middleware import SessionUserCache, load_session_user, session_cache
+from core.models import Message, MessageArchiveBlock, Room, RoomMember, RoomMembersLog, User
+from core.outbox import ConnectionOutbox
+from core.pagination import InvalidCursor, decode_cursor, encode_cursor
+from core.persistence import MessageWriteQueue, QueueFull
+from core.ratelimit import MessageRateLimiter, TokenBucketLimiter
+from core.recent import recent_history
+from core.retention import Checkpoint, RetentionEngine
+from core.routing import websocket_urlpatterns
+from core.sequence import SequenceBlocks, allocate_seq
+from core.unread import mark_read
+from core.versions import room_versions
+from core.wire import SUBPROTOCOL_MSGPACK, decode_frame, encode_json, encode_msgpack, join_msgpack_frames
+
+
+def make_user(email, name):
+    return User.objects.create(email=email, name=name, password="!")
+
+
+# ---------------------------------------------------------------------
+# MEMBERSHIP INDEX
+# ---------------------------------------------------------------------
+
+@mock.patch.object(audit_log, "buffered", False)
+class MembershipIndexTests(TestCase):
+
+    def setUp(self):
+        membership_index.clear()
+        self.owner = make_user("owner@example.com", "Owner")
+        self.guest = make_user("guest@example.com", "Guest")
+        self.room = Room.objects.create(name="r", owner=self.owner)
+        RoomMember.objects.create(room=self.room, user=self.owner, is_admin=True)
+        self.guest_key = str(self.guest.id)
+        self.room_key = str(self.room.id)
+
+    def test_hit_needs_no_query(self):
+        self.assertTrue(membership_index.is_member(self.owner.id, self.room.id))
+        with self.assertNumQueries(0):
+            self.assertTrue(membership_index.is_member(self.owner.id, self.room.id))
+            self.assertFalse(membership_index.is_member(self.owner.id, "not-a-room"))
+
+    def test_cached_never_queries(self):
+        with self.assertNumQueries(0):
+            self.assertIsNone(membership_index.cached(self.guest_key, self.room_key))
+        membership_index.rooms_for(self.guest.id)
+        self.assertFalse(membership_index.cached(self.guest_key, self.room_key))
+
+    def test_add_drops_cached_denial(self):
+        self.assertFalse(membership_index.is_member(self.guest.id, self.room.id))
+        RoomMember.objects.create(room=self.room, user=self.guest)
+        self.assertTrue(membership_index.is_member(self.guest.id, self.room.id))
+
+    def test_delete_drops_cached_membership(self):
+        RoomMember.objects.create(room=self.room, user=self.guest)
+        self.assertTrue(membership_index.is_member(self.guest.id, self.room.id))
+        RoomMember.objects.filter(room=self.room, user=self.guest).delete()
+        self.assertFalse(membership_index.is_member(self.guest.id, self.room.id))
+
+    def test_room_delete_cascades(self):
+        self.assertTrue(membership_index.is_member(self.owner.id, self.room.id))
+        self.room.delete()
+        self.assertFalse(membership_index.is_member(self.owner.id, self.room_key))
+
+    def test_bulk_changes_invalidate(self):
+        self.assertFalse(membership_index.is_member(self.guest.id, self.room.id))
+        bulk_add_members(self.room, self.owner, user_ids=[self.guest.id])
+        self.assertTrue(membership_index.is_member(self.guest.id, self.room.id))
+        bulk_remove_members(self.room, self.owner, user_ids=[self.guest.id])
+        self.assertFalse(membership_index.is_member(self.guest.id, self.room.id))
+
+    def test_bulk_remove_sends_one_event(self):
+        users = [make_user(f"u{n}@example.com", f"U{n}") for n in range(20)]
+        bulk_add_members(self.room, self.owner, user_ids=[u.id for u in users])
+        self.client.force_login(self.owner)
+        with mock.patch("core.events.notify_room") as notify:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(
+                    f"/api/rooms/{self.room.id}/members/bulk-remove/",
+                    json.dumps({"user_ids": [str(u.id) for u in users]}),
+                    content_type="application/json",
+                )
+        self.assertEqual([c.args[1]["type"] for c in notify.call_args_list], ["members_changed"])
+        self.assertEqual(len(notify.call_args_list[0].args[1]["removed"]), 20)
+
+    def test_load_racing_a_kick_is_not_stored(self):
+        RoomMember.objects.create(room=self.room, user=self.guest)
+
+        # The kick lands after the load has read its rows
+        def kick_after_read(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            membership_index.invalidate(self.guest.id)
+            return result
+
+        with connection.execute_wrapper(kick_after_read):
+            rooms = membership_index.rooms_for(self.guest.id)
+        self.assertIn(self.room_key, rooms)
+        self.assertIsNone(membership_index.get(self.guest_key))
+
+    def test_reread_before_commit_is_dropped_on_commit(self):
+        RoomMember.objects.create(room=self.room, user=self.guest)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RoomMember.objects.filter(room=self.room, user=self.guest).delete()
+            # Another thread re-reads the still-committed row meanwhile
+            version = membership_index._versions.get(self.guest_key)
+            membership_index._store(self.guest_key, frozenset([self.room_key]), version)
+            self.assertTrue(membership_index.cached(self.guest_key, self.room_key))
+
+        self.assertFalse(membership_index.is_member(self.guest.id, self.room.id))
+
+    def test_size_is_bounded(self):
+        index = MembershipIndex(max_size=1)
+        index.rooms_for(self.owner.id)
+        index.rooms_for(self.guest.id)
+        self.assertIsNone(index.get(str(self.owner.id)))
+        self.assertIsNotNone(index.get(self.guest_key))
+
+
+# ---------------------------------------------------------------------
+# HTTP AUTHORIZATION
+# ---------------------------------------------------------------------
+
+@mock.patch.object(audit_log, "buffered", False)
+class RoomAccessTests(TestCase):
+
+    def setUp(self):
+        membership_index.clear()
+        self.owner = make_user("owner@example.com", "Owner")
+        self.guest = make_user("guest@example.com", "Guest")
+        self.room = Room.objects.create(name="r", owner=self.owner)
+        RoomMember.objects.create(room=self.room, user=self.owner, is_admin=True)
+        Message.objects.create(room=self.room, user=self.owner, content="hello")
+
+    def get(self, user, name):
+        self.client.force_login(user)
+        return self.client.get(f"/api/rooms/{self.room.id}/{name}/")
+
+    def test_non_members_are_refused(self):
+        for name in ("messages", "members", "export", "search"):
+            self.assertEqual(self.get(self.guest, name).status_code, 403, name)
+            self.assertEqual(self.get(self.owner, name).status_code, 400 if name == "search" else 200, name)
+
+    def test_unknown_room_is_404(self):
+        self.client.force_login(self.guest)
+        response = self.client.get("/api/rooms/00000000-0000-0000-0000-000000000000/messages/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_add_then_kick(self):
+        self.assertEqual(self.get(self.guest, "messages").status_code, 403)
+
+        self.client.force_login(self.owner)
+        self.client.post(f"/api/rooms/{self.room.id}/add/", {"email": self.guest.email})
+        self.assertEqual(self.get(self.guest, "messages").status_code, 200)
+
+        self.client.force_login(self.owner)
+        self.client.post(f"/api/rooms/{self.room.id}/kick/", {"user_id": str(self.guest.id)})
+        self.assertEqual(self.get(self.guest, "messages").status_code, 403)
+
+    def test_leave(self):
+        RoomMember.objects.create(room=self.room, user=self.guest)
+        self.assertEqual(self.get(self.guest, "messages").status_code, 200)
+        self.client.post(f"/api/rooms/{self.room.id}/leave/")
+        self.assertEqual(self.get(self.guest, "messages").status_code, 403)
+
+    def test_etag_is_not_served_after_a_kick(self):
+        RoomMember.objects.create(room=self.room, user=self.guest)
+        etag = self.get(self.guest, "messages")["ETag"]
+        RoomMember.objects.filter(room=self.room, user=self.guest).delete()
+        response = self.client.get(f"/api/rooms/{self.room.id}/messages/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 403)
+
+    def test_search_everywhere_uses_current_rooms(self):
+        self.client.force_login(self.guest)
+        response = self.client.get("/api/search/?q=hello")
+        self.assertEqual(response.json()["results"], [])
+
+    def test_search_rejects_a_bad_user_filter(self):
+        self.client.force_login(self.owner)
+        for url in ("/api/search/", f"/api/rooms/{self.room.id}/search/"):
+            response = self.client.get(url, {"q": "hello", "user": "notauuid"})
+            self.assertEqual(response.status_code, 400, url)
+            self.assertEqual(response.json(), {"error": "Invalid user"})
+
+            response = self.client.get(url, {"q": "hello", "user": str(self.owner.id)})
+            self.assertEqual(len(response.json()["results"]), 1, url)
+
+
+# ---------------------------------------------------------------------
+# BULK MEMBERSHIP
+# ---------------------------------------------------------------------
+
+@mock.patch.object(audit_log, "buffered", False)
+class BulkMembershipTests(TestCase):
+
+    def setUp(self):
+        self.owner = make_user("owner@example.com", "Owner")
+        self.guest = make_user("guest@example.com", "Guest")
+        self.other = make_user("other@example.com", "Other")
+        self.room = Room.objects.create(name="r", owner=self.owner)
+        RoomMember.objects.create(room=self.room, user=self.owner, is_admin=True)
+        RoomMember.objects.create(room=self.room, user=self.guest)
+        self.client.force_login(self.owner)
+
+    def post(self, action, body):
+        if not isinstance(body, str):
+            body = json.dumps(body)
+        return self.client.post(
+            f"/api/rooms/{self.room.id}/members/bulk-{action}/", body, content_type="application/json",
+        )
+
+    def statuses(self, response):
+        return [entry["status"] for entry in response.json()["results"]]
+
+    def test_add_reports_each_entry(self):
+        response = self.post("add", {
+            "emails": ["other@EXAMPLE.com", "guest@example.com", "nobody@example.com"],
+            "user_ids": [str(self.other.id), "not-a-uuid"],
+        })
+        self.assertEqual(response.json()["added"], 1)
+        self.assertEqual(
+            self.statuses(response),
+            ["added", "already_member", "not_found", "already_member", "not_found"],
+        )
+        self.assertTrue(RoomMember.objects.filter(room=self.room, user=self.other).exists())
+
+    def test_remove_reports_each_entry(self):
+        response = self.post("remove", {
+            "user_ids": [str(self.guest.id), str(self.owner.id), str(self.other.id)],
+        })
+        self.assertEqual(response.json()["removed"], 1)
+        self.assertEqual(self.statuses(response), ["removed", "is_owner", "not_member"])
+        self.assertEqual(
+            list(RoomMember.objects.filter(room=self.room).values_list("user_id", flat=True)),
+            [self.owner.id],
+        )
+
+    def test_only_the_owner(self):
+        self.client.force_login(self.guest)
+        for action in ("add", "remove"):
+            response = self.post(action, {"user_ids": [str(self.other.id)]})
+            self.assertEqual(response.status_code, 403, action)
+
+    def test_malformed_bodies_are_400(self):
+        for body in ("[1]", '"x"', "nope", {}, {"emails": "a@b.c"}):
+            for action in ("add", "remove"):
+                self.assertEqual(self.post(action, body).status_code, 400, (action, body))
+
+    def test_entry_limit(self):
+        with self.settings(PINGME_BULK_MEMBERS_MAX=2):
+            response = self.post("add", {"emails": ["a@example.com", "b@example.com", "c@example.com"]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "At most 2 entries per request"})
+
+    def test_one_notification_per_request(self):
+        with mock.patch("core.events.notify_room") as notify:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.post("add", {"user_ids": [str(self.other.id)]})
+                self.post("remove", {"user_ids": [str(self.other.id), str(self.guest.id)]})
+        events = [call.args[1] for call in notify.call_args_list]
+        self.assertEqual(
+            [(e["type"], len(e["added"]), len(e["removed"])) for e in events],
+            [("members_changed", 1, 0), ("members_changed", 0, 2)],
+        )
+
+
+# ---------------------------------------------------------------------
+# WEBSOCKET AUTHORIZATION
+# ---------------------------------------------------------------------
+
+class ConsumerAccessTests(TransactionTestCase):
+
+    def setUp(self):
+        membership_index.clear()
+        self.owner = make_user("owner@example.com", "Owner")
+        self.guest = make_user("guest@example.com", "Guest")
+        self.room = Room.objects.create(name="r", owner=self.owner)
+        RoomMember.objects.create(room=self.room, user=self.owner, is_admin=True)
+        self.app = URLRouter(websocket_urlpatterns)
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(self.app, f"/ws/chat/{self.room.id}/")
+        communicator.scope["user"] = user
+        connected, code = await communicator.connect()
+        return communicator, connected, code
+
+    async def close_code(self, communicator):
+        # Skip presence and other frames until the socket closes
+        while True:
+            output = await communicator.receive_output(timeout=2)
+            if output["type"] == "websocket.close":
+                return output["code"]
+
+    async def test_non_member_is_refused(self):
+        # Accepted first, so the browser gets the code rather than 1006
+        communicator, connected, _ = await self.connect(self.guest)
+        self.assertTrue(connected)
+        self.assertEqual(await self.close_code(communicator), CLOSE_FORBIDDEN)
+
+    async def test_anonymous_and_unknown_room_are_refused(self):
+        communicator, _, _ = await self.connect(AnonymousUser())
+        self.assertEqual(await self.close_code(communicator), CLOSE_UNAUTHORIZED)
+
+        communicator = WebsocketCommunicator(self.app, f"/ws/chat/{uuid.uuid4()}/")
+        communicator.scope["user"] = self.owner
+        await communicator.connect()
+        self.assertEqual(await self.close_code(communicator), CLOSE_NOT_FOUND)
+
+    async def test_removal_without_event_stops_sends(self):
+        await database_sync_to_async(RoomMember.objects.create)(room=self.room, user=self.guest)
+        communicator, connected, _ = await self.connect(self.guest)
+        self.assertTrue(connected)
+
+        # Deleted outside the views: no membership_revoked event is sent
+        await database_sync_to_async(
+            lambda: RoomMember.objects.filter(room=self.room, user=self.guest).delete()
+        )()
+        await communicator.send_json_to({"type": "send", "message": "still here?"})
+
+        self.assertEqual(await self.close_code(communicator), CLOSE_FORBIDDEN)
+        stored = await database_sync_to_async(Message.objects.filter(room=self.room).count)()
+        self.assertEqual(stored, 0)
+        await communicator.disconnect()
+
+    async def test_removal_closes_a_listen_only_socket(self):
+        await database_sync_to_async(RoomMember.objects.create)(room=self.room, user=self.guest)
+        communicator, connected, _ = await self.connect(self.guest)
+        self.assertTrue(connected)
+
+        # The guest never sends a frame; the delete alone must close it
+        await database_sync_to_async(
+            lambda: RoomMember.objects.filter(room=self.room, user=self.guest).delete()
+        )()
+        self.assertEqual(await self.close_code(communicator), CLOSE_FORBIDDEN)
+        await communicator.disconnect()
+
+
+# ---------------------------------------------------------------------
+# CURSORS
+# ---------------------------------------------------------------------
+
+def naive_cursor(msg_id):
+    raw = f"2026-01-01T00:00:00|{msg_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+class CursorTests(TransactionTestCase):
+
+    def setUp(self):
+        membership_index.clear()
+        recent_history.clear()
+        self.owner = make_user("owner@example.com", "Owner")
+        self.room = Room.objects.create(name="r", owner=self.owner)
+        RoomMember.objects.create(room=self.room, user=self.owner, is_admin=True)
+        self.message = Message.objects.create(room=self.room, user=self.owner, content="hello")
+
+    def test_decode_rejects_naive_and_non_string_cursors(self):
+        for token in (naive_cursor(self.message.id), 5, {"a": 1}, None):
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(token)
+        self.assertEqual(decode_cursor(encode_cursor(self.message.created, self.message.id))[1], self.message.id)
+
+    def test_naive_cursor_is_a_400_on_a_buffered_room(self):
+        self.client.force_login(self.owner)
+        url = f"/api/rooms/{self.room.id}/messages/"
+        self.client.get(url)  # warms the recent-history buffer
+        self.assertIn(str(self.room.id), recent_history)
+        for param in ("before", "after"):
+            response = self.client.get(url, {param: naive_cursor(self.message.id)})
+            self.assertEqual(response.status_code, 400, param)
+
+    async def test_non_string_history_cursor_keeps_the_socket(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/chat/{self.room.id}/")
+        communicator.scope["user"] = self.owner
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        for before in (5, {"a": 1}):
+            await communicator.send_json_to({"type": "history", "before": before})
+            while True:
+                frame = await communicator.receive_json_from(timeout=2)
+                if frame.get("type") == "error":
+                    break
+            self.assertEqual(frame["code"], "invalid_cursor")
+
+        await communicator.send_json_to({"type": "history"})
+        while (await communicator.receive_json_from(timeout=2)).get("type") != "history":
+            pass
+        await communicator.disconnect()
+
+
+# ---------------------------------------------------------------------
+# MEMBERSHIP AUDIT LOG
+# ---------------------------------------------------------------------
+
+class AuditLogTests(TestCase):
+
+    def setUp(self):
+        self.owner = make_user("owner@example.com", "Owner")
+        self.guest = make_user("guest@example.com", "Guest")
+        self.room = Room.objects.create(name="r", owner=self.owner)
+        RoomMember.objects.create(room=self.room, user=self.owner, is_admin=True)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.spill = Path(tmp.name) / "audit.jsonl"
+
+    def buffer(self, **kwargs):
+        # The flusher thread sleeps for the whole test; flushes are explicit
+        return AuditBuffer(batch_size=100, flush_interval=3600, **kwargs)
+
+    def events(self):
+        return list(RoomMembersLog.objects.order_by("created").values_list("event_type", "user_id"))
+
+    def test_events_wait_for_a_flush(self):
+        buffer = self.buffer()
+        buffer.record(self.room.id, self.guest.id, "invite", actor_id=self.owner.id)
+        buffer.record_many(self.room.id, [self.guest.id], "kick", actor_id=self.owner.id)
+        self.assertEqual(self.events(), [])
+
+        with self.assertNumQueries(5):  # rooms, users, savepoint, insert, release
+            buffer.flush()
+        self.assertEqual(self.events(), [("invite", self.guest.id), ("kick", self.guest.id)])
+        self.assertEqual(len(buffer), 0)
+
+    def test_events_for_deleted_rooms_and_users_are_kept_safe(self):
+        buffer = self.buffer()
+        other = Room.objects.create(name="gone", owner=self.owner)
+        buffer.record(other.id, self.guest.id, "join")
+        buffer.record(self.room.id, self.guest.id, "join")
+        other.delete()
+        self.guest.delete()
+
+        buffer.flush()
+        self.assertEqual(self.events(), [("join", None)])
+
+    def test_locked_database_spills_and_replays(self):
+        buffer = self.buffer(spill_path=str(self.spill))
+        buffer.record_many(self.room.id, [self.owner.id, self.guest.id], "invite")
+        with mock.patch("core.audit.write_entries", side_effect=OperationalError("database is locked")):
+            buffer.flush()
+
+        self.assertEqual(len(self.spill.read_text().splitlines()), 2)
+        self.assertEqual(self.events(), [])
+
+        call_command("replay_audit", file=str(self.spill), stdout=io.StringIO())
+        self.assertEqual(len(self.events()), 2)
+        self.assertFalse(self.spill.exists())
+
+    def test_without_spill_file_events_are_retried(self):
+        buffer = self.buffer()
+        buffer.record(self.room.id, self.guest.id, "join")
+        with mock.patch("core.audit.write_entries", side_effect=OperationalError("database is locked")):
+            with self.assertRaises(OperationalError):
+                buffer.flush()
+        self.assertEqual(len(buffer), 1)
+
+        buffer.flush()
+        self.assertEqual(self.events(), [("join", self.guest.id)])
+
+    def test_interrupted_replay_resumes(self):
+        line = {
+            "room": str(self.room.id), "user": str(self.guest.id), "actor": None,
+            "event": "join", "created": "2026-01-01T00:00:00+00:00",
+        }
+        replaying = self.spill.with_name("audit.jsonl.replaying")
+        replaying.write_text("".join(json.dumps(line) + "\n" for _ in range(3)))
+        self.spill.with_name("audit.jsonl.state").write_text(json.dumps({"lines": 2}))
+
+        call_command("replay_audit", file=str(self.spill), stdout=io.StringIO())
+        self.assertEqual(len(self.events()), 1)
+
+    @mock.patch.object(audit_log, "buffered", False)
+    def test_membership_views_log(self):
+        self.client.force_login(self.owner)
+        self.client.post(f"/api/rooms/{self.room.id}/add/", {"email": self.guest.email})
+        self.client.force_login(self.guest)
+        self.client.post(f"/api/rooms/{self.room.id}/leave/")
+        self.assertEqual(self.events(), [("invite", self.guest.id), ("leave", self.guest.id)])
+
+
+# ---------------------------------------------------------------------
+# UNREAD COUNTS AND ROOM ACTIVITY
+# ---------------------------------------------------------------------
+
+class UnreadTests(TestCase):
+
+    def setUp(self):
+        self.owner = make_user("owner@example.com", "Owner")
+        self.guest = make_user("guest@example.com", "Guest")
+        self.room = Room.objects.create(name="r", owner=self.owner)
+        joined = timezone.now() - timedelta(minutes=1)
+        for user in (self.owner, self.guest):
+            RoomMember.objects.create(room=self.room, user=user, last_read_at=joined)
+
+    def send(self, user, content, room=None):
+        return Message.objects.create(room=room or self.room, user=user, content=content)
+
+    def member(self, user):
+        return RoomMember.objects.get(room=self.room, user=user)
+
+    def test_messages_count_for_everyone_but_the_sender(self):
+        self.send(self.owner, "a")
+        self.send(self.owner, "b")
+        self.send(self.guest, "c")
+        self.assertEqual(self.member(self.guest).unread_count, 2)
+        self.assertEqual(self.member(self.owner).unread_count, 1)
+
+    def test_mark_read_only_moves_forward(self):
+        first, second, _ = (self.send(self.owner, c) for c in "abc")
+
+        self.assertTrue(mark_read(self.room.id, self.guest.id, second.created, second.id))
+        member = self.member(self.guest)
+        self.assertEqual((member.unread_count, member.last_read_id), (1, second.id))
+
+        self.assertFalse(mark_read(self.room.id, self.guest.id, first.created, first.id))
+        member = self.member(self.guest)
+        self.assertEqual((member.unread_count, member.last_read_id), (1, second.id))
+
+    def test_room_list_is_most_recent_first_with_a_preview(self):
+        quiet = Room.objects.create(name="quiet", owner=self.owner)
+        other = Room.objects.create(name="other", owner=self.owner)
+        for room in (quiet, other):
+            RoomMember.objects.create(room=room, user=self.guest)
+        self.send(self.owner, "older", room=other)
+        self.send(self.owner, "x" * 200)
+
+        self.client.force_login(self.guest)
+        rooms = self.client.get("/api/rooms/list/").json()["rooms"]
+        self.assertEqual([r["name"] for r in rooms], ["r", "other", "quiet"])
+        self.assertEqual(rooms[0]["unread"], 1)
+        self.assertEqual(rooms[0]["last_message"]["user"], "Owner")
+        self.assertEqual(rooms[0]["last_message"]["preview"], "x" * 140)
+        self.assertIsNone(rooms[2]["last_message"])
+
+        self.send(self.owner, "newest", room=other)
+        rooms = self.client.get("/api/rooms/list/").json()["rooms"]
+        self.assertEqual([r["name"] for r in rooms], ["other", "r", "quiet"])
+        self.assertEqual(rooms[0]["last_message"]["preview"], "newest")
+
+
+# ---------------------------------------------------------------------
+# SEQUENCE NUMBERS
+# ---------------------------------------------------------------------
+
+class SequenceTests(TransactionTestCase):
+
+    def setUp(self):
+        self.owner = make_user("owner@example.com", "Owner")
+        self.room = Room.objects.create(name="r", owner=self.owner)
+        RoomMember.objects.create(room=self.room, user=self.owner, is_admin=True)
+        self.client.force_login(self.owner)
+
+    def send(self, content="hi", room=None):
+        return Message.objects.create(room=room or self.room, user=self.owner, content=content)
+
+    def after_seq(self, value, limit=50):
+        return self.client.get(f"/api/rooms/{self.room.id}/messages/", {"after_seq": value, "limit": limit})
+
+    def seqs(self, response):
+        return [m["seq"] for m in response.json()["messages"]]
+
+    def test_saved_messages_are_numbered_per_room(self):
+        other = Room.objects.create(name="other", owner=self.owner)
+        self.assertEqual([self.send().seq for _ in range(3)], [1, 2, 3])
+        self.assertEqual(self.send(room=other).seq, 1)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.last_seq, 3)
+
+    def test_allocate_reserves_a_range(self):
+        self.send()
+        self.assertEqual(allocate_seq(self.room.id, 5), 2)
+        self.assertEqual(self.send().seq, 7)
+
+    async def test_blocks_leave_a_gap_between_processes(self):
+        first, second = SequenceBlocks(block_size=4), SequenceBlocks(block_size=4)
+        self.assertEqual([await first.next(self.room.id) for _ in range(2)], [1, 2])
+        self.assertEqual(await second.next(self.room.id), 5)
+        self.assertEqual([await first.next(self.room.id) for _ in range(3)], [3, 4, 9])
+        self.assertEqual((await database_sync_to_async(self.send)()).seq, 13)
+
+    def test_after_seq_pages_in_order(self):
+        for n in range(5):
+            self.send(f"m{n}")
+        response = self.after_seq(1, limit=2)
+        self.assertEqual((self.seqs(response), response.json()["has_more"]), ([2, 3], True))
+        response = self.after_seq(3)
+        self.assertEqual((self.seqs(response), response.json()["has_more"]), ([4, 5], False))
+
+    def test_after_seq_skips_unused_block_numbers(self):
+        self.send()
+        allocate_seq(self.room.id, 4)  # a block nobody used
+        self.send()
+        self.assertEqual(self.seqs(self.after_seq(0)), [1, 6])
+
+    def test_after_seq_includes_unwritten_messages(self):
+        self.send()
+        queue = MessageWriteQueue()
+        queue._pending = [
+            Message(id=uuid.uuid4(), room_id=self.room.id, user=self.owner, content="queued",
+                    created=timezone.now(), seq=allocate_seq(self.room.id))
+        ]
+        self.send()
+        with mock.patch("core.persistence._queue", queue):
+            self.assertEqual(self.seqs(self.after_seq(0)), [1, 2, 3])
+
+    def test_after_seq_must_be_a_number(self):
+        response = self.after_seq("x")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "Invalid after_seq"})
+
+
+# ---------------------------------------------------------------------
+# RECENT HISTORY AND ETAGS
+# ---------------------------------------------------------------------
+
+class RecentHistoryTests(TestCase):
+
+    def setUp(self):
+        self.owner = make_user("owner@example.com", "Owner")
+        self.room = Room.objects.create(name="r", owner=self.owner)
+        RoomMember.objects.create(room=self.room, user=self.owner, is_admin=True)
+        recent_history.clear()
+        history_page(self.room.id)  # warm
+
+    def buffered(self):
+        return [row["content"] for row in recent_history.page(self.room.id).messages]
+
+    def test_saved_message_shows_up_after_commit(self):
+        version = room_versions.get(self.room.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(room=self.room, user=self.owner, content="hi")
+            self.assertEqual(room_versions.get(self.room.id), version)
+            self.assertEqual(self.buffered(), [])
+        self.assertGreater(room_versions.get(self.room.id), version)
+        self.assertEqual(self.buffered(), ["hi"])
+
+    def test_rollback_leaves_no_phantom_row(self):
+        version = room_versions.get(self.room.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                Message.objects.create(room=self.room, user=self.owner, content="gone")
+                raise RuntimeError
+        self.assertEqual(room_versions.get(self.room.id), version)
+        self.assertEqual(self.buffered(), [])
+
+
+# ---------------------------------------------------------------------
+# WRITE-BEHIND QUEUE
+# ---------------------------------------------------------------------
+
+class WriteBehindTests(TestCase):
+
+    def setUp(self):
+        self.owner = make_user("owner@example.com", "Owner")
+        self.room = Room.objects.create(name="r", owner=self.owner)
+        RoomMember.objects.create(room=self.room, user=self.owner, is_admin=True)
+
+    def queued(self, *contents):
+        return [
+            Message(id=uuid.uuid4(), room=self.room, user=self.owner, content=content,
+                    created=timezone.now(), seq=self.room.last_seq + n)
+            for n, content in enumerate(contents, 1)
+        ]
+
+    def test_written_batch_bumps_the_room_version(self):
+        batch = self.queued("a", "b")
+        before = room_versions.get(self.room.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            MessageWriteQueue._write(batch)
+        self.assertGreater(room_versions.get(self.room.id), before)
+        self.assertEqual(Message.objects.filter(room=self.room).count(), 2)
+
+    def test_bad_rows_are_dropped_alone(self):
+        existing = Message.objects.create(room=self.room, user=self.owner, content="x")
+        self.room.refresh_from_db()
+        clash, ok = self.queued("clash", "ok")
+        clash.seq = existing.seq
+        dropped = metrics.snapshot().get("write_behind.dropped", 0)
+
+        self.assertEqual(MessageWriteQueue._write([clash, ok]), [])
+        self.assertQuerySetEqual(
+            Message.objects.filter(room=self.room).order_by("seq").values_list("content", flat=True),
+            ["x", "ok"],
+        )
+        self.assertEqual(metrics.snapshot()["write_behind.dropped"], dropped + 1)
+
+    async def test_full_queue_refuses_new_messages(self):
+        queue = MessageWriteQueue(flush_interval=3600, max_pending=2)
+        queue._pending = self.queued("a", "b")
+        with mock.patch.object(queue, "flush", mock.AsyncMock()):
+            with self.assertRaises(QueueFull):
+                await queue.put(self.room.id, self.owner, "c")
+        queue._task.cancel()
+        self.assertEqual(len(queue), 2)
+
+    async def test_retried_batch_never_grows_past_the_cap(self):
+        queue = MessageWriteQueue(flush_interval=3600, max_pending=3)
+        batch = self.queued("a", "b", "c", "d")
+        queue._ensure_flusher()
+        queue._task.cancel()
+        queue._pending = batch[:2]
+
+        def write(failed):
+            queue._pending.extend(batch[2:])  # sent while the write ran
+            return failed
+
+        with mock.patch.object(MessageWriteQueue, "_write", side_effect=write):
+            await queue.flush()
+        self.assertEqual(queue._pending, batch[1:])
+
+
+# ---------------------------------------------------------------------
+# RETENTION
+# ---------------------------------------------------------------------
+
+class RetentionTests(TestCase):
+
+    def setUp(self):
+        self.owner = make_user("owner@example.com", "Owner")
+        self.guest = make_user("guest@example.com", "Guest")
+        self.room = Room.objects.create(name="r", owner=self.owner, message_retention_days=30)
+        joined = timezone.now() - timedelta(days=60)
+        for user in (self.owner, self.guest):
+            RoomMember.objects.create(room=self.room, user=user, last_read_at=joined)
+        self.old = self.send("old", days_ago=40)
+        self.new = self.send("new", days_ago=1)
+        self.url = f"/api/rooms/{self.room.id}/messages/"
+        self.client.force_login(self.guest)
+        recent_history.clear()
+
+    def send(self, content, days_ago, room=None):
+        created = timezone.now() - timedelta(days=days_ago)
+        return Message.objects.create(room=room or self.room, user=self.owner, content=content, created=created)
+
+    def purge(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return RetentionEngine(pause=0, **kwargs).run(("messages",))
+
+    def contents(self, response):
+        return [m["content"] for m in response.json()["messages"]]
+
+    def test_purge_drops_cached_history(self):
+        first = self.client.get(self.url)
+        self.assertEqual(self.contents(first), ["old", "new"])
+
+        self.assertEqual(self.purge(), {"messages": 1})
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(self.contents(second), ["new"])
+
+    def test_purge_in_another_process_is_seen(self):
+        first = self.client.get(self.url)
+        # What purge_data leaves behind: rows gone, column bumped, and no
+        # on_commit callbacks in this process
+        Message.objects.filter(id=self.old.id)._raw_delete(Message.objects.db)
+        Room.objects.filter(id=self.room.id).update(data_version=F("data_version") + 1)
+
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(self.contents(second), ["new"])
+
+    def test_dry_run_only_counts(self):
+        archive_room(self.room.id, timezone.now() - timedelta(days=35))
+        self.send("older", days_ago=50)
+        self.assertEqual(self.purge(dry_run=True), {"messages": 2})
+        self.assertEqual(Message.objects.filter(room=self.room).count(), 2)
+        self.assertEqual(MessageArchiveBlock.objects.count(), 1)
+
+        self.assertEqual(self.purge(), {"messages": 2})
+        self.assertEqual(MessageArchiveBlock.objects.count(), 0)
+
+    def test_room_setting_overrides_the_default(self):
+        other = Room.objects.create(name="other", owner=self.owner)
+        self.send("40 days", days_ago=40, room=other)
+        self.send("100 days", days_ago=100, room=other)
+
+        with self.settings(PINGME_RETENTION_MESSAGE_DAYS=90):
+            self.assertEqual(self.purge(batch_size=1), {"messages": 2})
+        self.assertEqual(list(other.messages.values_list("content", flat=True)), ["40 days"])
+        self.assertFalse(Message.objects.filter(id=self.old.id).exists())
+
+    def test_resumes_after_the_checkpointed_room(self):
+        other = Room.objects.create(name="other", owner=self.owner, message_retention_days=30)
+        self.send("old", days_ago=40, room=other)
+        done, todo = sorted([self.room, other], key=lambda room: room.id)
+
+        checkpoint = Checkpoint()
+        checkpoint.set("messages", str(done.id))
+        self.purge(checkpoint=checkpoint)
+        self.assertEqual(Message.objects.filter(room=done, content="old").count(), 1)
+        self.assertEqual(Message.objects.filter(room=todo, content="old").count(), 0)
+        self.assertIsNone(checkpoint.get("messages"))
+
+    def test_purge_recounts_activity_and_unread(self):
+        emptied = Room.objects.create(name="emptied", owner=self.owner, message_retention_days=30)
+        RoomMember.objects.create(room=emptied, user=self.guest, last_read_at=timezone.now() - timedelta(days=60))
+        self.send("only", days_ago=40, room=emptied)
+        self.assertEqual(RoomMember.objects.get(room=self.room, user=self.guest).unread_count, 2)
+
+        self.purge()
+        self.assertEqual(RoomMember.objects.get(room=self.room, user=self.guest).unread_count, 1)
+        self.assertEqual(RoomMember.objects.get(room=emptied, user=self.guest).unread_count, 0)
+        emptied.refresh_from_db()
+        self.assertIsNone(emptied.last_message_at)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.last_message_preview, "new")
+
+
+# ---------------------------------------------------------------------
+# MESSAGE ARCHIVE
+# ---------------------------------------------------------------------
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        self.owner = make_user("owner@example.com", "Owner")
+        self.room = Room.objects.create(name="r", owner=self.owner)
+        RoomMember.objects.create(room=self.room, user=self.owner, is_admin=True)
+        self.client.force_login(self.owner)
+        recent_history.clear()
+        # Noon UTC, so a few hours either way stay on the same day
+        self.base = (timezone.now() - timedelta(days=10)).replace(hour=12, minute=0, second=0, microsecond=0)
+
+    def send(self, content, days=0, hours=0):
+        created = self.base + timedelta(days=days, hours=hours)
+        return Message.objects.create(room=self.room, user=self.owner, content=content, created=created)
+
+    def archive(self, days=0, hours=0, **kwargs):
+        return archive_room(self.room.id, self.base + timedelta(days=days, hours=hours), **kwargs)
+
+    def page(self, **params):
+        data = self.client.get(f"/api/rooms/{self.room.id}/messages/", params).json()
+        return [m["content"] for m in data["messages"]], data
+
+    def fill(self):
+        """m0..m5 over five days; m0-m3 archived, m4 and m5 hot."""
+        sent = [
+            self.send(f"m{n}", days, hours)
+            for n, (days, hours) in enumerate([(0, 0), (0, 1), (1, 0), (2, 0), (8, 0), (9, 0)])
+        ]
+        self.assertEqual(self.archive(days=5), 4)
+        return sent
+
+    def test_paging_back_crosses_into_the_archive(self):
+        self.fill()
+        seen, params = [], {"limit": 3}
+        while True:
+            contents, data = self.page(**params)
+            seen[:0] = contents
+            if not data["has_more"]:
+                break
+            params = {"limit": 3, "before": data["before"]}
+        self.assertEqual(seen, [f"m{n}" for n in range(6)])
+
+    def test_paging_forward_crosses_out_of_the_archive(self):
+        first = self.fill()[0]
+        contents, data = self.page(limit=4, after=encode_cursor(first.created, first.id))
+        self.assertEqual(contents, ["m1", "m2", "m3", "m4"])
+        self.assertTrue(data["has_more"])
+        contents, data = self.page(limit=4, after=data["after"])
+        self.assertEqual((contents, data["has_more"]), (["m5"], False))
+
+    def test_days_merge_into_one_block(self):
+        self.send("a", hours=-1)
+        self.send("b", hours=1)
+        self.send("c", hours=2)
+        self.assertEqual(self.archive(), 1)
+        with mock.patch("core.archive.encode_block", wraps=encode_block) as encode:
+            self.assertEqual(self.archive(days=1, batch_size=1), 2)
+        self.assertEqual(encode.call_count, 1)
+
+        block = MessageArchiveBlock.objects.get(room=self.room)
+        self.assertEqual(block.message_count, 3)
+        self.assertEqual([row[3] for row in decode_block(block.payload)], ["a", "b", "c"])
+        self.assertFalse(Message.objects.filter(room=self.room).exists())
+
+    def test_export_runs_oldest_first_across_the_archive(self):
+        self.fill()
+        response = self.client.get(f"/api/rooms/{self.room.id}/export/")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)["content"] for line in lines], [f"m{n}" for n in range(6)])
+
+
+# ---------------------------------------------------------------------
+# NDJSON EXPORT
+# ---------------------------------------------------------------------
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.owner = make_user("owner@example.com", "Owner")
+        self.room = Room.objects.create(name="r", owner=self.owner)
+        RoomMember.objects.create(room=self.room, user=self.owner, is_admin=True)
+        start = timezone.now() - timedelta(hours=1)
+        for n in range(5):
+            Message.objects.create(room=self.room, user=self.owner, content=f"m{n}",
+                                   created=start + timedelta(minutes=n))
+        self.client.force_login(self.owner)
+
+    def export(self, **params):
+        response = self.client.get(f"/api/rooms/{self.room.id}/export/", params)
+        self.assertEqual(response.status_code, 200)
+        return response, b"".join(response.streaming_content)
+
+    def contents(self, ndjson):
+        return [json.loads(line)["content"] for line in ndjson.decode().splitlines()]
+
+    def test_streams_ndjson_oldest_first(self):
+        response, body = self.export()
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(self.contents(body), [f"m{n}" for n in range(5)])
+
+    def test_gzip_decompresses_to_the_same_ndjson(self):
+        _, plain = self.export()
+        response, packed = self.export(gzip="1")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertIn('filename="room-%s.ndjson.gz"' % self.room.id, response["Content-Disposition"])
+        self.assertEqual(gzip.decompress(packed), plain)
+
+    def test_non_members_cannot_export(self):
+        self.client.force_login(make_user("guest@example.com", "Guest"))
+        response = self.client.get(f"/api/rooms/{self.room.id}/export/")
+        self.assertEqual(response.status_code, 403)
+
+    def test_command_matches_the_endpoint(self):
+        _, plain = self.export()
+        with mock.patch("sys.stdout", new=io.TextIOWrapper(io.BytesIO())) as stdout:
+            call_command("export_room", str(self.room.id), chunk_size=2)
+            stdout.flush()
+            self.assertEqual(stdout.buffer.getvalue(), plain)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "room.ndjson.gz"
+            call_command("export_room", str(self.room.id), output=str(path), gzip=True)
+            self.assertEqual(gzip.decompress(path.read_bytes()), plain)
+
+    def test_command_rejects_unknown_rooms(self):
+        for room_id in (str(uuid.uuid4()), "nope"):
+            with self.assertRaises(CommandError):
+                call_command("export_room", room_id)
+
+
+# ---------------------------------------------------------------------
+# RATE LIMITS
+# ---------------------------------------------------------------------
+
+class RateLimiterTests(TestCase):
+
+    def test_user_scope(self):
+        limiter = MessageRateLimiter(user_burst=2, user_rate=1, room_burst=100, room_rate=100)
+        with mock.patch("core.ratelimit.time.monotonic", return_value=100.0):
+            self.assertEqual(limiter.check("u1", "r"), (None, 0))
+            self.assertEqual(limiter.check("u1", "r"), (None, 0))
+            self.assertEqual(limiter.check("u1", "r"), ("user", 1.0))
+            self.assertEqual(limiter.check("u2", "r"), (None, 0))
+        with mock.patch("core.ratelimit.time.monotonic", return_value=101.0):
+            self.assertEqual(limiter.check("u1", "r"), (None, 0))
+
+    def test_room_scope(self):
+        limiter = MessageRateLimiter(user_burst=100, user_rate=100, room_burst=3, room_rate=0.5)
+        with mock.patch("core.ratelimit.time.monotonic", return_value=100.0):
+            for n in range(3):
+                self.assertEqual(limiter.check(f"u{n}", "r"), (None, 0))
+            self.assertEqual(limiter.check("u9", "r"), ("room", 2.0))
+            self.assertEqual(limiter.check("u9", "other"), (None, 0))
+
+    def test_refused_checks_take_no_tokens(self):
+        limiter = MessageRateLimiter(user_burst=1, user_rate=1, room_burst=1, room_rate=1)
+        with mock.patch("core.ratelimit.time.monotonic", return_value=100.0):
+            limiter.check("u1", "r")
+            self.assertEqual(limiter.check("u2", "r")[0], "room")
+            # u2's bucket was not charged for the refused send
+            self.assertEqual(limiter.check("u2", "other"), (None, 0))
+
+
+class ConsumerRateLimitTests(TransactionTestCase):
+
+    def setUp(self):
+        membership_index.clear()
+        self.owner = make_user("owner@example.com", "Owner")
+        self.room = Room.objects.create(name="r", owner=self.owner)
+        RoomMember.objects.create(room=self.room, user=self.owner, is_admin=True)
+
+    async def connect(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/chat/{self.room.id}/")
+        communicator.scope["user"] = self.owner
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def next_error(self, communicator):
+        while True:
+            frame = await communicator.receive_json_from(timeout=2)
+            if frame.get("type") == "error":
+                return frame
+
+    async def test_sends_over_the_limit_get_an_error_frame(self):
+        limiter = MessageRateLimiter(user_burst=1, user_rate=0.5)
+        with mock.patch("core.consumers.message_limiter", limiter):
+            communicator = await self.connect()
+            for client_id in ("a", "b"):
+                await communicator.send_json_to({"type": "send", "message": "hi", "client_id": client_id})
+            error = await self.next_error(communicator)
+            await communicator.disconnect()
+
+        self.assertEqual(error["code"], "rate_limited")
+        self.assertEqual((error["scope"], error["client_id"]), ("user", "b"))
+        self.assertGreater(error["retry_after"], 0)
+        self.assertEqual(await database_sync_to_async(Message.objects.count)(), 1)
+
+    async def test_history_frames_are_throttled(self):
+        with mock.patch("core.consumers.history_limiter", TokenBucketLimiter(1, 0.1)):
+            communicator = await self.connect()
+            await communicator.send_json_to({"type": "history"})
+            await communicator.send_json_to({"type": "history"})
+            error = await self.next_error(communicator)
+            await communicator.disconnect()
+        self.assertEqual((error["code"], error["scope"]), ("rate_limited", "history"))
+
+
+# ---------------------------------------------------------------------
+# WEBSOCKET SESSION CACHE
+# ---------------------------------------------------------------------
+
+# Real password hashing would make up most of these tests' runtime
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class SessionUserCacheTests(TransactionTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("owner@example.com", "Owner", "secret")
+        self.client.force_login(self.user)
+        self.session_key = self.client.session.session_key
+
+    def test_entries_expire(self):
+        cache = SessionUserCache(ttl=60)
+        with mock.patch("core.middleware.time.monotonic", return_value=100.0):
+            cache.set("k", self.user)
+        with mock.patch("core.middleware.time.monotonic", return_value=159.0):
+            self.assertEqual(cache.get("k"), self.user)
+        with mock.patch("core.middleware.time.monotonic", return_value=161.0):
+            self.assertIsNone(cache.get("k"))
+
+    def test_size_is_bounded(self):
+        cache = SessionUserCache(max_size=2)
+        for key in ("a", "b"):
+            cache.set(key, self.user)
+        cache.get("a")
+        cache.set("c", self.user)
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+
+    def test_logout_evicts_the_session(self):
+        session_cache.set(self.session_key, self.user)
+        self.client.post("/api/auth/logout/")
+        self.assertIsNone(session_cache.get(self.session_key))
+
+    async def test_password_change_ends_the_session(self):
+        self.assertEqual(await load_session_user(self.session_key), self.user)
+        self.user.set_password("changed")
+        await self.user.asave()
+        self.assertIsInstance(await load_session_user(self.session_key), AnonymousUser)
+
+    async def test_concurrent_misses_share_one_lookup(self):
+        cache = SessionUserCache()
+        release = asyncio.Event()
+        calls = []
+
+        async def loader(session_key):
+            calls.append(session_key)
+            await release.wait()
+            return self.user
+
+        waiting = [asyncio.ensure_future(cache.resolve("k", loader)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        self.assertEqual(await asyncio.gather(*waiting), [self.user] * 3)
+        self.assertEqual(calls, ["k"])
+        self.assertEqual(await cache.resolve("k", loader), self.user)
+        self.assertEqual((cache.hits, cache.misses, len(calls)), (1, 3, 1))
+
+
+# ---------------------------------------------------------------------
+# WIRE FORMAT
+# ---------------------------------------------------------------------
+
+class WireFormatTests(SimpleTestCase):
+
+    def test_decode_frame_reads_json_and_msgpack(self):
+        self.assertEqual(decode_frame(text_data='{"type":"send"}'), {"type": "send"})
+        self.assertEqual(decode_frame(bytes_data=msgpack.packb({"type": "send"})), {"type": "send"})
+
+    def test_decode_frame_rejects_non_objects(self):
+        for kwargs in ({"text_data": "[1]"}, {"text_data": "nope"},
+                       {"bytes_data": msgpack.packb([1])}, {"bytes_data": b"\xc1"}):
+            with self.assertRaises(ValueError):
+                decode_frame(**kwargs)
+
+    def test_joined_msgpack_frames_decode_as_one_array(self):
+        for n in (1, 15, 16, 20):
+            blobs = [encode_msgpack({"n": i}) for i in range(n)]
+            joined = join_msgpack_frames(blobs)
+            self.assertEqual(msgpack.unpackb(joined), [{"n": i} for i in range(n)])
+        self.assertEqual(join_msgpack_frames([b"\xc0"] * 20)[:3], b"\xdc\x00\x14")
+
+
+class SubprotocolTests(TransactionTestCase):
+
+    def setUp(self):
+        membership_index.clear()
+        self.owner = make_user("owner@example.com", "Owner")
+        self.room = Room.objects.create(name="r", owner=self.owner)
+        RoomMember.objects.create(room=self.room, user=self.owner, is_admin=True)
+
+    async def connect(self, subprotocols=None):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/chat/{self.room.id}/", subprotocols=subprotocols,
+        )
+        communicator.scope["user"] = self.owner
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator, subprotocol
+
+    async def test_msgpack_clients_talk_binary(self):
+        communicator, subprotocol = await self.connect([SUBPROTOCOL_MSGPACK])
+        self.assertEqual(subprotocol, SUBPROTOCOL_MSGPACK)
+        await communicator.send_to(bytes_data=encode_msgpack({"type": "send", "message": "hi", "client_id": "a"}))
+        frames = [msgpack.unpackb(await communicator.receive_from(timeout=2)) for _ in range(2)]
+        await communicator.disconnect()
+
+        self.assertEqual({frame["type"] for frame in frames}, {"message", "ack"})
+        message = next(frame for frame in frames if frame["type"] == "message")
+        self.assertEqual(message["content"], "hi")
+
+    async def test_other_clients_stay_on_json(self):
+        communicator, subprotocol = await self.connect()
+        self.assertIsNone(subprotocol)
+        await communicator.send_json_to({"type": "history"})
+        frame = await communicator.receive_json_from(timeout=2)
+        await communicator.disconnect()
+        self.assertEqual(frame["type"], "history")
+
+
+# ---------------------------------------------------------------------
+# CONNECTION OUTBOX
+# ---------------------------------------------------------------------
+
+class SlowClient:
+    """Stand-in for ``consumer.send`` that blocks until released."""
+
+    def __init__(self):
+        self.sent = []
+        self.release = asyncio.Event()
+
+    async def __call__(self, text_data=None, bytes_data=None):
+        await self.release.wait()
+        self.sent.append(text_data if bytes_data is None else bytes_data)
+
+
+class ConnectionOutboxTests(SimpleTestCase):
+
+    async def settle(self, outbox):
+        while len(outbox):
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+
+    async def test_full_queue_drops_the_oldest_frame(self):
+        client = SlowClient()
+        outbox = ConnectionOutbox(client, max_frames=2)
+        outbox.put("1")
+        await asyncio.sleep(0)  # "1" is now stuck in the writer
+        for frame in ("2", "3", "4"):
+            outbox.put(frame)
+        self.assertEqual((len(outbox), outbox.dropped), (2, 1))
+
+        client.release.set()
+        await self.settle(outbox)
+        outbox.close()
+        self.assertEqual(client.sent, ["1", "3", "4"])
+
+    async def test_overflow_calls_back_once_and_stops_queueing(self):
+        client = SlowClient()
+        on_overflow = mock.AsyncMock()
+        outbox = ConnectionOutbox(client, max_frames=1, drop_limit=1, on_overflow=on_overflow)
+        outbox.put("1")
+        await asyncio.sleep(0)
+        for frame in ("2", "3", "4", "5"):
+            outbox.put(frame)
+        await asyncio.sleep(0)
+        outbox.close()
+
+        self.assertTrue(outbox.overflowed)
+        self.assertEqual((len(outbox), outbox.dropped), (0, 2))
+        on_overflow.assert_awaited_once()
+
+    async def test_counts_frames_that_waited_too_long(self):
+        client = SlowClient()
+        outbox = ConnectionOutbox(client, delay_warn=0.05)
+        outbox.put("1")
+        await asyncio.sleep(0)
+        outbox.put("2")
+        await asyncio.sleep(0.1)
+        client.release.set()
+        await self.settle(outbox)
+        outbox.close()
+        # Only "2" sat in the queue; "1" went straight to the writer
+        self.assertEqual(outbox.delayed, 1)
+
+
+class CoalescingTests(SimpleTestCase):
+
+    async def test_frames_in_the_window_go_out_as_one_array(self):
+        client = SlowClient()
+        client.release.set()
+        outbox = ConnectionOutbox(client, coalesce_window=0.05)
+        for n in range(3):
+            outbox.put(encode_json({"n": n}))
+        await asyncio.sleep(0.1)
+        outbox.close()
+        self.assertEqual(client.sent, ['[{"n":0},{"n":1},{"n":2}]'])
+
+    async def test_batches_are_capped_at_max_batch(self):
+        client = SlowClient()
+        client.release.set()
+        outbox = ConnectionOutbox(client, coalesce_window=0.05, max_batch=2)
+        for n in range(5):
+            outbox.put(encode_json(n))
+        await asyncio.sleep(0.2)
+        outbox.close()
+        self.assertEqual(client.sent, ["[0,1]", "[2,3]", "4"])
+
+    async def test_binary_batches_are_msgpack_arrays(self):
+        client = SlowClient()
+        client.release.set()
+        outbox = ConnectionOutbox(client, binary=True, coalesce_window=0.05)
+        for n in range(2):
+            outbox.put(encode_msgpack({"n": n}))
+        await asyncio.sleep(0.1)
+        outbox.close()
+        self.assertEqual([msgpack.unpackb(blob) for blob in client.sent], [[{"n": 0}, {"n": 1}]])
+
+
+class ConsumerResyncTests(TransactionTestCase):
+
+    def setUp(self):
+        membership_index.clear()
+        self.owner = make_user("owner@example.com", "Owner")
+        self.room = Room.objects.create(name="r", owner=self.owner)
+        RoomMember.objects.create(room=self.room, user=self.owner, is_admin=True)
+
+    # A long coalescing window holds frames in the outbox like a slow client
+    @override_settings(PINGME_OUTBOX_MAX_FRAMES=1, PINGME_OUTBOX_DROP_LIMIT=0,
+                       PINGME_COALESCE_WINDOW_MS=5000)
+    async def test_overflow_sends_resync_and_closes(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/chat/{self.room.id}/")
+        communicator.scope["user"] = self.owner
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        for text in ("1", "2"):
+            await get_channel_layer().group_send(
+                room_group_name(self.room.id),
+                {"type": "chat_message", "text": text, "bytes": b""},
+            )
+
+        self.assertEqual(await communicator.receive_json_from(timeout=2), {"type": "resync", "dropped": 1})
+        closed = await communicator.receive_output(timeout=2)
+        self.assertEqual(closed, {"type": "websocket.close", "code": CLOSE_RESYNC})
+        await communicator.wait()
+
+
+# ---------------------------------------------------------------------
+# RECONNECT RESUME
+# ---------------------------------------------------------------------
+
+class ResumeTests(TransactionTestCase):
+
+    def setUp(self):
+        membership_index.clear()
+        recent_history.clear()
+        self.owner = make_user("owner@example.com", "Owner")
+        self.room = Room.objects.create(name="r", owner=self.owner)
+        RoomMember.objects.create(room=self.room, user=self.owner, is_admin=True)
+        self.messages = [
+            Message.objects.create(room=self.room, user=self.owner, content=str(n))
+            for n in range(3)
+        ]
+        # Distinct timestamps keep the cursor order deterministic
+        start = timezone.now() - timedelta(minutes=5)
+        for n, msg in enumerate(self.messages):
+            Message.objects.filter(pk=msg.pk).update(created=start + timedelta(seconds=n))
+        recent_history.clear()
+
+    async def resume(self, last_seen):
+        """First frame after reconnecting with ``last_seen``, or None."""
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/chat/{self.room.id}/?last_seen={last_seen}",
+        )
+        communicator.scope["user"] = self.owner
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        if await communicator.receive_nothing(timeout=0.2):
+            frame = None
+        else:
+            frame = await communicator.receive_json_from()
+        await communicator.disconnect()
+        return frame
+
+    async def test_replays_missed_messages(self):
+        frame = await self.resume(self.messages[0].id)
+        self.assertEqual(frame["type"], "replay")
+        self.assertEqual([row["content"] for row in frame["messages"]], ["1", "2"])
+
+    async def test_up_to_date_client_gets_no_replay(self):
+        self.assertIsNone(await self.resume(self.messages[-1].id))
+
+    async def test_unknown_last_seen_resyncs(self):
+        for last_seen in (uuid.uuid4(), "garbage"):
+            self.assertEqual(await self.resume(last_seen), {"type": "resync", "reason": "gap"})
+
+    @override_settings(PINGME_RESUME_MAX_MESSAGES=1)
+    async def test_gap_over_the_limit_resyncs(self):
+        self.assertEqual(await self.resume(self.messages[0].id), {"type": "resync", "reason": "gap"})
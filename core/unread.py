@@ -0,0 +1,89 @@
+from collections import Counter
+
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import Message, RoomMember
+from core.versions import user_versions
+
+
+# ---------------------------------------------------------------------
+# UNREAD COUNTERS (RoomMember.unread_count / last_read_at)
+# ---------------------------------------------------------------------
+
+def unread_since(since):
+    """
+    Per-member subquery: messages from others newer than ``since``.
+    Only used for recounts; inserts adjust the counter in place.
+    """
+    counts = (
+        Message.objects
+        .filter(room_id=OuterRef("room_id"), created__gt=since)
+        .exclude(user_id=OuterRef("user_id"))
+        .order_by()
+        .values("room_id")
+        .annotate(n=Count("id"))
+        .values("n")
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+def _bump_members(room_id):
+    # Unread counts are part of every member's room list
+    for user_id in RoomMember.objects.filter(room_id=room_id).values_list("user_id", flat=True):
+        user_versions.bump(user_id)
+
+
+def record_new_messages(room_id, messages):
+    """
+    Adds freshly inserted ``messages`` (one room) to its members' unread
+    counts. One UPDATE covers everyone whose marker is older than the
+    batch; the rare member who already read into it gets a recount.
+    """
+    if not messages:
+        return
+
+    per_sender = Counter(m.user_id for m in messages if m.user_id is not None)
+    own = Case(
+        *[When(user_id=uid, then=Value(n)) for uid, n in per_sender.items()],
+        default=Value(0),
+    ) if per_sender else Value(0)
+    oldest = min(m.created for m in messages)
+
+    members = RoomMember.objects.filter(room_id=room_id)
+    members.filter(last_read_at__lt=oldest).update(
+        unread_count=F("unread_count") + len(messages) - own
+    )
+    members.filter(last_read_at__gte=oldest).update(
+        unread_count=unread_since(OuterRef("last_read_at"))
+    )
+    _bump_members(room_id)
+
+
+def recount_room(room_id, since=None):
+    """Recomputes counts after deletes; ``since`` limits it to older markers."""
+    members = RoomMember.objects.filter(room_id=room_id)
+    if since is not None:
+        members = members.filter(last_read_at__lt=since)
+    members.update(unread_count=unread_since(OuterRef("last_read_at")))
+    _bump_members(room_id)
+
+
+def mark_read(room_id, user_id, created, message_id):
+    """
+    Moves a member's read marker forward to ``(created, message_id)``;
+    markers never move back. Returns True if the marker changed.
+    """
+    created = min(created, timezone.now())
+    updated = RoomMember.objects.filter(
+        room_id=room_id, user_id=user_id, last_read_at__lt=created,
+    ).update(
+        last_read_at=created,
+        last_read_id=message_id,
+        # The SET list sees the old marker, so count from the new one
+        unread_count=unread_since(created),
+    )
+    if updated:
+        user_versions.bump(user_id)
+    return bool(updated)
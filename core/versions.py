@@ -0,0 +1,80 @@
+import itertools
+import threading
+import uuid
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+from core.models import Room, RoomMember
+from core.recent import recent_history
+
+# New value per process start, so ETags never survive a restart.
+# Assumes a single process per deployment (as InMemoryChannelLayer does).
+EPOCH = uuid.uuid4().hex[:8]
+
+
+# ---------------------------------------------------------------------
+# VERSION COUNTERS (per process)
+# ---------------------------------------------------------------------
+
+class VersionCounters:
+    """Key -> version, bumped from one shared monotonic sequence."""
+
+    def __init__(self):
+        self._versions = {}
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._versions.get(str(key), 0)
+
+    def bump(self, key):
+        with self._lock:
+            self._versions[str(key)] = next(self._seq)
+
+
+room_versions = VersionCounters()  # bumped on message insert/delete
+user_versions = VersionCounters()  # bumped on membership changes
+
+
+# ---------------------------------------------------------------------
+# STORED DATA VERSION (Room.data_version, shared by every process)
+# ---------------------------------------------------------------------
+
+def data_version(room_id):
+    """The room's stored data version (0 if there is no such room)."""
+    return Room.objects.filter(id=room_id).values_list("data_version", flat=True).first() or 0
+
+
+def data_rewritten(room_ids):
+    """
+    Records a bulk change to rooms' stored messages or snapshots that
+    bypassed the model signals. Call it inside the changing transaction:
+    the column bump commits with the change and reaches servers in other
+    processes; this process also drops its buffers once it commits.
+    """
+    room_ids = list(room_ids)
+    Room.objects.filter(id__in=room_ids).update(data_version=F("data_version") + 1)
+
+    def forget():
+        for room_id in room_ids:
+            recent_history.invalidate(room_id)
+            room_versions.bump(room_id)
+
+    transaction.on_commit(forget)
+
+
+# ---------------------------------------------------------------------
+# ETAG FUNCTIONS (for django.views.decorators.http.condition)
+# ---------------------------------------------------------------------
+
+def room_messages_etag(request, room_id):
+    return f"{EPOCH}-r{room_versions.get(room_id)}-d{data_version(room_id)}"
+
+
+def user_rooms_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    # Bulk rewrites of any of the user's rooms (snapshots, unread counts)
+    stored = RoomMember.objects.filter(user=request.user).aggregate(d=Sum("room__data_version"))["d"] or 0
+    return f"{EPOCH}-u{request.user.id}-{user_versions.get(request.user.id)}-d{stored}"
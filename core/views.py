@@ -5,7 +5,10 @@ from django.views.decorators.csrf import csrf_protect
 from django.views.decorators.http import require_POST, require_GET
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from core.models import Room, RoomMember, Message, RoomMembersLog
+from core.models import Room, RoomMember
+from core.audit import audit_log
+from core.history import history_page, serialize_message
+from core.pagination import InvalidCursor, page_size
 import json
 
 User = get_user_model()
@@ -66,20 +69,16 @@ def chat_page(request, room_id):
         # Detect invite
         is_invite = request.GET.get("invite") == "1"
 
-        RoomMembersLog.objects.create(
-            room=room,
-            user=user,
-            actor=user,
-            event_type="invite" if is_invite else "join"
-        )
+        audit_log.record(room.id, user.id, "invite" if is_invite else "join", actor_id=user.id)
 
     # Load last messages
-    messages = Message.objects.filter(room=room).order_by("-created")[:50]
+    # Newest page, usually straight from the recent-history buffer
+    messages = history_page(room.id, limit=50).messages
 
     return render(
         request,
         "chat.html",
-        {"room": room, "messages": reversed(messages), "user": user}
+        {"room": room, "messages": messages, "user": user}
     )
 
 
@@ -111,18 +110,17 @@ def room_messages(request, room_id):
     except Room.DoesNotExist:
         return JsonResponse({"error": "Room not found"}, status=404)
 
-    limit = int(request.GET.get("limit", 50))
-    messages = Message.objects.filter(room=room).order_by("-created")[:limit]
-
-    data = [{
-        "id": str(msg.id),
-        "content": msg.content,
-        "user": msg.user.name,
-        "user_id": str(msg.user.id),
-        "created": msg.created.isoformat(),
-    } for msg in reversed(messages)]
+    try:
+        page = history_page(
+            room.id,
+            before=request.GET.get("before"),
+            after=request.GET.get("after"),
+            limit=page_size(request.GET.get("limit")),
+        )
+    except InvalidCursor:
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
 
-    return JsonResponse(data, safe=False)
+    return JsonResponse(page.as_dict(serialize_message))
 
 
 # -------------------------------------------------------------------
@@ -150,7 +148,9 @@ def add_user(request, room_id):
     except User.DoesNotExist:
         return JsonResponse({"error": "User does not exist"}, status=404)
 
-    RoomMember.objects.get_or_create(room=room, user=target)
+    _, created = RoomMember.objects.get_or_create(room=room, user=target)
+    if created:
+        audit_log.record(room.id, target.id, "invite", actor_id=request.user.id)
     return JsonResponse({"detail": f"{target.name} added"})
 
 
@@ -171,6 +171,7 @@ def leave_room(request, room_id):
         return JsonResponse({"error": "Owner cannot leave their own room"}, status=400)
 
     membership.delete()
+    audit_log.record(room_id, request.user.id, "leave", actor_id=request.user.id)
     return JsonResponse({"detail": "Left room"})
 
 
@@ -215,9 +216,7 @@ def create_room(request):
     room = Room.objects.create(name=name, owner=user)
     RoomMember.objects.create(room=room, user=user, is_admin=True)
 
-    RoomMembersLog.objects.create(
-        room=room, user=user, actor=user, event_type="join"
-    )
+    audit_log.record(room.id, user.id, "join", actor_id=user.id)
 
     return JsonResponse({
         "id": str(room.id),
@@ -0,0 +1,65 @@
+import json
+
+import msgpack
+
+# Binary subprotocol clients can ask for in the WebSocket handshake
+SUBPROTOCOL_MSGPACK = "pingme.msgpack"
+
+
+# ---------------------------------------------------------------------
+# WEBSOCKET WIRE FORMAT
+# ---------------------------------------------------------------------
+
+def chat_frame(msg_obj):
+    """Wire payload for one chat message."""
+    return {
+        "type": "message",
+        "id": msg_obj["id"],
+        "seq": msg_obj["seq"],
+        "user": msg_obj["user"],
+        "user_id": msg_obj["user_id"],
+        "content": msg_obj["content"],
+        "created": msg_obj["created"],
+    }
+
+
+def encode_json(payload):
+    """Compact JSON text frame."""
+    return json.dumps(payload, separators=(",", ":"))
+
+
+def encode_msgpack(payload):
+    """Binary frame for ``pingme.msgpack`` clients."""
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def join_json_frames(texts):
+    """JSON array frame built from already-encoded JSON texts."""
+    return "[" + ",".join(texts) + "]"
+
+
+def join_msgpack_frames(blobs):
+    """msgpack array frame built from already-packed items."""
+    n = len(blobs)
+    if n < 16:
+        header = bytes([0x90 | n])
+    elif n < 0x10000:
+        header = b"\xdc" + n.to_bytes(2, "big")
+    else:
+        header = b"\xdd" + n.to_bytes(4, "big")
+    return header + b"".join(blobs)
+
+
+def decode_frame(text_data=None, bytes_data=None):
+    """
+    Decodes an incoming frame: text is JSON, binary is msgpack.
+    Raises ValueError for anything that is not an object.
+    """
+    if bytes_data is not None:
+        data = msgpack.unpackb(bytes_data, raw=False)
+    else:
+        data = json.loads(text_data)
+
+    if not isinstance(data, dict):
+        raise ValueError("Frame must be an object")
+    return data